@@ -1,9 +1,12 @@
 # ================================
 # IMPORTAÇÕES
 # ================================
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
@@ -11,14 +14,34 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_limiter.errors import RateLimitExceeded
 from database.models import db, Paciente, Endereco, Movimentacao
+from database import busca, migracoes
+from database.perfil_consultas import PerfilConsultas, orcamento_consultas
+from database.transacao import confirmar, unidade_de_trabalho, manter_carregados
+from database.prontuario import AlocadorProntuario
+from services.cep import ResolvedorCep, ServicoCepIndisponivel, limpar_cep, formatar_cep
+from services.auditoria import GravadorAuditoria
+from services.principal import CachePrincipal
+from services.cpf import limpar_cpf, formatar_cpf, validar_cpf as validar_cpf_digitos
+from services.importacao import ImportadorPacientes, ErroImportacao, detectar_formato, resumir
+from services.exportacao import gerar_exportacao, interpretar_data, ErroExportacao, FORMATOS as FORMATOS_EXPORTACAO
+from services.eventos import BarramentoEventos
+from services.fila import IndiceFila
+from services import serializacao, historico
+from services.serializacao import resposta_json, ErroCampos
+from services.cache_respostas import CacheRespostas
+from services.registro import RegistroEstruturado
+from services.metricas import Metricas, medir
+from services.senhas import ServicoSenhas, ServicoSenhasOcupado
+from services.bloqueios import ControleBloqueios
+from services.modulos import RegistroModulos, MANUTENCAO, TODOS
+from services.fragmentos import CacheFragmentos
 from datetime import datetime, timedelta
-from logging.handlers import RotatingFileHandler
+import time
 from functools import wraps
+import click
 import pyotp
-import requests
 import os
 import re
-import logging
 import secrets
 import hmac
 import hashlib
@@ -30,27 +53,35 @@ import hashlib
 app = Flask(__name__)
 
 # Carregar configurações baseadas no ambiente
-from config import config
+from config import config, url_sqlite_absoluta
 config_name = os.environ.get('FLASK_ENV', 'development')
 app.config.from_object(config.get(config_name, config['default']))
+app.config['SQLALCHEMY_DATABASE_URI'] = url_sqlite_absoluta(app.config['SQLALCHEMY_DATABASE_URI'], app.instance_path)
 
-# Configuração de logging
-if not os.path.exists('logs'):
-    os.mkdir('logs')
+@event.listens_for(Engine, 'do_connect')
+def criar_pasta_do_sqlite(dialect, conexao, cargs, cparams):
+    """Pasta do arquivo SQLite criada na primeira conexão (importar a aplicação não toca no disco)"""
+    if dialect.name == 'sqlite' and cargs and cargs[0] not in ('', ':memory:') and not cargs[0].startswith('file:'):
+        os.makedirs(os.path.dirname(cargs[0]) or '.', exist_ok=True)
 
-file_handler = RotatingFileHandler('logs/hospital.log', maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('Inicializando sistema hospitalar...')
+# Configuração de logging (JSON assíncrono, ver services/registro.py)
+registro_estruturado = RegistroEstruturado(app)
 
 # Inicialização dos componentes
 db.init_app(app)
-bcrypt = Bcrypt(app)
+metricas = Metricas(app, db)
+perfil_consultas = PerfilConsultas(app)
+servico_senhas = ServicoSenhas(app)
+controle_bloqueios = ControleBloqueios(app)
+cache_fragmentos = CacheFragmentos(app)
 csrf = CSRFProtect(app)
+alocador_prontuario = AlocadorProntuario(app)
+resolvedor_cep = ResolvedorCep(app)
+gravador_auditoria = GravadorAuditoria()
+cache_principal = CachePrincipal()
+barramento_eventos = BarramentoEventos(app)
+indice_fila = IndiceFila(app, barramento_eventos)
+cache_respostas = CacheRespostas(app, barramento_eventos)
 
 # Configuração do CSRF
 app.config['WTF_CSRF_TIME_LIMIT'] = None
@@ -80,12 +111,19 @@ class LogAuditoria(db.Model):
     acao = db.Column(db.String(50))
     detalhes = db.Column(db.Text)
     
+    __table_args__ = (
+        db.Index('ix_log_auditoria_usuario_data', 'usuario_id', 'data_hora'),
+        db.Index('ix_log_auditoria_data_hora', 'data_hora'),
+    )
+    
     def __init__(self, usuario_id, ip_address, acao, detalhes):
         self.usuario_id = usuario_id
         self.ip_address = ip_address
         self.acao = acao
         self.detalhes = detalhes
 
+gravador_auditoria.init_app(app, LogAuditoria)
+
 # Modelo de Usuário
 class Usuario(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -115,7 +153,7 @@ class Usuario(UserMixin, db.Model):
     alterado_por = db.Column(db.Integer, db.ForeignKey('usuario.id'))
     
     # Relacionamento para auditoria
-    logs = db.relationship('LogAuditoria', backref='usuario', lazy=True)
+    logs = db.relationship('LogAuditoria', backref='usuario', lazy='dynamic')  # Consulta sob demanda, nunca o histórico inteiro
     
     def gerar_secret_2fa(self):
         """Gera um novo segredo para 2FA"""
@@ -136,22 +174,20 @@ class Usuario(UserMixin, db.Model):
             codigos = self.backup_codes.split(',')
             codigos.remove(codigo)
             self.backup_codes = ','.join(codigos)
-            db.session.commit()
+            confirmar()
             return True
             
         totp = pyotp.TOTP(self.two_factor_secret)
         return comparacao_segura(codigo, totp.now())
     
     def registrar_atividade(self, ip_address, acao, detalhes):
-        """Registra uma atividade do usuário no log de auditoria"""
-        log = LogAuditoria(
+        """Registra uma atividade do usuário no log de auditoria (gravação em segundo plano)"""
+        gravador_auditoria.registrar(
             usuario_id=self.id,
             ip_address=ip_address,
             acao=acao,
             detalhes=detalhes
         )
-        db.session.add(log)
-        db.session.commit()
     
     def registrar_dispositivo(self, user_agent, ip_address):
         """Registra um novo dispositivo autorizado"""
@@ -183,35 +219,80 @@ class Usuario(UserMixin, db.Model):
         return True, "Senha válida."
     
     def verificar_senha(self, senha):
-        return bcrypt.check_password_hash(self.password, senha)
+        with medir('bcrypt'):
+            valida, novo_hash = servico_senhas.verificar(self.password, senha)
+        if novo_hash:
+            # Custo do bcrypt mudou: o hash novo é gravado no próximo commit
+            self.password = novo_hash
+        return valida
+    
+    def carregar(self):
+        """Compatibilidade com Principal: o próprio registro já está carregado"""
+        return self
+    
+    @property
+    def senha_expira_em(self):
+        if not self.ultima_alteracao_senha:
+            return None
+        return self.ultima_alteracao_senha + timedelta(days=app.config['SENHA_VALIDADE_DIAS'])
     
     def bloquear_temporariamente(self):
-        self.tentativas_login += 1
-        if self.tentativas_login >= 3:  # Bloqueia após 3 tentativas
-            self.bloqueado_ate = datetime.now() + timedelta(minutes=15)
-        db.session.commit()
+        """Conta uma tentativa errada; bloqueia ao atingir BLOQUEIO_TENTATIVAS"""
+        if not controle_bloqueios.no_banco:
+            # Contador no armazenamento compartilhado: o banco só registra o bloqueio em si
+            tentativas, bloqueado_ate = controle_bloqueios.registrar_falha(self.username)
+            set_committed_value(self, 'tentativas_login', tentativas)
+            if bloqueado_ate:
+                self.bloqueado_ate = bloqueado_ate
+                confirmar()
+            return
+        
+        # UPDATE atômico: tentativas simultâneas em workers diferentes não se perdem
+        tentativas = db.func.coalesce(Usuario.tentativas_login, 0) + 1
+        linha = db.session.execute(
+            db.update(Usuario)
+            .where(Usuario.id == self.id)
+            .values(
+                tentativas_login=tentativas,
+                bloqueado_ate=db.case(
+                    (tentativas >= controle_bloqueios.limite, datetime.now() + controle_bloqueios.duracao),
+                    else_=Usuario.bloqueado_ate
+                )
+            )
+            .returning(Usuario.tentativas_login, Usuario.bloqueado_ate)
+            .execution_options(synchronize_session=False)
+        ).one()
+        set_committed_value(self, 'tentativas_login', linha.tentativas_login)
+        set_committed_value(self, 'bloqueado_ate', linha.bloqueado_ate)
+        controle_bloqueios.lembrar(self.username, linha.bloqueado_ate)
+        confirmar()
     
     def esta_bloqueado(self):
         if self.bloqueado_ate and self.bloqueado_ate > datetime.now():
+            controle_bloqueios.lembrar(self.username, self.bloqueado_ate)
             return True
         return False
     
     def resetar_tentativas(self):
+        controle_bloqueios.limpar(self.username)
         self.tentativas_login = 0
         self.bloqueado_ate = None
-        db.session.commit()
+        confirmar()
+
+cache_principal.init_app(app, Usuario)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Retrato em cache do usuário (Principal); use current_user.carregar() para alterar dados
+    return cache_principal.obter(int(user_id))
 
 # Middleware para verificar a necessidade de alteração de senha
 @app.before_request
 def verificar_senha_expirada():
     if current_user.is_authenticated:
-        # Verifica se a senha tem mais de 90 dias
-        prazo_expiracao = timedelta(days=90)
-        if datetime.utcnow() - current_user.ultima_alteracao_senha > prazo_expiracao:
+        # Prazo já calculado no Principal em cache (SENHA_VALIDADE_DIAS), sem acesso ao banco
+        expira_em = current_user.senha_expira_em
+        if expira_em and datetime.utcnow() > expira_em:
             if request.endpoint != 'alterar_senha' and request.endpoint != 'logout':
                 return jsonify({
                     'status': 'warning',
@@ -227,6 +308,14 @@ def handle_ratelimit_error(e):
         'message': 'Limite de tentativas excedido. Por favor, aguarde alguns minutos.'
     }), 429
 
+# Manipulador de erro para pico de logins (sem vaga no pool do bcrypt)
+@app.errorhandler(ServicoSenhasOcupado)
+def handle_senhas_ocupado(e):
+    return jsonify({
+        'status': 'error',
+        'message': 'Muitos acessos simultâneos. Tente novamente em alguns segundos.'
+    }), 503, {'Retry-After': '2'}
+
 # ================================
 # DECORADORES DE SEGURANÇA
 # ================================
@@ -279,30 +368,15 @@ MODULOS = [
     {'id': 'billing', 'titulo': 'Faturamento', 'icone': 'fas fa-file-invoice-dollar', 'permissoes': ['admin', 'faturista']}
 ]
 
-# Funções auxiliares para os módulos
-def get_module_priority(module_id):
-    """Define a prioridade de cada módulo"""
-    high_priority = ['reception', 'risk', 'doctor', 'nurse', 'pharmacy']
-    medium_priority = ['lab', 'xray', 'nutrition', 'medical-accounts']
-    
-    if module_id in high_priority:
-        return 'priority-high'
-    elif module_id in medium_priority:
-        return 'priority-medium'
-    return 'priority-low'
-
-def get_module_status(module_id):
-    """Define o status de cada módulo"""
-    # Aqui você pode implementar lógica real verificando o status do módulo
-    # Por enquanto, vamos simular alguns status
-    maintenance = ['it']  # Módulos em manutenção
-    offline = []  # Módulos offline
-    
-    if module_id in maintenance:
-        return 'status-maintenance'
-    elif module_id in offline:
-        return 'status-offline'
-    return 'status-active'
+# Saúde dos módulos (verificada em segundo plano, ver services/modulos.py)
+def saude_banco():
+    db.session.execute(db.text('SELECT 1'))
+
+def saude_cep():
+    if resolvedor_cep.circuito.estado == 'aberto':
+        return MANUTENCAO  # Recepção funciona, mas sem preenchimento automático do endereço
+
+registro_modulos = RegistroModulos(app, MODULOS, {TODOS: saude_banco, 'reception': saude_cep})
 
 # ================================
 # ROTAS PRINCIPAIS
@@ -334,30 +408,31 @@ def test_api_frontend():
 @login_required
 def modulos():
     """Página principal com os módulos do sistema"""
-    for modulo in MODULOS:
-        modulo['priority_class'] = get_module_priority(modulo['id'])
-        modulo['status_class'] = get_module_status(modulo['id'])
-    return render_template('modulos.html', modulos=MODULOS)
+    # A versão é lida antes da lista: numa troca de status no meio, o fragmento
+    # fica sob a chave antiga (já superada), nunca o contrário
+    versao_modulos = registro_modulos.versao
+    return render_template('modulos.html', versao_modulos=versao_modulos,
+                           modulos=registro_modulos.visiveis(current_user.tipo))
 
 @app.route('/modulo/<modulo_id>')
 @login_required
 def modulo(modulo_id):
     """Rota para acessar um módulo específico"""
-    modulo = next((m for m in MODULOS if m['id'] == modulo_id), None)
+    modulo = registro_modulos.obter(modulo_id)
     
     if not modulo:
         flash('Módulo não encontrado.', 'error')
         return redirect(url_for('modulos'))
     
-    if current_user.tipo not in modulo['permissoes']:
+    if current_user.tipo not in modulo.permissoes:
         flash('Você não tem permissão para acessar este módulo.', 'error')
         return redirect(url_for('modulos'))
     
-    # Adiciona prioridade e status ao módulo
-    modulo['priority_class'] = get_module_priority(modulo['id'])
-    modulo['status_class'] = get_module_status(modulo['id'])
+    if not modulo.pagina:
+        flash('Este módulo ainda não está disponível.', 'error')
+        return redirect(url_for('modulos'))
     
-    return render_template(f'modulos/{modulo_id}.html', modulo=modulo)
+    return render_template(f'modulos/{modulo.id}.html', modulo=modulo)
 
 # ================================
 # ROTAS DE AUTENTICAÇÃO
@@ -368,7 +443,9 @@ def modulo(modulo_id):
 def configurar_2fa():
     """Configura a autenticação de dois fatores para o usuário"""
     if not current_user.two_factor_enabled:
-        secret = current_user.gerar_secret_2fa()
+        usuario = current_user.carregar()
+        secret = usuario.gerar_secret_2fa()
+        db.session.commit()
         totp = pyotp.TOTP(secret)
         provisioning_uri = totp.provisioning_uri(
             current_user.email,
@@ -384,7 +461,7 @@ def configurar_2fa():
         return jsonify({
             'status': 'success',
             'qr_code': provisioning_uri,
-            'backup_codes': current_user.backup_codes.split(',')
+            'backup_codes': usuario.backup_codes.split(',')
         })
     
     return jsonify({
@@ -393,6 +470,7 @@ def configurar_2fa():
     })
 
 @app.route('/verificar-2fa', methods=['POST'])
+@unidade_de_trabalho
 def verificar_2fa():
     """Verifica o código 2FA durante o login"""
     codigo = request.form.get('codigo')
@@ -440,8 +518,16 @@ def verificar_2fa():
         'message': 'Código 2FA inválido'
     })
 
+def resposta_conta_bloqueada(bloqueado_ate):
+    tempo_restante = (bloqueado_ate - datetime.now()).total_seconds() / 60
+    return jsonify({
+        'status': 'error',
+        'message': f'Conta temporariamente bloqueada. Tente novamente em {int(tempo_restante)} minutos.'
+    })
+
 @app.route('/login', methods=['POST'])
 @limiter.limit("5 per minute")  # Rate limiting para prevenção de força bruta
+@unidade_de_trabalho
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -454,6 +540,12 @@ def login():
                 'message': 'Todos os campos são obrigatórios!'
             })
         
+        # Bloqueio já conhecido (neste worker ou no armazenamento compartilhado):
+        # recusa sem ler o usuário nem rodar o bcrypt
+        bloqueado_ate = controle_bloqueios.bloqueado_ate(username)
+        if bloqueado_ate:
+            return resposta_conta_bloqueada(bloqueado_ate)
+        
         # Busca o usuário no banco de dados
         usuario = Usuario.query.filter_by(username=username).first()
         
@@ -474,18 +566,14 @@ def login():
             
         # Verifica se a conta está bloqueada
         if usuario.esta_bloqueado():
-            tempo_restante = (usuario.bloqueado_ate - datetime.now()).total_seconds() / 60
-            return jsonify({
-                'status': 'error',
-                'message': f'Conta temporariamente bloqueada. Tente novamente em {int(tempo_restante)} minutos.'
-            })
+            return resposta_conta_bloqueada(usuario.bloqueado_ate)
         # Verifica a senha
         if usuario.verificar_senha(password):
             # Login bem sucedido - primeira etapa
+            # Um UPDATE só, no commit da unidade de trabalho (com o rehash da senha, se houver)
             usuario.resetar_tentativas()
             usuario.ultimo_login = datetime.now()
             usuario.ultimo_ip = request.remote_addr
-            db.session.commit()
             
             # Se 2FA está habilitado, inicia processo de verificação
             if usuario.two_factor_enabled:
@@ -526,8 +614,9 @@ def login():
         usuario.bloquear_temporariamente()
         
         msg = 'Usuário ou senha inválidos!'
-        if usuario.tentativas_login >= 2:  # Aviso na penúltima tentativa
-            msg += f' Mais {4 - usuario.tentativas_login} tentativa(s) antes do bloqueio temporário.'
+        restantes = controle_bloqueios.limite - usuario.tentativas_login
+        if restantes == 1:  # Aviso na penúltima tentativa
+            msg += f' Mais {restantes} tentativa antes do bloqueio temporário.'
             
         return jsonify({
             'status': 'error',
@@ -549,8 +638,10 @@ def alterar_senha():
     senha_atual = request.form.get('senha_atual')
     nova_senha = request.form.get('nova_senha')
     
+    usuario = current_user.carregar()
+    
     # Validação da senha atual
-    if not current_user.verificar_senha(senha_atual):
+    if not usuario.verificar_senha(senha_atual):
         return jsonify({
             'status': 'error',
             'message': 'Senha atual incorreta!'
@@ -565,8 +656,8 @@ def alterar_senha():
         })
     
     # Atualiza a senha
-    current_user.password = bcrypt.generate_password_hash(nova_senha).decode('utf-8')
-    current_user.ultima_alteracao_senha = db.func.now()
+    usuario.password = servico_senhas.gerar_hash(nova_senha)
+    usuario.ultima_alteracao_senha = db.func.now()
     db.session.commit()
     
     return jsonify({
@@ -586,7 +677,7 @@ def criar_admin_padrao():
     """Cria usuário administrador padrão se não existir"""
     admin = Usuario.query.filter_by(username='admin').first()
     if not admin:
-        hashed_password = bcrypt.generate_password_hash('admin123').decode('utf-8')
+        hashed_password = servico_senhas.gerar_hash('admin123')
         
         admin = Usuario(
             username='admin',
@@ -608,35 +699,49 @@ def criar_admin_padrao():
 @app.route('/api/pacientes', methods=['GET'])
 @csrf.exempt  # Desabilitar CSRF para a API
 @api_login_required
+@orcamento_consultas(4)
 def buscar_pacientes():
+    """
+    Busca paginada de pacientes.
+    Parâmetros: search, type (cpf|prontuario|nome), limite (máx. 100), cursor,
+    fields e projecao (completo|resumo). O corpo continua sendo a lista de
+    pacientes; a paginação vai nos cabeçalhos X-Total-Count, X-Total-Aproximado,
+    X-Proximo-Cursor e Link. O ETag vem da versão da tabela de pacientes: um
+    If-None-Match que bate recebe 304 sem executar a busca.
+    """
     search = request.args.get('search', '')
     
-    # Log detalhado para debug
-    app.logger.info(f"[BUSCA_PACIENTES] Requisição recebida - Search: '{search}'")
-    app.logger.info(f"[BUSCA_PACIENTES] Headers: {dict(request.headers)}")
-    app.logger.info(f"[BUSCA_PACIENTES] User: {current_user.username if current_user.is_authenticated else 'Não autenticado'}")
+    app.logger.debug("[BUSCA_PACIENTES] Requisição recebida - Search: '%s'", search)
     
     try:
-        if search:
-            app.logger.info(f"[BUSCA_PACIENTES] Buscando por: '{search}'")
-            pacientes = Paciente.query.filter(
-                db.or_(
-                    Paciente.nome.ilike(f'%{search}%'),
-                    Paciente.cpf.like(f'%{search}%'),
-                    Paciente.prontuario.like(f'%{search}%')
-                )
-            ).all()
-        else:
-            app.logger.info("[BUSCA_PACIENTES] Buscando todos os pacientes")
-            pacientes = Paciente.query.all()
-        
-        app.logger.info(f"[BUSCA_PACIENTES] Encontrados: {len(pacientes)} pacientes")
-        
-        resultado = [p.to_dict() for p in pacientes]
-        app.logger.info(f"[BUSCA_PACIENTES] Retornando {len(resultado)} registros")
-        
-        return jsonify(resultado)
-        
+        campos = serializacao.PACIENTE.selecionar(request.args.get('fields'), request.args.get('projecao'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def renderizar():
+        resultado = busca.buscar(
+            search,
+            limite=request.args.get('limite', type=int),
+            cursor=request.args.get('cursor'),
+            tipo=request.args.get('type'),
+            colunas=serializacao.PACIENTE.colunas(campos)
+        )
+        app.logger.debug("[BUSCA_PACIENTES] Retornando %d registros", len(resultado.pacientes))
+        
+        cabecalhos = {}
+        if resultado.total is not None:
+            cabecalhos['X-Total-Count'] = str(resultado.total)
+            cabecalhos['X-Total-Aproximado'] = 'false' if resultado.total_exato else 'true'
+        if resultado.proximo_cursor:
+            cabecalhos['X-Proximo-Cursor'] = resultado.proximo_cursor
+            proxima_pagina = url_for('buscar_pacientes', **dict(request.args, cursor=resultado.proximo_cursor))
+            cabecalhos['Link'] = f'<{proxima_pagina}>; rel="next"'
+        return serializacao.PACIENTE.de_linhas(resultado.pacientes, campos), cabecalhos
+    
+    try:
+        return cache_respostas.responder(busca.versao_pacientes(), renderizar, grupos=('pacientes',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         app.logger.error(f"[BUSCA_PACIENTES] Erro: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -670,54 +775,62 @@ def cadastrar_paciente():
             data_nascimento = datetime.strptime(data_nascimento_str, '%Y-%m-%d').date()
         except ValueError as e:
             return jsonify({'error': 'Formato de data inválido. Use YYYY-MM-DD'}), 400
-        # Gerar prontuário automaticamente
-        ultimo_paciente = Paciente.query.order_by(Paciente.id.desc()).first()
-        if ultimo_paciente:
-            ultimo_numero = int(ultimo_paciente.prontuario) if ultimo_paciente.prontuario.isdigit() else 0
-            novo_prontuario = str(ultimo_numero + 1).zfill(6)
-        else:
-            novo_prontuario = "000001"
-        
-        # Criar novo paciente
-        novo_paciente = Paciente(
-            prontuario=novo_prontuario,
-            nome=dados['nome'],
-            cpf=dados.get('cpf'),
-            rg=dados.get('rg'),
-            data_nascimento=data_nascimento,  # Usar objeto date convertido
-            sexo=dados.get('sexo', 'M'),
-            raca=dados.get('raca', 'NÃO INFORMADA'),
-            nacionalidade=dados.get('nacionalidade', 'BRASILEIRA'),
-            nome_mae=dados.get('nome_mae'),
-            mae_desconhecida=dados.get('mae_desconhecida', False),
-            nome_pai=dados.get('nome_pai'),
-            email=dados.get('email'),
-            telefone=dados.get('telefone'),
-            convenio=dados.get('convenio', 'sus'),
-            numero_cartao=dados.get('numero_cartao'),
-            titular_cartao=dados.get('titular_cartao')
-        )
+        def gravar(prontuario):
+            # Criar novo paciente
+            novo_paciente = Paciente(
+                prontuario=prontuario,
+                nome=dados['nome'],
+                cpf=dados.get('cpf'),
+                rg=dados.get('rg'),
+                data_nascimento=data_nascimento,  # Usar objeto date convertido
+                sexo=dados.get('sexo', 'M'),
+                raca=dados.get('raca', 'NÃO INFORMADA'),
+                nacionalidade=dados.get('nacionalidade', 'BRASILEIRA'),
+                nome_mae=dados.get('nome_mae'),
+                mae_desconhecida=dados.get('mae_desconhecida', False),
+                nome_pai=dados.get('nome_pai'),
+                email=dados.get('email'),
+                telefone=dados.get('telefone'),
+                convenio=dados.get('convenio', 'sus'),
+                numero_cartao=dados.get('numero_cartao'),
+                titular_cartao=dados.get('titular_cartao')
+            )
         
-        db.session.add(novo_paciente)
-        db.session.commit()
+            db.session.add(novo_paciente)
+            db.session.flush()  # Gera o id; paciente e endereço são gravados no mesmo commit
         
-        # Se tiver dados de endereço, criar o registro de endereço
-        if 'cep' in dados and dados['cep']:
-            endereco = Endereco(
-                paciente_id=novo_paciente.id,
-                cep=dados['cep'],
-                estado=dados['estado'],
-                cidade=dados['cidade'],
-                bairro=dados.get('bairro', 'NÃO INFORMADO'),
-                logradouro=dados.get('logradouro', 'NÃO INFORMADO'),
-                numero=dados.get('numero', 'S/N'),
-                complemento=dados.get('complemento'),
-                ponto_referencia=dados.get('ponto_referencia')
-            )
-            db.session.add(endereco)
+            # Se tiver dados de endereço, criar o registro de endereço
+            if 'cep' in dados and dados['cep']:
+                endereco = Endereco(
+                    paciente_id=novo_paciente.id,
+                    cep=dados['cep'],
+                    estado=dados['estado'],
+                    cidade=dados['cidade'],
+                    bairro=dados.get('bairro', 'NÃO INFORMADO'),
+                    logradouro=dados.get('logradouro', 'NÃO INFORMADO'),
+                    numero=dados.get('numero', 'S/N'),
+                    complemento=dados.get('complemento'),
+                    ponto_referencia=dados.get('ponto_referencia')
+                )
+                db.session.add(endereco)
             db.session.commit()
+            return novo_paciente
         
-        return jsonify(novo_paciente.to_dict()), 201
+        # Usar o prontuário reservado pelo formulário (se ainda não usado) ou alocar um novo
+        reservado = None
+        if dados.get('reserva_prontuario'):
+            reservado = alocador_prontuario.confirmar_reserva(dados['reserva_prontuario'], current_user.id)
+        try:
+            novo_paciente = gravar(reservado or alocador_prontuario.proximo())
+        except IntegrityError:
+            if not reservado:
+                raise
+            # Outro cadastro simultâneo usou a mesma reserva: segue com um número novo
+            db.session.rollback()
+            novo_paciente = gravar(alocador_prontuario.proximo())
+        
+        cache_respostas.invalidar('pacientes')
+        return resposta_json(serializacao.PACIENTE.de_objeto(novo_paciente), 201)
         
     except KeyError as e:
         db.session.rollback()
@@ -726,6 +839,101 @@ def cadastrar_paciente():
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@app.route('/api/pacientes/importar', methods=['POST'])
+@csrf.exempt
+@admin_required
+def importar_pacientes():
+    """
+    Importação em lote de pacientes (CSV ou NDJSON), enviada como arquivo
+    multipart ('arquivo') ou no corpo da requisição. A resposta é NDJSON:
+    uma linha de progresso por lote (com erros por linha) e o resumo ao final.
+    """
+    import csv
+    import io
+    import json
+    
+    if 'arquivo' in request.files:
+        enviado = request.files['arquivo']
+        formato = request.args.get('formato') or detectar_formato(enviado.filename, enviado.mimetype)
+        fluxo = enviado.stream
+    else:
+        formato = request.args.get('formato') or detectar_formato(None, request.mimetype)
+        fluxo = request.stream
+    
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Informe o formato: csv ou ndjson'}), 400
+    
+    tamanho_lote = min(request.args.get('lote', 1000, type=int), 5000)
+    importador = ImportadorPacientes(alocador_prontuario, tamanho_lote=max(1, tamanho_lote))
+    usuario_id = current_user.id
+    ip_address = request.remote_addr
+    
+    def gerar():
+        arquivo = io.TextIOWrapper(fluxo, encoding='utf-8-sig', newline='')
+        totais = {'lidos': 0, 'importados': 0, 'duplicados': 0, 'total_erros': 0, 'lotes_com_falha': 0}
+        erro = None
+        try:
+            for evento in importador.importar(arquivo, formato):
+                totais['lidos'] += evento['lidos']
+                totais['importados'] += evento['importados']
+                totais['duplicados'] += evento['duplicados']
+                totais['total_erros'] += len(evento['erros'])
+                if evento.get('falha'):
+                    totais['lotes_com_falha'] += 1
+                app.logger.info(f"[IMPORTACAO] Lote {evento['lote']}: {evento['importados']} importados, {len(evento['erros'])} erros")
+                yield json.dumps(evento, ensure_ascii=False) + '\n'
+        except (ErroImportacao, UnicodeDecodeError, csv.Error) as e:
+            erro = str(e)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception("[IMPORTACAO] Importação interrompida por erro inesperado")
+            erro = f'Erro interno na importação: {str(e)}'
+        finally:
+            # Também se o cliente desconectar: os lotes já gravados são auditados
+            # e aparecem nas listagens
+            gravador_auditoria.registrar(
+                usuario_id=usuario_id,
+                ip_address=ip_address,
+                acao="PACIENTES_IMPORTADOS",
+                detalhes=f"Importação em lote: {totais['importados']} de {totais['lidos']} registros"
+                         + (f" (interrompida: {erro})" if erro else "")
+            )
+            cache_respostas.invalidar('pacientes')
+        
+        if erro:
+            yield json.dumps({'error': erro}, ensure_ascii=False) + '\n'
+        yield json.dumps({'resumo': totais}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+@app.route('/api/exportar/<entidade>')
+@csrf.exempt
+@admin_required
+def exportar(entidade):
+    """
+    Exportação em fluxo de pacientes, enderecos ou movimentacoes.
+    Parâmetros: formato (ndjson|csv), desde (ISO 8601, incremental por atualizado_em)
+    e gzip=1 (ou Accept-Encoding: gzip). O cabeçalho X-Exportacao-Ate traz o
+    instante de corte, a ser usado como 'desde' na próxima extração.
+    """
+    formato = request.args.get('formato', 'ndjson')
+    compactar = request.args.get('gzip') == '1' or 'gzip' in request.headers.get('Accept-Encoding', '')
+    ate = datetime.utcnow()
+    
+    try:
+        desde = interpretar_data(request.args.get('desde'))
+        conteudo = gerar_exportacao(entidade, formato, desde=desde, ate=ate, compactar=compactar)
+    except ErroExportacao as e:
+        return jsonify({'error': str(e)}), 400
+    
+    resposta = Response(stream_with_context(conteudo), mimetype=FORMATOS_EXPORTACAO[formato])
+    resposta.headers['X-Exportacao-Ate'] = ate.isoformat()
+    resposta.headers['Content-Disposition'] = f'attachment; filename={entidade}.{formato}'
+    if compactar:
+        resposta.headers['Content-Encoding'] = 'gzip'
+        resposta.headers['Vary'] = 'Accept-Encoding'
+    return resposta
+
 # Rotas auxiliares para o módulo de recepção
 @app.route('/api/validar-cpf', methods=['POST'])
 @csrf.exempt
@@ -734,33 +942,15 @@ def validar_cpf():
     """Valida CPF usando algoritmo oficial"""
     try:
         dados = request.get_json()
-        cpf = dados.get('cpf', '').replace('.', '').replace('-', '')
-        
-        if len(cpf) != 11 or not cpf.isdigit():
-            return jsonify({'valid': False, 'message': 'CPF deve conter 11 dígitos'})
-        
-        # Verificar se todos os dígitos são iguais
-        if cpf == cpf[0] * 11:
-            return jsonify({'valid': False, 'message': 'CPF inválido'})
-        
-        # Validação do primeiro dígito verificador
-        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
-        resto = soma % 11
-        digito1 = 0 if resto < 2 else 11 - resto
+        cpf = limpar_cpf(dados.get('cpf', ''))
         
-        if int(cpf[9]) != digito1:
-            return jsonify({'valid': False, 'message': 'CPF inválido'})
-        
-        # Validação do segundo dígito verificador
-        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
-        resto = soma % 11
-        digito2 = 0 if resto < 2 else 11 - resto
-        
-        if int(cpf[10]) != digito2:
-            return jsonify({'valid': False, 'message': 'CPF inválido'})
+        # Dígitos verificadores (mesma regra usada na importação em lote)
+        erro = validar_cpf_digitos(cpf)
+        if erro:
+            return jsonify({'valid': False, 'message': erro})
         
         # Verificar se CPF já existe no banco
-        paciente_existente = Paciente.query.filter_by(cpf=cpf).first()
+        paciente_existente = Paciente.query.filter(Paciente.cpf.in_([cpf, formatar_cpf(cpf)])).first()
         if paciente_existente:
             return jsonify({
                 'valid': False, 
@@ -776,40 +966,23 @@ def validar_cpf():
 @csrf.exempt
 @api_login_required
 def consultar_cep(cep):
-    """Consulta CEP usando API ViaCEP"""
+    """Consulta CEP no cache local e, se necessário, na API ViaCEP"""
     try:
         # Remove caracteres não numéricos
-        cep_limpo = ''.join(filter(str.isdigit, cep))
+        cep_limpo = limpar_cep(cep)
         
         if len(cep_limpo) != 8:
             return jsonify({'error': 'CEP deve conter 8 dígitos'}), 400
         
-        # Formatar CEP
-        cep_formatado = f"{cep_limpo[:5]}-{cep_limpo[5:]}"
-        
-        # Fazer requisição para ViaCEP
-        response = requests.get(f'https://viacep.com.br/ws/{cep_limpo}/json/', timeout=5)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Erro ao consultar CEP'}), 400
-        
-        dados = response.json()
+        endereco = resolvedor_cep.consultar(cep_limpo)
         
-        if 'erro' in dados:
+        if endereco is None:
             return jsonify({'error': 'CEP não encontrado'}), 404
         
-        return jsonify({
-            'cep': cep_formatado,
-            'logradouro': dados.get('logradouro', ''),
-            'bairro': dados.get('bairro', ''),
-            'cidade': dados.get('localidade', ''),
-            'estado': dados.get('uf', ''),
-            'complemento': dados.get('complemento', ''),
-            'success': True
-        })
+        return jsonify(dict(endereco, cep=formatar_cep(cep_limpo), success=True))
         
-    except requests.exceptions.RequestException:
-        return jsonify({'error': 'Erro de conexão com o serviço de CEP'}), 500
+    except ServicoCepIndisponivel as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
@@ -817,17 +990,14 @@ def consultar_cep(cep):
 @csrf.exempt
 @api_login_required
 def proximo_prontuario():
-    """Gera o próximo número de prontuário"""
+    """Reserva o próximo número de prontuário por um prazo curto (PRONTUARIO_RESERVA_SEGUNDOS)"""
     try:
-        ultimo_paciente = Paciente.query.order_by(Paciente.id.desc()).first()
-        if ultimo_paciente:
-            ultimo_numero = int(ultimo_paciente.prontuario) if ultimo_paciente.prontuario.isdigit() else 0
-            novo_numero = ultimo_numero + 1
-        else:
-            novo_numero = 1
+        numero, reserva, expira_em = alocador_prontuario.reservar(current_user.id)
         
         return jsonify({
-            'numero': str(novo_numero).zfill(6),
+            'numero': numero,
+            'reserva': reserva,
+            'expira_em': expira_em.isoformat(),
             'success': True
         })
     except Exception as e:
@@ -836,31 +1006,39 @@ def proximo_prontuario():
 @app.route('/api/imprimir-etiqueta/<int:paciente_id>')
 @csrf.exempt
 @login_required
+@orcamento_consultas(2)
 def imprimir_etiqueta(paciente_id):
-    """Gera dados para impressão de etiqueta do paciente"""
+    """Gera dados para impressão de etiqueta do paciente (varia com o paciente, o usuário e o dia)"""
+    from datetime import date
+    
     try:
-        paciente = Paciente.query.get_or_404(paciente_id)
-        
-        # Calcular idade
-        from datetime import date
+        versao_paciente = historico.versao_paciente(paciente_id)
+        if versao_paciente is None:
+            return jsonify({'error': 'Paciente não encontrado'}), 404
         hoje = date.today()
-        idade = hoje.year - paciente.data_nascimento.year
-        if hoje.month < paciente.data_nascimento.month or \
-           (hoje.month == paciente.data_nascimento.month and hoje.day < paciente.data_nascimento.day):
-            idade -= 1
-        
-        etiqueta_data = {
-            'prontuario': paciente.prontuario,
-            'nome': paciente.nome,
-            'data_nascimento': paciente.data_nascimento.strftime('%d/%m/%Y'),
-            'idade': f"{idade} anos",
-            'sexo': 'Masculino' if paciente.sexo == 'M' else 'Feminino',
-            'nome_mae': paciente.nome_mae or 'Não informado',
-            'data_impressao': hoje.strftime('%d/%m/%Y %H:%M'),
-            'usuario': current_user.nome
-        }
         
-        return jsonify(etiqueta_data)
+        def renderizar():
+            paciente = db.session.get(Paciente, paciente_id)
+            
+            # Calcular idade
+            idade = hoje.year - paciente.data_nascimento.year
+            if hoje.month < paciente.data_nascimento.month or \
+               (hoje.month == paciente.data_nascimento.month and hoje.day < paciente.data_nascimento.day):
+                idade -= 1
+            
+            return {
+                'prontuario': paciente.prontuario,
+                'nome': paciente.nome,
+                'data_nascimento': paciente.data_nascimento.strftime('%d/%m/%Y'),
+                'idade': f"{idade} anos",
+                'sexo': 'Masculino' if paciente.sexo == 'M' else 'Feminino',
+                'nome_mae': paciente.nome_mae or 'Não informado',
+                'data_impressao': hoje.strftime('%d/%m/%Y %H:%M'),
+                'usuario': current_user.nome
+            }
+        
+        versao = (versao_paciente, current_user.id, hoje)
+        return cache_respostas.responder(versao, renderizar, grupos=(('paciente', paciente_id),))
         
     except Exception as e:
         return jsonify({'error': f'Erro ao gerar etiqueta: {str(e)}'}), 500
@@ -868,56 +1046,81 @@ def imprimir_etiqueta(paciente_id):
 @app.route('/api/paciente/<int:paciente_id>')
 @csrf.exempt
 @api_login_required
+@orcamento_consultas(2)
 def obter_paciente(paciente_id):
-    """Obtém dados completos de um paciente"""
+    """
+    Obtém dados completos de um paciente (com o endereço principal).
+    Aceita ?fields= ou ?projecao=resumo; responde 304 se o If-None-Match bater com o ETag.
+    """
+    esquema = serializacao.PACIENTE_DETALHE
     try:
-        paciente = Paciente.query.get_or_404(paciente_id)
-        
-        # Buscar endereço principal do paciente
-        endereco = Endereco.query.filter_by(paciente_id=paciente.id, principal=True).first()
-        
-        dados_paciente = {
-            'id': paciente.id,
-            'prontuario': paciente.prontuario,
-            'nome': paciente.nome,
-            'cpf': paciente.cpf,
-            'rg': paciente.rg,
-            'data_nascimento': paciente.data_nascimento.strftime('%Y-%m-%d') if paciente.data_nascimento else '',
-            'sexo': paciente.sexo,
-            'raca': paciente.raca,
-            'nacionalidade': paciente.nacionalidade,
-            'telefone': paciente.telefone,
-            'nome_mae': paciente.nome_mae,
-            'nome_pai': paciente.nome_pai,
-            'email': paciente.email,
-            'mae_desconhecida': paciente.mae_desconhecida,
-            'convenio': paciente.convenio,
-            'numero_cartao': paciente.numero_cartao,
-            'titular_cartao': paciente.titular_cartao,
-            'data_cadastro': paciente.data_cadastro.strftime('%d/%m/%Y %H:%M') if paciente.data_cadastro else ''
-        }
+        campos = esquema.selecionar(request.args.get('fields'), request.args.get('projecao'))
+    except ErroCampos as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def renderizar():
+        consulta = db.select(*esquema.colunas(campos)).select_from(Paciente).where(Paciente.id == paciente_id)
+        com_endereco = esquema.usa_modelo(campos, Endereco)
+        if com_endereco:
+            # Paciente e endereço principal em uma única consulta
+            consulta = consulta.add_columns(Endereco.id).outerjoin(
+                Endereco, db.and_(Endereco.paciente_id == Paciente.id, Endereco.principal == True)
+            )
+        linha = db.session.execute(consulta.limit(1)).one()
+        
+        dados_paciente = esquema.de_linhas([linha], campos)[0]
+        if com_endereco and linha[-1] is None:
+            # Sem endereço principal: os campos de endereço não são enviados
+            for campo in serializacao.CAMPOS_ENDERECO.intersection(dados_paciente):
+                del dados_paciente[campo]
+        return dados_paciente
+    
+    try:
+        versao = historico.versao_paciente(paciente_id)
+        if versao is None:
+            return jsonify({'error': 'Paciente não encontrado'}), 404
+        return cache_respostas.responder(versao, renderizar, grupos=(('paciente', paciente_id),))
         
-        # Adicionar dados de endereço se existir
-        if endereco:
-            dados_paciente.update({
-                'cep': endereco.cep,
-                'estado': endereco.estado,
-                'cidade': endereco.cidade,
-                'bairro': endereco.bairro,
-                'logradouro': endereco.logradouro,
-                'numero': endereco.numero,
-                'complemento': endereco.complemento,
-                'ponto_referencia': endereco.ponto_referencia
-            })
+    except Exception as e:
+        return jsonify({'error': f'Erro ao buscar paciente: {str(e)}'}), 500
+
+@app.route('/api/paciente/<int:paciente_id>/detalhes', methods=['GET'])
+@csrf.exempt
+@api_login_required
+@orcamento_consultas(3)
+def detalhes_paciente(paciente_id):
+    """
+    Ficha do paciente em uma requisição: dados (formato de /api/paciente/<id>,
+    com o endereço principal), total e as ?limite= movimentações mais recentes.
+    Páginas anteriores: /api/movimentacoes/paciente/<id>?cursor=<proximo_cursor>.
+    ETag pela versão do paciente (ver cache_respostas.responder).
+    """
+    try:
+        limite = max(1, min(request.args.get('limite', historico.LIMITE_PADRAO, type=int), historico.LIMITE_MAXIMO))
         
-        return jsonify(dados_paciente)
+        versao = historico.versao_paciente(paciente_id)
+        if versao is None:
+            return jsonify({'error': 'Paciente não encontrado'}), 404
+        
+        def renderizar():
+            movimentacoes, proximo_cursor = historico.pagina_movimentacoes(paciente_id, limite=limite)
+            return {
+                'paciente': historico.carregar_paciente(paciente_id),
+                'movimentacoes': movimentacoes,
+                'proximo_cursor': proximo_cursor
+            }
+        
+        return cache_respostas.responder(versao, renderizar, grupos=(('paciente', paciente_id),))
         
     except Exception as e:
+        app.logger.error(f"Erro ao carregar ficha do paciente {paciente_id}: {str(e)}")
         return jsonify({'error': f'Erro ao buscar paciente: {str(e)}'}), 500
 
 @app.route('/api/paciente/<int:paciente_id>', methods=['PUT'])
 @csrf.exempt
 @api_login_required
+@manter_carregados
+@orcamento_consultas(3)
 def atualizar_paciente(paciente_id):
     """Atualiza dados de um paciente existente"""
     try:
@@ -1012,7 +1215,8 @@ def atualizar_paciente(paciente_id):
                 f"Paciente {paciente.nome} (ID: {paciente.id}) foi atualizado"
             )
         
-        return jsonify(paciente.to_dict()), 200
+        cache_respostas.invalidar('pacientes', ('paciente', paciente.id))
+        return resposta_json(serializacao.PACIENTE.de_objeto(paciente))
         
     except KeyError as e:
         db.session.rollback()
@@ -1025,9 +1229,21 @@ def atualizar_paciente(paciente_id):
 # API DE MOVIMENTAÇÕES
 # ================================
 
+CANAL_MOVIMENTACOES = 'movimentacoes'
+
+def publicar_movimentacao(tipo_evento, movimentacao, paciente=None):
+    """Publica a alteração de uma movimentação para as telas ao vivo (após o commit)"""
+    dados = movimentacao.to_dict()
+    if paciente is not None:
+        dados['paciente_nome'] = paciente.nome
+        dados['paciente_prontuario'] = paciente.prontuario
+    barramento_eventos.publicar(CANAL_MOVIMENTACOES, tipo_evento, dados)
+
 @app.route('/api/movimentacoes', methods=['POST'])
 @csrf.exempt
 @api_login_required
+@manter_carregados
+@orcamento_consultas(4)
 def criar_movimentacao():
     """Cria uma nova movimentação para um paciente"""
     try:
@@ -1076,8 +1292,9 @@ def criar_movimentacao():
         )
         
         app.logger.info(f"Movimentação criada: ID {nova_movimentacao.id} para paciente {paciente.nome}")
+        publicar_movimentacao('movimentacao_criada', nova_movimentacao, paciente)
         
-        return jsonify(nova_movimentacao.to_dict()), 201
+        return resposta_json(serializacao.MOVIMENTACAO.de_objeto(nova_movimentacao), 201)
         
     except Exception as e:
         db.session.rollback()
@@ -1087,28 +1304,159 @@ def criar_movimentacao():
 @app.route('/api/movimentacoes/paciente/<int:paciente_id>', methods=['GET'])
 @csrf.exempt
 @api_login_required
+@orcamento_consultas(2)
 def listar_movimentacoes_paciente(paciente_id):
-    """Lista todas as movimentações de um paciente"""
+    """
+    Lista as movimentações de um paciente, mais recentes primeiro; aceita ?fields=.
+    Com ?limite= (e ?cursor= nas páginas seguintes) pagina por keyset e informa
+    a próxima página no cabeçalho X-Proximo-Cursor. Responde 304 se o
+    If-None-Match bater com o ETag.
+    """
     try:
-        # Verificar se o paciente existe
-        paciente = Paciente.query.get(paciente_id)
-        if not paciente:
+        campos = serializacao.MOVIMENTACAO.selecionar(request.args.get('fields'))
+        limite = request.args.get('limite', type=int)
+        cursor = request.args.get('cursor')
+        if cursor and limite is None:
+            limite = historico.LIMITE_PADRAO
+        
+        # A versão também confirma que o paciente existe
+        versao = historico.versao_paciente(paciente_id)
+        if versao is None:
             return jsonify({'error': 'Paciente não encontrado'}), 404
         
-        # Buscar movimentações do paciente (apenas as ativas para exclusão física)
-        movimentacoes = Movimentacao.query.filter(
-            Movimentacao.paciente_id == paciente_id
-        ).order_by(Movimentacao.data_entrada.desc()).all()
+        def renderizar():
+            movimentacoes, proximo_cursor = historico.pagina_movimentacoes(paciente_id, campos, limite, cursor)
+            return movimentacoes, ({'X-Proximo-Cursor': proximo_cursor} if proximo_cursor else {})
+        
+        return cache_respostas.responder(versao, renderizar, grupos=(('paciente', paciente_id),))
         
-        return jsonify([mov.to_dict() for mov in movimentacoes])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
         app.logger.error(f"Erro ao listar movimentações do paciente {paciente_id}: {str(e)}")
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@app.route('/api/movimentacoes/eventos', methods=['GET'])
+@csrf.exempt
+@api_login_required
+def eventos_movimentacoes():
+    """
+    Fluxo Server-Sent Events com as alterações de movimentações (criada,
+    atualizada, excluída). Filtro opcional: ?tipo=emergencia. Ao reconectar, o
+    navegador envia Last-Event-ID e recebe os eventos perdidos; se o histórico
+    não os tiver mais, recebe o evento 'recarregar'.
+    
+    Cada fluxo prende uma thread do worker: acima de EVENTOS_SSE_MAXIMO fluxos
+    abertos a resposta é 503 e a tela passa a usar /api/movimentacoes/eventos/recentes.
+    """
+    tipo = request.args.get('tipo')
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_evento')
+    keepalive = app.config['EVENTOS_SSE_KEEPALIVE_SEGUNDOS']
+    prazo = time.monotonic() + app.config['EVENTOS_SSE_DURACAO_SEGUNDOS']
+    
+    assinatura = barramento_eventos.abrir_fluxo(CANAL_MOVIMENTACOES)
+    if assinatura is None:
+        intervalo = app.config['EVENTOS_CONSULTA_INTERVALO_SEGUNDOS']
+        return jsonify({
+            'error': 'Limite de conexões ao vivo atingido; consulte /api/movimentacoes/eventos/recentes',
+            'intervalo': intervalo
+        }), 503, {'Retry-After': str(intervalo)}
+    perdidos = barramento_eventos.eventos_desde(CANAL_MOVIMENTACOES, ultimo_id) if ultimo_id else []
+    
+    def fluxo():
+        try:
+            yield "retry: 3000\n\n"
+            if perdidos is None:
+                yield "event: recarregar\ndata: {}\n\n"
+            else:
+                for evento in perdidos:
+                    if not tipo or evento.dados.get('tipo') == tipo:
+                        yield evento.sse
+            while time.monotonic() < prazo:
+                evento = assinatura.obter(timeout=keepalive)
+                if assinatura.perdeu_eventos:
+                    # Fila do cliente transbordou: pede recarga completa e encerra
+                    yield "event: recarregar\ndata: {}\n\n"
+                    return
+                if evento is None:
+                    yield ": keepalive\n\n"
+                elif not tipo or evento.dados.get('tipo') == tipo:
+                    yield evento.sse
+        finally:
+            assinatura.cancelar()
+    
+    resposta = Response(fluxo(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Libera a vaga também quando o cliente desconecta antes do primeiro bloco
+    resposta.call_on_close(assinatura.cancelar)
+    return resposta
+
+@app.route('/api/movimentacoes/eventos/recentes', methods=['GET'])
+@csrf.exempt
+@api_login_required
+def eventos_movimentacoes_recentes():
+    """
+    Alternativa por consulta ao fluxo SSE (navegador sem EventSource ou worker
+    sem vaga para mais fluxos): eventos posteriores a ?ultimo_evento=<id>.
+    Sem o parâmetro, só informa o ponto de partida ('' = histórico ainda vazio,
+    e na próxima consulta vem tudo o que chegou). 'recarregar' indica que o id
+    não está mais no histórico.
+    """
+    tipo = request.args.get('tipo')
+    ultimo_id = request.args.get('ultimo_evento')
+    
+    eventos = barramento_eventos.eventos_desde(CANAL_MOVIMENTACOES, ultimo_id) if ultimo_id is not None else []
+    recarregar = eventos is None
+    if ultimo_id is None or recarregar:
+        eventos, ultimo_id = [], barramento_eventos.ultimo_evento(CANAL_MOVIMENTACOES) or ''
+    elif eventos:
+        ultimo_id = eventos[-1].id
+    
+    return jsonify({
+        'eventos': [
+            {'id': evento.id, 'tipo': evento.tipo, 'dados': evento.dados}
+            for evento in eventos if not tipo or evento.dados.get('tipo') == tipo
+        ],
+        'recarregar': recarregar,
+        'ultimo_evento': ultimo_id,
+        'intervalo': app.config['EVENTOS_CONSULTA_INTERVALO_SEGUNDOS']
+    })
+
+@app.route('/api/fila', methods=['GET'])
+@csrf.exempt
+@api_login_required
+@orcamento_consultas(1)
+def consultar_fila():
+    """
+    Próximos pacientes das filas de atendimento (prioridade, depois chegada) e o
+    tamanho de cada fila. Filtros opcionais: ?tipo=emergencia&status=aguardando_acolhimento&limite=10
+    """
+    try:
+        tipo = request.args.get('tipo') or None
+        status = request.args.get('status') or None
+        try:
+            limite = int(request.args.get('limite', 10))
+        except ValueError:
+            return jsonify({'error': 'limite deve ser um número inteiro'}), 400
+        limite = max(1, min(limite, app.config['FILA_LIMITE_MAXIMO']))
+        
+        return jsonify({
+            'proximos': indice_fila.proximos(limite, tipo, status),
+            'filas': indice_fila.tamanhos(tipo, status)
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Erro ao consultar fila de atendimento: {str(e)}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @app.route('/api/movimentacoes/<int:movimentacao_id>', methods=['PUT'])
 @csrf.exempt
 @api_login_required
+@manter_carregados
+@orcamento_consultas(4)
 def atualizar_movimentacao(movimentacao_id):
     """Atualiza uma movimentação existente"""
     try:
@@ -1135,7 +1483,6 @@ def atualizar_movimentacao(movimentacao_id):
         if 'observacoes' in dados:
             movimentacao.observacoes = dados['observacoes']
         if 'data_saida' in dados and dados['data_saida']:
-            from datetime import datetime
             movimentacao.data_saida = datetime.fromisoformat(dados['data_saida'].replace('Z', '+00:00'))
         
         movimentacao.atualizado_em = datetime.utcnow()
@@ -1149,8 +1496,9 @@ def atualizar_movimentacao(movimentacao_id):
         )
         
         app.logger.info(f"Movimentação atualizada: ID {movimentacao.id}")
+        publicar_movimentacao('movimentacao_atualizada', movimentacao, movimentacao.paciente)
         
-        return jsonify(movimentacao.to_dict())
+        return resposta_json(serializacao.MOVIMENTACAO.de_objeto(movimentacao))
         
     except Exception as e:
         db.session.rollback()
@@ -1160,39 +1508,41 @@ def atualizar_movimentacao(movimentacao_id):
 @app.route('/api/movimentacoes/<int:movimentacao_id>', methods=['DELETE'])
 @csrf.exempt
 @api_login_required
+@manter_carregados
+@orcamento_consultas(3)
 def excluir_movimentacao(movimentacao_id):
     """Exclui permanentemente uma movimentação do banco de dados"""
     try:
-        app.logger.info(f"[DELETE] Tentativa de exclusão da movimentação ID {movimentacao_id}")
-        
-        # Buscar movimentação
-        movimentacao = Movimentacao.query.get(movimentacao_id)
-        if not movimentacao:
+        # Movimentação e nome do paciente (para a auditoria) em uma única consulta
+        linha = db.session.execute(
+            db.select(Movimentacao, Paciente.nome)
+            .outerjoin(Paciente, Paciente.id == Movimentacao.paciente_id)
+            .where(Movimentacao.id == movimentacao_id)
+        ).first()
+        if linha is None:
             app.logger.warning(f"[DELETE] Movimentação ID {movimentacao_id} não encontrada")
             return jsonify({'error': 'Movimentação não encontrada'}), 404
-        
-        app.logger.info(f"[DELETE] Movimentação encontrada: {movimentacao.tipo} - {movimentacao.status}")
+        movimentacao, paciente_nome = linha
         
         # Verificar se pode ser excluída (não finalizada)
         if movimentacao.status == 'finalizado':
             app.logger.warning(f"[DELETE] Tentativa de excluir movimentação finalizada ID {movimentacao_id}")
             return jsonify({'error': 'Não é possível excluir movimentações finalizadas'}), 400
         
-        paciente_nome = movimentacao.paciente.nome if movimentacao.paciente else "Desconhecido"
+        paciente_nome = paciente_nome or "Desconhecido"
+        exclusao = {'id': movimentacao.id, 'paciente_id': movimentacao.paciente_id,
+                    'tipo': movimentacao.tipo, 'status': movimentacao.status}
         
         # EXCLUSÃO FÍSICA - remover completamente do banco
-        app.logger.info(f"[DELETE] Executando exclusão física da movimentação ID {movimentacao_id}")
         db.session.delete(movimentacao)
         db.session.commit()
         
-        app.logger.info(f"[DELETE] Exclusão física concluída para movimentação ID {movimentacao_id}")
+        app.logger.info(
+            f"[DELETE] Movimentação ID {movimentacao_id} excluída",
+            extra={'movimentacao_id': movimentacao_id, 'tipo': exclusao['tipo'], 'status': exclusao['status']}
+        )
         
-        # Verificar se realmente foi excluída
-        verificacao = Movimentacao.query.get(movimentacao_id)
-        if verificacao is None:
-            app.logger.info(f"[DELETE] Verificação confirmada: movimentação ID {movimentacao_id} não existe mais no banco")
-        else:
-            app.logger.error(f"[DELETE] PROBLEMA: movimentação ID {movimentacao_id} ainda existe no banco após exclusão!")
+        barramento_eventos.publicar(CANAL_MOVIMENTACOES, 'movimentacao_excluida', exclusao)
         
         # Log de auditoria
         current_user.registrar_atividade(
@@ -1215,65 +1565,211 @@ def excluir_movimentacao(movimentacao_id):
 @app.route('/api/debug/movimentacoes/paciente/<int:paciente_id>', methods=['GET'])
 @csrf.exempt
 @api_login_required
+@orcamento_consultas(1)
 def debug_movimentacoes_paciente(paciente_id):
     """Debug: Mostra todas as movimentações no banco (incluindo inativas)"""
     try:
-        # Buscar TODAS as movimentações do paciente (incluindo inativas)
-        movimentacoes_ativas = db.session.query(Movimentacao).filter(
-            Movimentacao.paciente_id == paciente_id,
-            Movimentacao.ativo == True
-        ).all()
-        
-        movimentacoes_inativas = db.session.query(Movimentacao).filter(
-            Movimentacao.paciente_id == paciente_id,
-            Movimentacao.ativo == False
+        # Buscar TODAS as movimentações do paciente (incluindo inativas) e contar em memória
+        campos = serializacao.MOVIMENTACAO.padrao
+        linhas = db.session.execute(
+            db.select(*serializacao.MOVIMENTACAO.colunas(campos))
+            .where(Movimentacao.paciente_id == paciente_id)
         ).all()
+        todas_movimentacoes = serializacao.MOVIMENTACAO.de_linhas(linhas, campos)
+        ativas = sum(1 for mov in todas_movimentacoes if mov['ativo'])
         
-        todas_movimentacoes = db.session.query(Movimentacao).filter(
-            Movimentacao.paciente_id == paciente_id
-        ).all()
-        
-        return jsonify({
+        return resposta_json({
             'paciente_id': paciente_id,
             'total_movimentacoes': len(todas_movimentacoes),
-            'movimentacoes_ativas': len(movimentacoes_ativas),
-            'movimentacoes_inativas': len(movimentacoes_inativas),
-            'movimentacoes': [mov.to_dict() for mov in todas_movimentacoes],
+            'movimentacoes_ativas': ativas,
+            'movimentacoes_inativas': len(todas_movimentacoes) - ativas,
+            'movimentacoes': todas_movimentacoes,
             'timestamp_consulta': datetime.utcnow().isoformat()
         })
         
     except Exception as e:
         return jsonify({'error': f'Erro no debug: {str(e)}'}), 500
 
+# ================================
+# MÉTRICAS
+# ================================
+
+@app.route('/metrics')
+@csrf.exempt
+@limiter.exempt
+def exportar_metricas():
+    """
+    Métricas no formato Prometheus. Acesso com Authorization: Bearer
+    METRICAS_TOKEN (coletor) ou, sem token configurado, sessão de administrador.
+    """
+    if not metricas.ativas:
+        return jsonify({'error': 'Métricas desativadas'}), 404
+
+    token = app.config['METRICAS_TOKEN']
+    if token:
+        autorizacao = request.headers.get('Authorization', '')
+        if not comparacao_segura(autorizacao, f'Bearer {token}'):
+            return jsonify({'error': 'Acesso não autorizado'}), 401
+    elif not current_user.is_authenticated or current_user.tipo != 'admin':
+        return jsonify({'status': 'error', 'message': 'Acesso não autorizado!'}), 403
+
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
 # ================================
 # INICIALIZAÇÃO DA APLICAÇÃO
 # ================================
 
+# A importação do módulo não abre conexão nem grava nada em disco (o SQLite
+# relativo só cria instance/ na primeira conexão e as métricas leem os engines
+# na primeira requisição): o esquema e o admin padrão são criados no deploy
+# (`flask inicializar-banco`). A aplicação e as extensões continuam sendo
+# globais do módulo; criar_app() não é uma fábrica, e sim o gancho de preload
+# que aquece essa aplicação única antes do fork dos workers.
+
+_aplicacao_pronta = False
+
+def criar_app():
+    """
+    Gancho de preload dos servidores (gunicorn --preload 'app:criar_app()'):
+    compila os templates e prepara o descarte das conexões herdadas no fork.
+    Devolve sempre a mesma ``app`` do módulo; não cria nem reconfigura aplicações.
+    """
+    global _aplicacao_pronta
+    if _aplicacao_pronta:
+        return app
+    
+    # Carregados uma vez no processo principal e herdados pelos workers (do
+    # bytecode em disco se `flask compilar-templates` rodou no build)
+    cache_fragmentos.compilar_templates()
+    app.url_map.update()
+    with app.app_context():
+        engines = list(db.engines.values())  # Só cria os engines; nenhuma conexão é aberta
+    
+    def descartar_conexoes_herdadas():
+        # Conexões abertas antes do fork pertencem ao processo pai
+        for engine in engines:
+            engine.dispose(close=False)
+    
+    os.register_at_fork(after_in_child=descartar_conexoes_herdadas)
+    _aplicacao_pronta = True
+    app.logger.info('Sistema hospitalar inicializado', extra={'ambiente': config_name})
+    return app
+
+@app.cli.command('inicializar-banco')
 def inicializar_banco():
-    """Inicializa o banco de dados e cria usuário admin"""
+    """Cria as tabelas, aplica as migrações pendentes e cria o admin padrão (executar no deploy)"""
+    aplicadas = migracoes.migrar()
+    click.echo(f"{len(aplicadas)} migração(ões) aplicada(s).")
+    criar_admin_padrao()
+    click.echo("Banco de dados pronto.")
+
+@app.cli.command('compilar-templates')
+def compilar_templates():
+    """Compila todos os templates para o cache de bytecode em disco (executar no build)"""
+    total = cache_fragmentos.compilar_templates()
+    click.echo(f"{total} template(s) compilado(s) em {app.jinja_env.bytecode_cache.directory}.")
+
+@app.cli.command('migrar')
+@click.option('--ate', type=int, default=None, help='Aplica as migrações só até esta versão')
+def migrar(ate):
+    """Aplica as migrações de esquema pendentes (executar no deploy)"""
+    aplicadas = migracoes.migrar(ate)
+    for m in aplicadas:
+        click.echo(f"[{m.versao:03d}] {m.descricao}")
+    click.echo(f"{len(aplicadas)} migração(ões) aplicada(s).")
+
+@app.cli.command('verificar-indices')
+@click.option('--plano', is_flag=True, help='Mostra o plano completo de cada consulta')
+def verificar_indices(plano):
+    """Roda EXPLAIN nas consultas quentes e falha se alguma fizer varredura sequencial"""
+    falhas = 0
+    for resultado in migracoes.verificar_indices():
+        situacao = 'OK' if not resultado.varreduras else f"VARREDURA SEQUENCIAL em {', '.join(resultado.varreduras)}"
+        click.echo(f"{resultado.consulta}: {situacao}")
+        if plano or resultado.varreduras:
+            for linha in resultado.plano:
+                click.echo(f"    {linha}")
+        falhas += bool(resultado.varreduras)
+    if falhas:
+        raise click.ClickException(f"{falhas} consulta(s) sem índice utilizável. Execute 'flask migrar'.")
+
+@app.cli.command('medir-serializacao')
+@click.option('--linhas', type=int, default=5000, help='Máximo de linhas por tabela')
+def medir_serializacao(linhas):
+    """Compara to_dict + jsonify com a projeção de colunas nas tabelas de pacientes e movimentações"""
+    for nome, modelo, esquema in (
+        ('pacientes', Paciente, serializacao.PACIENTE),
+        ('movimentacoes', Movimentacao, serializacao.MOVIMENTACAO)
+    ):
+        resultado = serializacao.comparar(modelo, esquema, linhas)
+        orm, projecao = resultado['orm_to_dict_jsonify'], resultado['projecao_codificar']
+        ganho = orm['ms'] / projecao['ms'] if projecao['ms'] else 0
+        click.echo(
+            f"{nome} ({resultado['linhas']} linhas, {resultado['codificador']}): "
+            f"to_dict+jsonify {orm['ms']} ms / {orm['bytes']} B, "
+            f"projeção {projecao['ms']} ms / {projecao['bytes']} B ({ganho:.1f}x)"
+        )
+
+@app.cli.command('importar-ceps')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+def importar_ceps(arquivo):
+    """Importa uma base de CEPs em CSV para consulta sem acesso à internet"""
+    total = resolvedor_cep.importar(arquivo)
+    click.echo(f"{total} CEPs importados.")
+
+@app.cli.command('reprocessar-auditoria')
+def reprocessar_auditoria():
+    """Grava no banco os registros de auditoria que ficaram no arquivo de pendências"""
+    total = gravador_auditoria.reprocessar_arquivo()
+    click.echo(f"{total} registros de auditoria reprocessados.")
+
+@app.cli.command('exportar')
+@click.argument('entidade', type=click.Choice(['pacientes', 'enderecos', 'movimentacoes']))
+@click.argument('saida', type=click.Path(dir_okay=False, writable=True))
+@click.option('--formato', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--desde', help='Exporta só o que foi alterado a partir desta data (ISO 8601)')
+@click.option('--gzip', 'compactar', is_flag=True, help='Compacta a saída com gzip')
+def exportar_cli(entidade, saida, formato, desde, compactar):
+    """Exporta uma tabela em fluxo para um arquivo NDJSON ou CSV"""
+    ate = datetime.utcnow()
     try:
-        with app.app_context():
-            # Criar tabelas do banco de dados se não existirem
-            app.logger.info("Criando tabelas do banco de dados...")
-            db.create_all()
-            app.logger.info("Tabelas criadas com sucesso!")
-            
-            # Criar usuário admin padrão se não existir
-            app.logger.info("Verificando usuário admin...")
-            criar_admin_padrao()
-            app.logger.info("Inicialização do banco concluída!")
-            
-    except Exception as e:
-        app.logger.error(f"Erro na inicialização do banco: {str(e)}")
-        import traceback
-        app.logger.error(traceback.format_exc())
+        conteudo = gerar_exportacao(entidade, formato, desde=interpretar_data(desde), ate=ate, compactar=compactar)
+    except ErroExportacao as e:
+        raise click.UsageError(str(e))
+    with open(saida, 'wb') as f:
+        for bloco in conteudo:
+            f.write(bloco)
+    click.echo(f"Exportação concluída. Use --desde {ate.isoformat()} na próxima extração incremental.")
 
-# Inicializar banco sempre que o módulo for carregado
-inicializar_banco()
+@app.cli.command('importar-pacientes')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), help='Padrão: pela extensão do arquivo')
+@click.option('--lote', default=1000, show_default=True, help='Registros por transação')
+def importar_pacientes_cli(arquivo, formato, lote):
+    """Importa pacientes em lote a partir de um arquivo CSV ou NDJSON"""
+    formato = formato or detectar_formato(arquivo)
+    if not formato:
+        raise click.UsageError('Não foi possível detectar o formato; use --formato csv|ndjson')
+    
+    importador = ImportadorPacientes(alocador_prontuario, tamanho_lote=lote)
+    
+    def acompanhar(eventos):
+        for evento in eventos:
+            click.echo(f"Lote {evento['lote']}: {evento['importados']}/{evento['lidos']} importados")
+            if evento.get('falha'):
+                click.echo(f"  {evento['falha']}", err=True)
+            for erro in evento['erros']:
+                click.echo(f"  linha {erro['linha']}: {erro['erro']}", err=True)
+            yield evento
+    
+    with open(arquivo, encoding='utf-8-sig', newline='') as f:
+        resumo = resumir(acompanhar(importador.importar(f, formato)), limite_erros=0)
+    click.echo(f"{resumo['importados']} pacientes importados, {resumo['duplicados']} duplicados, "
+               f"{resumo['total_erros']} linhas com erro (de {resumo['lidos']} lidas).")
 
 if __name__ == '__main__':
     # Configuração para produção e desenvolvimento
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    criar_app().run(host='0.0.0.0', port=port, debug=debug)
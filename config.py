@@ -1,6 +1,65 @@
 import os
 from datetime import timedelta
 
+def opcoes_engine(url):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS do PostgreSQL, calculadas por worker do gunicorn.
+    
+    Cada worker tem uma conexão por thread (GUNICORN_THREADS) mais uma para as
+    threads de fundo (auditoria, fila). O excedente é o que sobra do limite total
+    DB_CONEXOES_MAXIMO dividido entre os WEB_CONCURRENCY workers: um pico de
+    requisições espera DB_POOL_TIMEOUT por uma conexão em vez de esgotar o servidor.
+    """
+    if not url or not url.startswith('postgresql'):
+        return {}
+    
+    workers = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+    threads = max(1, int(os.environ.get('GUNICORN_THREADS', 16)))  # Mesmo padrão do Procfile
+    por_worker = max(1, int(os.environ.get('DB_CONEXOES_MAXIMO', 20)) // workers)
+    tamanho = int(os.environ.get('DB_POOL_TAMANHO', min(threads + 1, por_worker)))
+    excedente = int(os.environ.get('DB_POOL_EXCEDENTE', max(0, por_worker - tamanho)))
+    
+    connect_args = {
+        'connect_timeout': int(os.environ.get('DB_TIMEOUT_CONEXAO', 5)),
+        'application_name': os.environ.get('DB_NOME_APLICACAO', 'sistema-hospitalar'),
+        # Detecta conexões mortas por firewall/NAT sem esperar o timeout do TCP
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 3,
+    }
+    if os.environ.get('DB_PGBOUNCER', 'false').lower() != 'true':
+        # O PgBouncer em modo transação recusa parâmetros de inicialização; atrás
+        # dele os timeouts ficam no papel (ALTER ROLE ... SET statement_timeout).
+        # O psycopg2 não usa prepared statements no servidor, então nada mais muda.
+        connect_args['options'] = (
+            f"-c statement_timeout={int(os.environ.get('DB_TIMEOUT_CONSULTA_MS', 15000))} "
+            f"-c idle_in_transaction_session_timeout={int(os.environ.get('DB_TIMEOUT_TRANSACAO_OCIOSA_MS', 60000))}"
+        )
+    
+    return {
+        'pool_size': tamanho,
+        'max_overflow': excedente,
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECICLAR_SEGUNDOS', 1800)),
+        'pool_pre_ping': True,  # Descarta conexões derrubadas (failover, reinício do banco)
+        'pool_use_lifo': True,  # Conexões ociosas em excesso ficam paradas e são recicladas
+        'connect_args': connect_args,
+    }
+
+def url_sqlite_absoluta(url, pasta_instancia):
+    """
+    SQLite com caminho relativo (sqlite:///hospital.db) resolvido para a pasta
+    instance/, como faria o Flask-SQLAlchemy, mas sem criar a pasta: ela só é
+    criada na primeira conexão, nunca ao importar a aplicação.
+    """
+    if not url or not url.startswith('sqlite:///') or url in ('sqlite://', 'sqlite:///:memory:'):
+        return url
+    caminho = url[len('sqlite:///'):]
+    if not caminho or caminho == ':memory:' or caminho.startswith('file:') or os.path.isabs(caminho):
+        return url
+    return 'sqlite:///' + os.path.join(pasta_instancia, caminho)
+
 class Config:
     """Configurações base da aplicação"""
     
@@ -16,8 +75,98 @@ class Config:
     # Configurações de banco de dados
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # Rate limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'memory://')
+    # Rate limiting: com REDIS_URL os limites valem para todos os workers e máquinas
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or os.environ.get('REDIS_URL', 'memory://')
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'fixed-window')  # moving-window, sliding-window-counter
+    RATELIMIT_KEY_PREFIX = 'hospital'
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True  # Redis fora do ar: limita por worker em vez de falhar
+    
+    # Bloqueio de login por tentativas erradas (ver services/bloqueios.py): banco, memoria ou redis://
+    BLOQUEIO_ARMAZENAMENTO = os.environ.get('BLOQUEIO_ARMAZENAMENTO') or os.environ.get('REDIS_URL', 'banco')
+    BLOQUEIO_TENTATIVAS = int(os.environ.get('BLOQUEIO_TENTATIVAS', 3))
+    BLOQUEIO_MINUTOS = int(os.environ.get('BLOQUEIO_MINUTOS', 15))
+    
+    # Autenticação
+    SENHA_VALIDADE_DIAS = int(os.environ.get('SENHA_VALIDADE_DIAS', 90))
+    USUARIO_CACHE_TTL_SEGUNDOS = int(os.environ.get('USUARIO_CACHE_TTL_SEGUNDOS', 30))
+    
+    # Senhas: bcrypt num pool de processos por worker (ver services/senhas.py)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))  # Alterar regrava o hash no próximo login
+    SENHAS_PROCESSOS = int(os.environ.get(
+        'SENHAS_PROCESSOS', max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', 1))))
+    ))
+    SENHAS_CONCORRENCIA = int(os.environ.get('SENHAS_CONCORRENCIA', 2 * max(1, SENHAS_PROCESSOS)))
+    SENHAS_ESPERA_SEGUNDOS = float(os.environ.get('SENHAS_ESPERA_SEGUNDOS', 3))
+    SENHAS_PRIORIDADE = int(os.environ.get('SENHAS_PRIORIDADE', 5))  # Incremento de nice dos processos
+    
+    # Consulta de CEP (cache em memória, tabela local e ViaCEP)
+    CEP_URL = os.environ.get('CEP_URL', 'https://viacep.com.br/ws/{cep}/json/')
+    CEP_CACHE_TAMANHO = int(os.environ.get('CEP_CACHE_TAMANHO', 4096))
+    CEP_CACHE_TTL_SEGUNDOS = int(os.environ.get('CEP_CACHE_TTL_SEGUNDOS', 6 * 3600))
+    CEP_VALIDADE_DIAS = int(os.environ.get('CEP_VALIDADE_DIAS', 180))  # Revalida CEPs vindos da ViaCEP
+    CEP_TIMEOUT_CONEXAO = float(os.environ.get('CEP_TIMEOUT_CONEXAO', 1.5))
+    CEP_TIMEOUT_LEITURA = float(os.environ.get('CEP_TIMEOUT_LEITURA', 2.5))
+    CEP_FALHAS_PARA_ABRIR = int(os.environ.get('CEP_FALHAS_PARA_ABRIR', 5))
+    CEP_TEMPO_ABERTO_SEGUNDOS = int(os.environ.get('CEP_TEMPO_ABERTO_SEGUNDOS', 30))
+    
+    # Logs da aplicação (JSON, gravados fora da thread da requisição)
+    LOG_NIVEL = os.environ.get('LOG_NIVEL', 'INFO')
+    LOG_NIVEIS = os.environ.get('LOG_NIVEIS', 'sqlalchemy.engine=WARNING')  # 'logger=NIVEL,...'
+    LOG_FORMATO = os.environ.get('LOG_FORMATO', 'json')  # json ou texto
+    LOG_ARQUIVO = os.environ.get('LOG_ARQUIVO', 'logs/hospital.log')  # Vazio: só console
+    LOG_TAMANHO_MAXIMO = int(os.environ.get('LOG_TAMANHO_MAXIMO', 20 * 1024 * 1024))
+    LOG_ARQUIVOS = int(os.environ.get('LOG_ARQUIVOS', 5))
+    LOG_FILA_TAMANHO = int(os.environ.get('LOG_FILA_TAMANHO', 10000))
+    LOG_AMOSTRA_DEBUG = float(os.environ.get('LOG_AMOSTRA_DEBUG', 0.01))  # Fração das requisições com DEBUG
+    LOG_ACESSO = os.environ.get('LOG_ACESSO', 'true').lower() == 'true'
+    
+    # Métricas de desempenho (GET /metrics e cabeçalho Server-Timing)
+    METRICAS_ATIVAS = os.environ.get('METRICAS_ATIVAS', 'true').lower() == 'true'
+    METRICAS_SERVER_TIMING = os.environ.get('METRICAS_SERVER_TIMING', 'true').lower() == 'true'
+    METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')  # Bearer do coletor; sem ele, só administradores
+    
+    # Perfil de consultas por requisição: N+1, consultas lentas com EXPLAIN e orçamentos por rota
+    CONSULTAS_PERFIL = os.environ.get('CONSULTAS_PERFIL', 'false').lower() == 'true'
+    CONSULTAS_LENTAS_MS = float(os.environ.get('CONSULTAS_LENTAS_MS', 100))
+    CONSULTAS_REPETICOES_N1 = int(os.environ.get('CONSULTAS_REPETICOES_N1', 5))
+    CONSULTAS_ORCAMENTO_ESTRITO = os.environ.get('CONSULTAS_ORCAMENTO_ESTRITO', 'false').lower() == 'true'
+    
+    # Log de auditoria (gravação assíncrona em lotes)
+    AUDITORIA_ASSINCRONA = True
+    AUDITORIA_FILA_TAMANHO = int(os.environ.get('AUDITORIA_FILA_TAMANHO', 10000))
+    AUDITORIA_LOTE = int(os.environ.get('AUDITORIA_LOTE', 200))
+    AUDITORIA_INTERVALO_SEGUNDOS = float(os.environ.get('AUDITORIA_INTERVALO_SEGUNDOS', 1.0))
+    AUDITORIA_POLITICA_EXCESSO = os.environ.get('AUDITORIA_POLITICA_EXCESSO', 'arquivo')  # bloquear, arquivo, descartar
+    AUDITORIA_ARQUIVO_EXCESSO = os.environ.get('AUDITORIA_ARQUIVO_EXCESSO', 'logs/auditoria_pendente.jsonl')
+    
+    # Eventos em tempo real (SSE); 'memoria' ou URL do Redis para vários workers
+    EVENTOS_BACKEND = os.environ.get('EVENTOS_BACKEND', 'memoria')
+    EVENTOS_FILA_ASSINANTE = int(os.environ.get('EVENTOS_FILA_ASSINANTE', 100))
+    EVENTOS_HISTORICO = int(os.environ.get('EVENTOS_HISTORICO', 500))
+    EVENTOS_SSE_KEEPALIVE_SEGUNDOS = int(os.environ.get('EVENTOS_SSE_KEEPALIVE_SEGUNDOS', 15))
+    EVENTOS_SSE_DURACAO_SEGUNDOS = int(os.environ.get('EVENTOS_SSE_DURACAO_SEGUNDOS', 300))  # O navegador reconecta sozinho
+    # Fluxos SSE por worker (cada um prende uma thread); as telas excedentes consultam em intervalos
+    EVENTOS_SSE_MAXIMO = int(os.environ.get(
+        'EVENTOS_SSE_MAXIMO', max(1, int(os.environ.get('GUNICORN_THREADS', 16)) // 4)
+    ))
+    EVENTOS_CONSULTA_INTERVALO_SEGUNDOS = int(os.environ.get('EVENTOS_CONSULTA_INTERVALO_SEGUNDOS', 10))
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))  # Workers do gunicorn (lido por ele também)
+    
+    # Filas de atendimento em memória (reconstruídas do banco periodicamente)
+    FILA_RESSINCRONIZAR_SEGUNDOS = int(os.environ.get('FILA_RESSINCRONIZAR_SEGUNDOS', 60))
+    FILA_LIMITE_MAXIMO = int(os.environ.get('FILA_LIMITE_MAXIMO', 200))
+    
+    # Cache (por worker) dos corpos JSON das rotas de leitura; 0 desativa, mantendo os 304
+    CACHE_RESPOSTAS_MAXIMO = int(os.environ.get('CACHE_RESPOSTAS_MAXIMO', 512))
+    CACHE_RESPOSTAS_TAMANHO_MAXIMO = int(os.environ.get('CACHE_RESPOSTAS_TAMANHO_MAXIMO', 256 * 1024))  # bytes por corpo
+    
+    # Catálogo de módulos: status pela verificação de saúde em segundo plano
+    MODULOS_SAUDE_INTERVALO_SEGUNDOS = int(os.environ.get('MODULOS_SAUDE_INTERVALO_SEGUNDOS', 30))  # 0 desativa
+    MODULOS_MANUTENCAO = os.environ.get('MODULOS_MANUTENCAO', 'it')  # ids separados por vírgula
+    
+    # Templates: bytecode do Jinja em disco e fragmentos renderizados por perfil
+    TEMPLATES_CACHE_PASTA = os.environ.get('TEMPLATES_CACHE_PASTA')  # Padrão: instance/jinja
+    FRAGMENTOS_MAXIMO = int(os.environ.get('FRAGMENTOS_MAXIMO', 256))  # 0 desativa
     
     # Configurações de segurança
     WTF_CSRF_TIME_LIMIT = None
@@ -39,6 +188,7 @@ class ProductionConfig(Config):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
     
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///hospital.db'
+    SQLALCHEMY_ENGINE_OPTIONS = opcoes_engine(database_url)
     
     # Configurações de segurança aprimoradas
     SESSION_COOKIE_SECURE = True
@@ -51,6 +201,15 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    AUDITORIA_ASSINCRONA = False
+    BCRYPT_LOG_ROUNDS = 4
+    SENHAS_PROCESSOS = 0  # bcrypt na própria thread
+    RATELIMIT_STORAGE_URI = 'memory://'
+    BLOQUEIO_ARMAZENAMENTO = 'memoria'
+    LOG_ARQUIVO = ''  # Só console: a suíte não cria logs/ na árvore
+    MODULOS_SAUDE_INTERVALO_SEGUNDOS = 0  # Sem thread de saúde; chame registro_modulos.verificar()
+    CONSULTAS_PERFIL = True
+    CONSULTAS_ORCAMENTO_ESTRITO = True  # Rota acima do orçamento de consultas falha o teste
 
 # Dicionário de configurações
 config = {
@@ -1,10 +1,188 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
+"""
+Acesso direto ao PostgreSQL (psycopg2) para relatórios e scripts
+
+As conexões saem de um pool, nunca de um ``psycopg2.connect`` por chamada:
+
+- dentro da aplicação Flask, do mesmo engine do SQLAlchemy (mesmo pool,
+  mesmas opções de ``config.opcoes_engine``)
+- fora dela (scripts), de um engine próprio criado na primeira chamada a
+  partir de DATABASE_URL, com as mesmas opções de produção
+
+Uso::
+
+    from database import cursor, consultar, iterar, inserir_lote
+
+    with cursor(dicionario=True) as cur:
+        cur.execute('SELECT id, nome FROM pacientes WHERE id = %s', (7,))
+        paciente = cur.fetchone()
+
+    for linha in iterar('SELECT * FROM movimentacoes'):  # cursor no servidor
+        ...
+
+    inserir_lote('INSERT INTO sequencias (nome, valor) VALUES %s', linhas)
+
+A transação é confirmada ao sair do bloco e desfeita se houver exceção; a
+conexão volta ao pool nos dois casos. O SQL é o do psycopg2 (``%s``).
+"""
+from contextlib import contextmanager
+import os
+import threading
+import uuid
+
+from flask import current_app, has_app_context
+
+TAMANHO_LOTE = 2000  # Linhas por ida ao servidor nos cursores do lado do servidor
+
+_engine_local = None
+_pid = None
+_lock = threading.Lock()
+
+
+class AcessoDiretoIndisponivel(RuntimeError):
+    """Banco configurado não é PostgreSQL (o acesso direto usa o psycopg2)"""
+
+
+def url_do_ambiente():
+    """DATABASE_URL com o prefixo aceito pelo SQLAlchemy"""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        raise AcessoDiretoIndisponivel('DATABASE_URL não definida')
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def obter_engine():
+    """Engine da aplicação, se houver contexto Flask; senão o engine dos scripts"""
+    if has_app_context():
+        engine = current_app.extensions['sqlalchemy'].engine
+    else:
+        engine = _engine_dos_scripts()
+    if engine.dialect.name != 'postgresql':
+        raise AcessoDiretoIndisponivel(f'Acesso direto requer PostgreSQL (configurado: {engine.dialect.name})')
+    return engine
+
+
+def _engine_dos_scripts():
+    global _engine_local, _pid
+    if _engine_local is not None and _pid == os.getpid():
+        return _engine_local
+    with _lock:
+        if _engine_local is not None and _pid != os.getpid():
+            # Conexões herdadas do processo pai ficam com ele
+            _engine_local.dispose(close=False)
+            _pid = os.getpid()
+        if _engine_local is None:
+            from sqlalchemy import create_engine
+            from config import opcoes_engine
+
+            url = url_do_ambiente()
+            _engine_local = create_engine(url, **opcoes_engine(url))
+            _pid = os.getpid()
+        return _engine_local
+
+
+def encerrar():
+    """Fecha as conexões do engine dos scripts (o da aplicação é do Flask-SQLAlchemy)"""
+    global _engine_local, _pid
+    with _lock:
+        if _engine_local is not None:
+            _engine_local.dispose()
+            _engine_local = None
+            _pid = None
+
+
+# ================================
+# CONEXÕES E CURSORES
+# ================================
+
+@contextmanager
+def conexao():
+    """Conexão psycopg2 do pool, com commit ao sair do bloco e rollback em caso de erro"""
+    conn = obter_engine().raw_connection()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()  # Devolve ao pool
+
+
+@contextmanager
+def cursor(dicionario=False, servidor=False, tamanho_lote=TAMANHO_LOTE):
+    """
+    Cursor numa conexão do pool. ``dicionario`` usa RealDictCursor;
+    ``servidor`` abre um cursor nomeado, que traz ``tamanho_lote`` linhas
+    por vez em vez do resultado inteiro (leituras grandes).
+    """
+    from psycopg2.extras import RealDictCursor
+
+    with conexao() as conn:
+        opcoes = {'cursor_factory': RealDictCursor} if dicionario else {}
+        if servidor:
+            opcoes['name'] = f'cursor_{uuid.uuid4().hex}'
+        cur = conn.cursor(**opcoes)
+        if servidor:
+            cur.itersize = tamanho_lote
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+# ================================
+# ATALHOS
+# ================================
+
+def consultar(sql, parametros=None, dicionario=True):
+    """Todas as linhas de uma consulta (resultados pequenos)"""
+    with cursor(dicionario=dicionario) as cur:
+        cur.execute(sql, parametros)
+        return cur.fetchall()
+
+
+def iterar(sql, parametros=None, dicionario=True, tamanho_lote=TAMANHO_LOTE):
+    """Linhas de uma consulta grande, lidas em lotes por um cursor no servidor"""
+    with cursor(dicionario=dicionario, servidor=True, tamanho_lote=tamanho_lote) as cur:
+        cur.execute(sql, parametros)
+        yield from cur
+
+
+def executar(sql, parametros=None):
+    """Executa um comando e retorna o número de linhas afetadas"""
+    with cursor() as cur:
+        cur.execute(sql, parametros)
+        return cur.rowcount
+
+
+def inserir_lote(sql, linhas, modelo=None, tamanho_pagina=1000):
+    """
+    Insere muitas linhas com ``execute_values`` (um INSERT com várias tuplas
+    por página, em vez de um comando por linha). ``sql`` tem um único
+    ``VALUES %s``; retorna o número de linhas enviadas.
+    """
+    from psycopg2.extras import execute_values
+
+    total = 0
+    with cursor() as cur:
+        pagina = []
+        for linha in linhas:
+            pagina.append(linha)
+            if len(pagina) >= tamanho_pagina:
+                execute_values(cur, sql, pagina, template=modelo, page_size=tamanho_pagina)
+                total += len(pagina)
+                pagina = []
+        if pagina:
+            execute_values(cur, sql, pagina, template=modelo, page_size=tamanho_pagina)
+            total += len(pagina)
+    return total
+
 
 def get_db_connection():
-    return psycopg2.connect(
-        host="localhost",
-        database="hospital",
-        user="postgres",
-        password="sua_senha_aqui"  # Substitua pela senha que você definiu
-    )
+    """
+    Compatibilidade com os scripts antigos: conexão psycopg2 do pool.
+    ``close()`` a devolve ao pool; prefira ``with conexao()``.
+    """
+    return obter_engine().raw_connection()
@@ -0,0 +1,262 @@
+"""
+Motor de busca de pacientes
+
+- CPF e prontuário exatos são resolvidos por igualdade em colunas indexadas
+- Nome usa a coluna ``nome_normalizado`` (sem acentos, minúscula) com casamento
+  por prefixo de cada palavra: FTS5 no SQLite e trigramas (pg_trgm) no PostgreSQL
+- Resultados paginados por keyset (nome_normalizado, id) com limite máximo
+"""
+from collections import namedtuple
+import base64
+import json
+import logging
+import re
+
+from sqlalchemy import inspect
+
+from database.models import db, Paciente, normalizar_nome
+
+logger = logging.getLogger(__name__)
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+TETO_CONTAGEM = 1000  # Acima disso o total é apenas uma estimativa ("1000 ou mais")
+
+ResultadoBusca = namedtuple('ResultadoBusca', 'pacientes proximo_cursor total total_exato')
+
+_somente_documento = re.compile(r'^[\d.\-/\s]+$')
+_fts5_por_banco = {}
+
+
+# ================================
+# INSTALAÇÃO DOS ÍNDICES
+# ================================
+
+def instalar_indices_busca():
+    """Garante a coluna nome_normalizado preenchida e os índices de busca do dialeto atual"""
+    colunas = {c['name'] for c in inspect(db.engine).get_columns('pacientes')}
+    if 'nome_normalizado' not in colunas:
+        logger.info("Adicionando coluna pacientes.nome_normalizado...")
+        db.session.execute(db.text('ALTER TABLE pacientes ADD COLUMN nome_normalizado VARCHAR(100)'))
+        db.session.commit()
+
+    _preencher_nomes_normalizados()
+
+    db.session.execute(db.text(
+        'CREATE INDEX IF NOT EXISTS ix_pacientes_nome_normalizado_id ON pacientes (nome_normalizado, id)'
+    ))
+    db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_pacientes_cpf ON pacientes (cpf)'))
+    db.session.commit()
+
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        _instalar_fts5()
+    elif dialeto == 'postgresql':
+        _instalar_trigramas()
+
+
+def _preencher_nomes_normalizados(lote=1000):
+    """Calcula nome_normalizado para registros antigos, em lotes"""
+    tabela = Paciente.__table__
+    while True:
+        linhas = db.session.execute(
+            db.select(tabela.c.id, tabela.c.nome)
+            .where(tabela.c.nome_normalizado.is_(None))
+            .limit(lote)
+        ).all()
+        if not linhas:
+            break
+        db.session.execute(
+            tabela.update().where(tabela.c.id == db.bindparam('_id')),
+            [{'_id': id_, 'nome_normalizado': normalizar_nome(nome)} for id_, nome in linhas]
+        )
+        db.session.commit()
+        logger.info(f"nome_normalizado preenchido para {len(linhas)} pacientes")
+
+
+def _instalar_fts5():
+    """Cria a tabela FTS5 externa sobre pacientes e os gatilhos de sincronização"""
+    try:
+        existia = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pacientes_fts'"
+        )).first() is not None
+
+        db.session.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5("
+            "nome_normalizado, content='pacientes', content_rowid='id', tokenize='unicode61')"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS pacientes_fts_ai AFTER INSERT ON pacientes BEGIN "
+            "INSERT INTO pacientes_fts(rowid, nome_normalizado) VALUES (new.id, new.nome_normalizado); END"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS pacientes_fts_ad AFTER DELETE ON pacientes BEGIN "
+            "INSERT INTO pacientes_fts(pacientes_fts, rowid, nome_normalizado) "
+            "VALUES ('delete', old.id, old.nome_normalizado); END"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS pacientes_fts_au AFTER UPDATE OF nome_normalizado ON pacientes BEGIN "
+            "INSERT INTO pacientes_fts(pacientes_fts, rowid, nome_normalizado) "
+            "VALUES ('delete', old.id, old.nome_normalizado); "
+            "INSERT INTO pacientes_fts(rowid, nome_normalizado) VALUES (new.id, new.nome_normalizado); END"
+        ))
+        if not existia:
+            db.session.execute(db.text("INSERT INTO pacientes_fts(pacientes_fts) VALUES ('rebuild')"))
+        db.session.commit()
+        _fts5_por_banco.pop(str(db.engine.url), None)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"FTS5 indisponível, busca por nome usará LIKE: {str(e)}")
+
+
+def _instalar_trigramas():
+    """Cria a extensão pg_trgm e o índice GIN de trigramas sobre nome_normalizado"""
+    try:
+        db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.execute(db.text(
+            'CREATE INDEX IF NOT EXISTS ix_pacientes_nome_normalizado_trgm '
+            'ON pacientes USING gin (nome_normalizado gin_trgm_ops)'
+        ))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"pg_trgm indisponível, busca por nome sem índice de trigramas: {str(e)}")
+
+
+def _fts5_disponivel():
+    """Verifica (uma vez por processo e banco) se a tabela pacientes_fts existe"""
+    chave = str(db.engine.url)
+    if chave not in _fts5_por_banco:
+        _fts5_por_banco[chave] = db.engine.dialect.name == 'sqlite' and db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pacientes_fts'"
+        )).first() is not None
+    return _fts5_por_banco[chave]
+
+
+# ================================
+# CLASSIFICAÇÃO DO TERMO
+# ================================
+
+def classificar_termo(termo):
+    """Retorna 'cpf', 'prontuario' ou 'nome' conforme o formato do termo digitado"""
+    if not termo or not _somente_documento.match(termo):
+        return 'nome'
+    digitos = re.sub(r'\D', '', termo)
+    if not digitos:
+        return 'nome'
+    return 'cpf' if len(digitos) == 11 else 'prontuario'
+
+
+def variantes_cpf(termo):
+    """CPF pode estar gravado só com dígitos ou formatado (000.000.000-00)"""
+    digitos = re.sub(r'\D', '', termo)
+    formatado = f"{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}"
+    return [digitos, formatado]
+
+
+def variantes_prontuario(termo):
+    """Prontuários são gerados com 6 dígitos e zeros à esquerda"""
+    digitos = re.sub(r'\D', '', termo)
+    return list({digitos, digitos.zfill(6)})
+
+
+def _filtrar_por_nome(query, termo):
+    tokens = normalizar_nome(termo).split()
+    if not tokens:
+        return query
+
+    if _fts5_disponivel():
+        expressao = ' '.join(f'"{token}"*' for token in tokens)
+        ids = db.select(db.literal_column('rowid')).select_from(db.text('pacientes_fts')) \
+            .where(db.text('pacientes_fts MATCH :expressao').bindparams(expressao=expressao))
+        return query.filter(Paciente.id.in_(ids))
+
+    # PostgreSQL (índice de trigramas) e demais bancos: início do nome ou início de qualquer palavra
+    for token in tokens:
+        query = query.filter(db.or_(
+            Paciente.nome_normalizado.like(f'{token}%'),
+            Paciente.nome_normalizado.like(f'% {token}%')
+        ))
+    return query
+
+
+# ================================
+# PAGINAÇÃO POR KEYSET
+# ================================
+
+def codificar_cursor(nome_normalizado, id_):
+    bruto = json.dumps([nome_normalizado or '', id_]).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    try:
+        nome, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(nome), int(id_)
+    except Exception:
+        raise ValueError('Cursor de paginação inválido')
+
+
+def _contar(query):
+    """Conta até TETO_CONTAGEM + 1 registros; retorna (total, exato)"""
+    limitada = query.order_by(None).with_entities(Paciente.id).limit(TETO_CONTAGEM + 1).subquery()
+    total = db.session.execute(db.select(db.func.count()).select_from(limitada)).scalar()
+    if total > TETO_CONTAGEM:
+        return TETO_CONTAGEM, False
+    return total, True
+
+
+def buscar(termo='', limite=None, cursor=None, tipo=None, colunas=None):
+    """
+    Busca pacientes por CPF, prontuário ou nome.
+    Retorna ResultadoBusca; o total só é calculado na primeira página.
+    Com ``colunas``, os pacientes vêm como tuplas dessas colunas seguidas de
+    (nome_normalizado, id), sem instanciar o ORM.
+    """
+    termo = (termo or '').strip()
+    limite = max(1, min(limite or LIMITE_PADRAO, LIMITE_MAXIMO))
+    tipo = tipo if tipo in ('cpf', 'prontuario', 'nome') else classificar_termo(termo)
+
+    query = Paciente.query
+    if termo:
+        if tipo == 'cpf':
+            query = query.filter(Paciente.cpf.in_(variantes_cpf(termo)))
+        elif tipo == 'prontuario':
+            query = query.filter(Paciente.prontuario.in_(variantes_prontuario(termo)))
+        else:
+            query = _filtrar_por_nome(query, termo)
+
+    total, total_exato = (None, False) if cursor else _contar(query)
+
+    if cursor:
+        nome, id_ = decodificar_cursor(cursor)
+        query = query.filter(db.tuple_(Paciente.nome_normalizado, Paciente.id) > (nome, id_))
+
+    if colunas:
+        query = query.with_entities(*colunas, Paciente.nome_normalizado, Paciente.id)
+    pacientes = query.order_by(Paciente.nome_normalizado, Paciente.id).limit(limite + 1).all()
+
+    proximo_cursor = None
+    if len(pacientes) > limite:
+        pacientes = pacientes[:limite]
+        ultimo = pacientes[-1]
+        if colunas:
+            proximo_cursor = codificar_cursor(ultimo[-2], ultimo[-1])
+        else:
+            proximo_cursor = codificar_cursor(ultimo.nome_normalizado, ultimo.id)
+
+    return ResultadoBusca(pacientes, proximo_cursor, total, total_exato)
+
+
+def versao_pacientes():
+    """
+    Versão da tabela de pacientes para o ETag da busca.
+    Não há exclusão física de pacientes: todo cadastro ou alteração move
+    max(atualizado_em) ou max(id), ambos lidos direto dos índices.
+    """
+    # Um max() por subconsulta: o SQLite só otimiza min/max isolados pelo índice
+    ultima_alteracao, ultimo_id = db.session.execute(db.select(
+        db.select(db.func.max(Paciente.atualizado_em)).scalar_subquery(),
+        db.select(db.func.max(Paciente.id)).scalar_subquery()
+    )).one()
+    return ultima_alteracao, ultimo_id
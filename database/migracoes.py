@@ -0,0 +1,199 @@
+"""
+Migrações de esquema versionadas
+
+``db.create_all()`` só cria tabelas que ainda não existem: colunas e índices
+novos em tabelas existentes nunca chegam ao banco de produção. Cada alteração
+de esquema vira aqui uma função numerada; ``migrar`` aplica as pendentes em
+ordem e registra cada uma na tabela ``versao_esquema``.
+
+As migrações rodam no deploy (``flask migrar``), nunca na importação do módulo,
+e devem ser idempotentes (IF NOT EXISTS / checkfirst), pois um banco criado do
+zero pelo ``create_all`` já nasce com os índices declarados nos modelos.
+
+``verificar_indices`` roda EXPLAIN sobre as consultas dos caminhos quentes e
+aponta as que caem em varredura sequencial (``flask verificar-indices``).
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+import json
+import logging
+import re
+
+from flask import current_app
+
+from database import busca
+from database.models import db, Paciente, Endereco, Movimentacao, VersaoEsquema
+
+logger = logging.getLogger(__name__)
+
+Migracao = namedtuple('Migracao', 'versao descricao aplicar')
+ResultadoPlano = namedtuple('ResultadoPlano', 'consulta plano varreduras')
+
+MIGRACOES = []
+TRAVA_POSTGRES = 742_001  # pg_advisory_lock: um deploy migra por vez
+
+_varredura_sqlite = re.compile(r'^SCAN (\w+)$')
+
+
+def migracao(versao, descricao):
+    """Registra uma função de migração com o número de versão informado"""
+    def registrar(funcao):
+        if any(m.versao == versao for m in MIGRACOES):
+            raise ValueError(f"Migração {versao} registrada duas vezes")
+        MIGRACOES.append(Migracao(versao, descricao, funcao))
+        MIGRACOES.sort(key=lambda m: m.versao)
+        return funcao
+    return registrar
+
+
+def _criar_indices(*nomes):
+    """Cria, se ainda não existirem, índices declarados nos modelos (__table_args__ / index=True)"""
+    declarados = {indice.name: indice for tabela in db.metadata.tables.values() for indice in tabela.indexes}
+    with db.engine.begin() as conn:
+        for nome in nomes:
+            declarados[nome].create(conn, checkfirst=True)
+            logger.info(f"Índice {nome} verificado")
+
+
+# ================================
+# MIGRAÇÕES
+# ================================
+
+@migracao(1, 'Coluna nome_normalizado, índices de busca e FTS5/pg_trgm')
+def _m001_busca_pacientes():
+    busca.instalar_indices_busca()
+
+
+@migracao(2, 'Contador de prontuários (SEQUENCE no PostgreSQL, tabela sequencias nos demais)')
+def _m002_sequencia_prontuario():
+    current_app.extensions['alocador_prontuario'].instalar()
+
+
+@migracao(3, 'Índices dos caminhos quentes: movimentações, endereços, auditoria e exportação')
+def _m003_indices_caminhos_quentes():
+    _criar_indices(
+        'ix_movimentacoes_paciente_data',
+        'ix_movimentacoes_fila_ativas',
+        'ix_movimentacoes_atualizado_em',
+        'ix_enderecos_paciente_principal',
+        'ix_enderecos_atualizado_em',
+        'ix_pacientes_atualizado_em',
+        'ix_log_auditoria_usuario_data',
+        'ix_log_auditoria_data_hora',
+    )
+
+
+# ================================
+# EXECUÇÃO
+# ================================
+
+def versoes_aplicadas():
+    """Conjunto das versões registradas em versao_esquema"""
+    return set(db.session.execute(db.select(VersaoEsquema.versao)).scalars())
+
+
+def pendentes():
+    aplicadas = versoes_aplicadas()
+    return [m for m in MIGRACOES if m.versao not in aplicadas]
+
+
+def migrar(ate=None):
+    """
+    Cria as tabelas ausentes e aplica as migrações pendentes (até a versão
+    ``ate``, se informada). Retorna a lista de migrações aplicadas.
+    """
+    postgres = db.engine.dialect.name == 'postgresql'
+    trava = db.engine.connect() if postgres else None
+    try:
+        if trava is not None:
+            trava.execute(db.text('SELECT pg_advisory_lock(:chave)'), {'chave': TRAVA_POSTGRES})
+
+        db.create_all()
+        aplicadas = []
+        for m in pendentes():
+            if ate is not None and m.versao > ate:
+                break
+            logger.info(f"Aplicando migração {m.versao}: {m.descricao}")
+            m.aplicar()
+            db.session.add(VersaoEsquema(versao=m.versao, descricao=m.descricao))
+            db.session.commit()
+            aplicadas.append(m)
+        return aplicadas
+    finally:
+        if trava is not None:
+            trava.execute(db.text('SELECT pg_advisory_unlock(:chave)'), {'chave': TRAVA_POSTGRES})
+            trava.close()
+
+
+# ================================
+# VERIFICAÇÃO DOS PLANOS
+# ================================
+
+def consultas_quentes():
+    """Consultas frequentes da aplicação, com valores de exemplo, por nome"""
+    from services.exportacao import montar_consulta
+
+    auditoria = db.metadata.tables['log_auditoria']
+    desde = datetime.utcnow() - timedelta(days=1)
+    return {
+        'paciente_por_cpf': db.select(Paciente.id).where(Paciente.cpf.in_(['00000000000', '000.000.000-00'])),
+        'paciente_por_prontuario': db.select(Paciente.id).where(Paciente.prontuario == '000001'),
+        'busca_pagina_seguinte': db.select(Paciente.id)
+            .where(db.tuple_(Paciente.nome_normalizado, Paciente.id) > ('maria', 0))
+            .order_by(Paciente.nome_normalizado, Paciente.id).limit(21),
+        'endereco_principal': db.select(Endereco.id).where(Endereco.paciente_id == 1, Endereco.principal == True),
+        'movimentacoes_do_paciente': db.select(Movimentacao.id)
+            .where(Movimentacao.paciente_id == 1).order_by(Movimentacao.data_entrada.desc()),
+        'fila_de_atendimento': db.select(Movimentacao.id)
+            .where(Movimentacao.ativo == True, Movimentacao.tipo == 'emergencia',
+                   Movimentacao.status == 'aguardando_acolhimento')
+            .order_by(Movimentacao.data_entrada),
+        'auditoria_do_usuario': db.select(auditoria.c.id)
+            .where(auditoria.c.usuario_id == 1).order_by(auditoria.c.data_hora.desc()).limit(50),
+        'auditoria_por_periodo': db.select(auditoria.c.id).where(auditoria.c.data_hora >= desde),
+        'exportacao_pacientes': montar_consulta('pacientes', desde)[0],
+        'exportacao_enderecos': montar_consulta('enderecos', desde)[0],
+        'exportacao_movimentacoes': montar_consulta('movimentacoes', desde)[0],
+    }
+
+
+def _explicar(conn, consulta):
+    """Retorna (linhas do plano, tabelas varridas sequencialmente)"""
+    compilada = consulta.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    if compilada.positional:
+        parametros = tuple(compilada.params[nome] for nome in compilada.positiontup)
+    else:
+        parametros = compilada.params
+
+    if conn.dialect.name == 'postgresql':
+        # Em tabelas pequenas o planejador prefere Seq Scan mesmo com índice;
+        # desligando-o, Seq Scan só aparece quando não há índice utilizável
+        conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plano = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compilada}', parametros).scalar()
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        linhas, varreduras = [], []
+        nos = [(plano[0]['Plan'], 0)]
+        while nos:
+            no, nivel = nos.pop()
+            relacao = no.get('Relation Name')
+            linhas.append('  ' * nivel + no['Node Type'] + (f' on {relacao}' if relacao else ''))
+            if no['Node Type'] == 'Seq Scan':
+                varreduras.append(relacao)
+            nos.extend((filho, nivel + 1) for filho in reversed(no.get('Plans', [])))
+        return linhas, varreduras
+
+    linhas = [detalhe for *_, detalhe in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilada}', parametros)]
+    varreduras = [m.group(1) for m in map(_varredura_sqlite.match, linhas) if m]
+    return linhas, varreduras
+
+
+def verificar_indices():
+    """EXPLAIN de cada consulta quente; retorna uma lista de ResultadoPlano"""
+    resultados = []
+    with db.engine.connect() as conn:
+        for nome, consulta in consultas_quentes().items():
+            with conn.begin():
+                plano, varreduras = _explicar(conn, consulta)
+            resultados.append(ResultadoPlano(nome, plano, varreduras))
+    return resultados
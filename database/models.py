@@ -1,17 +1,29 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime
+import unicodedata
+import re
 
 db = SQLAlchemy()
 
+def normalizar_nome(texto):
+    """Remove acentos, converte para minúsculas e colapsa espaços (chave de busca por nome)"""
+    if not texto:
+        return ''
+    sem_acentos = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in sem_acentos if not unicodedata.combining(c))
+    return re.sub(r'[^0-9a-z]+', ' ', sem_acentos.lower()).strip()
+
 class Paciente(db.Model):
     __tablename__ = 'pacientes'
     
     id = db.Column(db.Integer, primary_key=True)
     prontuario = db.Column(db.String(20), unique=True, nullable=False)
     nome = db.Column(db.String(100), nullable=False)
+    nome_normalizado = db.Column(db.String(100))  # Nome sem acentos/minúsculo, usado pela busca
     data_nascimento = db.Column(db.Date, nullable=False)
     rg = db.Column(db.String(20))
-    cpf = db.Column(db.String(14))
+    cpf = db.Column(db.String(14), index=True)
     sexo = db.Column(db.String(1), nullable=False)
     raca = db.Column(db.String(20), nullable=False)
     nacionalidade = db.Column(db.String(50), nullable=False, default='brasileiro')
@@ -30,6 +42,16 @@ class Paciente(db.Model):
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     ativo = db.Column(db.Boolean, default=True)
     
+    __table_args__ = (
+        db.Index('ix_pacientes_nome_normalizado_id', 'nome_normalizado', 'id'),
+        db.Index('ix_pacientes_atualizado_em', 'atualizado_em'),
+    )
+    
+    @validates('nome')
+    def _atualizar_nome_normalizado(self, chave, nome):
+        self.nome_normalizado = normalizar_nome(nome)
+        return nome
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -71,6 +93,11 @@ class Endereco(db.Model):
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     paciente = db.relationship('Paciente', backref=db.backref('enderecos', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_enderecos_paciente_principal', 'paciente_id', 'principal'),
+        db.Index('ix_enderecos_atualizado_em', 'atualizado_em'),
+    )
 
 class Movimentacao(db.Model):
     __tablename__ = 'movimentacoes'
@@ -91,6 +118,14 @@ class Movimentacao(db.Model):
     
     paciente = db.relationship('Paciente', backref=db.backref('movimentacoes', lazy=True, order_by='Movimentacao.data_entrada.desc()'))
     
+    __table_args__ = (
+        db.Index('ix_movimentacoes_paciente_data', 'paciente_id', 'data_entrada'),
+        db.Index('ix_movimentacoes_atualizado_em', 'atualizado_em'),
+        # Fila de atendimento: só movimentações ativas
+        db.Index('ix_movimentacoes_fila_ativas', 'tipo', 'status', 'data_entrada',
+                 sqlite_where=db.text('ativo = 1'), postgresql_where=db.text('ativo = true')),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -108,3 +143,31 @@ class Movimentacao(db.Model):
             'usuario_id': self.usuario_id,
             'ativo': self.ativo
         }
+
+class Sequencia(db.Model):
+    """Contadores atômicos usados em bancos sem SEQUENCE nativa (SQLite)"""
+    __tablename__ = 'sequencias'
+    
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)  # Último número já entregue
+
+class VersaoEsquema(db.Model):
+    """Migrações de esquema já aplicadas (ver database/migracoes.py)"""
+    __tablename__ = 'versao_esquema'
+    
+    versao = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    descricao = db.Column(db.String(200), nullable=False)
+    aplicada_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Cep(db.Model):
+    """Cache persistente de CEPs já resolvidos ou importados de uma base offline"""
+    __tablename__ = 'ceps'
+    
+    cep = db.Column(db.String(8), primary_key=True)  # Somente dígitos
+    logradouro = db.Column(db.String(150))
+    bairro = db.Column(db.String(100))
+    cidade = db.Column(db.String(100), nullable=False)
+    estado = db.Column(db.String(2), nullable=False)
+    complemento = db.Column(db.String(100))
+    origem = db.Column(db.String(20), nullable=False, default='viacep')  # viacep, importacao
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
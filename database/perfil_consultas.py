@@ -0,0 +1,228 @@
+"""
+Perfil de consultas por requisição (desenvolvimento, testes e homologação)
+
+Com CONSULTAS_PERFIL ligado, cada SQL executado durante uma requisição é
+agrupado pelo texto normalizado (parâmetros já são placeholders; listas de
+IN viram ``(?, ...)``). Ao fim da requisição:
+
+- um mesmo comando repetido CONSULTAS_REPETICOES_N1 vezes ou mais é
+  registrado como suspeita de N+1
+- rotas marcadas com ``@orcamento_consultas(n)`` cuja função executar mais
+  de ``n`` consultas geram aviso; com CONSULTAS_ORCAMENTO_ESTRITO
+  (configuração de testes) levantam OrcamentoConsultasExcedido e a
+  requisição falha. O decorador fica logo acima do ``def``, para não contar
+  a carga do usuário feita por login_required (que depende do cache)
+
+No modo estrito o orçamento também é verificado antes de cada commit da rota:
+o excesso aborta a transação, então uma escrita que falhou no orçamento nunca
+fica gravada. Consultas feitas depois de um commit já confirmado só geram
+aviso (e entram em ``excessos``): trocar uma resposta de escrita bem-sucedida
+por um erro levaria o cliente a repetir a operação.
+
+Consultas acima de CONSULTAS_LENTAS_MS são registradas na hora com o plano
+(EXPLAIN QUERY PLAN no SQLite, EXPLAIN no PostgreSQL), obtido pela mesma
+conexão, dentro da mesma transação.
+"""
+from collections import Counter
+from functools import wraps
+import logging
+import re
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_estado = threading.local()
+
+_ESPACOS = re.compile(r'\s+')
+_PARAMETRO_EXPANDIDO = re.compile(r'%\((\w+?)_\d+\)s')  # IN expandido no PostgreSQL: %(cpf_1_1)s
+_LISTA_PARAMETROS = re.compile(r'\(\s*(\?|%\(\w+\)s|%s)(\s*,\s*\1)+\s*\)')
+
+
+class OrcamentoConsultasExcedido(Exception):
+    """Rota executou mais consultas do que o orçamento declarado"""
+
+
+def orcamento_consultas(maximo):
+    """Declara quantas consultas a função da rota pode fazer (verificado com CONSULTAS_PERFIL)"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def verificar(*args, **kwargs):
+            perfil = getattr(_estado, 'perfil', None)
+            if perfil is None:
+                return funcao(*args, **kwargs)
+            anterior = getattr(_estado, 'orcamento', None)
+            orcamento = _estado.orcamento = {'rota': funcao.__name__, 'antes': _estado.total, 'maximo': maximo, 'confirmado': False}
+            try:
+                resposta = funcao(*args, **kwargs)
+            finally:
+                _estado.orcamento = anterior
+            perfil.verificar_orcamento(
+                orcamento['rota'], _estado.total - orcamento['antes'], maximo, confirmado=orcamento['confirmado']
+            )
+            return resposta
+        verificar.orcamento_consultas = maximo
+        return verificar
+    return decorador
+
+
+def normalizar(statement):
+    texto = _ESPACOS.sub(' ', statement).strip()
+    texto = _PARAMETRO_EXPANDIDO.sub(r'%(\1)s', texto)
+    return _LISTA_PARAMETROS.sub(r'(\1, ...)', texto)
+
+
+def _resumo(texto, tamanho=160):
+    return texto if len(texto) <= tamanho else texto[:tamanho] + '...'
+
+
+class PerfilConsultas:
+    """Extensão Flask que agrupa, conta e cronometra as consultas de cada requisição"""
+
+    def __init__(self, app=None):
+        self.ativo = False
+        self.excessos = Counter()  # rota -> respostas entregues acima do orçamento
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.ativo = app.config['CONSULTAS_PERFIL']
+        self.lentas_segundos = app.config['CONSULTAS_LENTAS_MS'] / 1000
+        self.repeticoes_n1 = app.config['CONSULTAS_REPETICOES_N1']
+        self.estrito = app.config['CONSULTAS_ORCAMENTO_ESTRITO']
+        app.extensions['perfil_consultas'] = self
+        if not self.ativo:
+            return
+
+        event.listen(Engine, 'before_cursor_execute', self._antes)
+        event.listen(Engine, 'after_cursor_execute', self._depois)
+        event.listen(Session, 'before_commit', self._antes_do_commit)
+        event.listen(Session, 'after_flush_postexec', self._depois_do_flush)
+        event.listen(Session, 'after_commit', self._depois_do_commit)
+        app.before_request(self._iniciar_requisicao)
+        app.after_request(self._finalizar_requisicao)
+        app.teardown_request(self._encerrar_requisicao)
+
+    # ================================
+    # COLETA
+    # ================================
+
+    def _antes(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(_estado, 'consultas', None) is not None:
+            conn.info['perfil_inicio'] = time.perf_counter()
+
+    def _depois(self, conn, cursor, statement, parameters, context, executemany):
+        consultas = getattr(_estado, 'consultas', None)
+        inicio = conn.info.pop('perfil_inicio', None)
+        if consultas is None or inicio is None:
+            return
+        duracao = time.perf_counter() - inicio
+
+        chave = normalizar(statement)
+        grupo = consultas.get(chave)
+        if grupo is None:
+            grupo = consultas[chave] = [0, 0.0]
+        grupo[0] += 1
+        grupo[1] += duracao
+        _estado.total += 1
+
+        if duracao >= self.lentas_segundos and not executemany:
+            logger.warning(
+                f"[CONSULTAS] Consulta lenta ({duracao * 1000:.1f} ms) em {request.endpoint}: {_resumo(chave, 500)}",
+                extra={'duracao_ms': round(duracao * 1000, 2), 'plano': self._explicar(conn, statement, parameters)}
+            )
+
+    def _explicar(self, conn, statement, parameters):
+        """Plano da consulta pela conexão da própria requisição; None se não for SELECT"""
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        dialeto = conn.dialect.name
+        if dialeto not in ('sqlite', 'postgresql'):
+            return None
+
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            if dialeto == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                return '\n'.join(str(linha[-1]) for linha in cursor.fetchall())
+            # Savepoint: um EXPLAIN com erro não pode abortar a transação da requisição
+            cursor.execute('SAVEPOINT perfil_consultas')
+            try:
+                cursor.execute('EXPLAIN ' + statement, parameters)
+                return '\n'.join(linha[0] for linha in cursor.fetchall())
+            except Exception:
+                cursor.execute('ROLLBACK TO SAVEPOINT perfil_consultas')
+                raise
+            finally:
+                cursor.execute('RELEASE SAVEPOINT perfil_consultas')
+        except Exception as e:
+            return f'(EXPLAIN indisponível: {str(e)})'
+        finally:
+            cursor.close()
+
+    # ================================
+    # REQUISIÇÃO
+    # ================================
+
+    def _iniciar_requisicao(self):
+        _estado.consultas = {}
+        _estado.total = 0
+        _estado.perfil = self
+
+    def _finalizar_requisicao(self, resposta):
+        consultas = getattr(_estado, 'consultas', None)
+        if consultas is None:
+            return resposta
+        _estado.consultas = None
+
+        endpoint = request.endpoint or 'nao_encontrado'
+        resposta.headers['X-Consultas'] = str(_estado.total)
+        for chave, (quantidade, duracao) in consultas.items():
+            if quantidade >= self.repeticoes_n1:
+                logger.warning(
+                    f"[N+1] {endpoint} executou {quantidade} vezes ({duracao * 1000:.1f} ms): {_resumo(chave)}",
+                    extra={'repeticoes': quantidade}
+                )
+        return resposta
+
+    def _antes_do_commit(self, sessao):
+        orcamento = getattr(_estado, 'orcamento', None)
+        if orcamento is not None and self.estrito and not orcamento['confirmado']:
+            # Ainda dentro da transação: a exceção impede o commit
+            self.verificar_orcamento(orcamento['rota'], _estado.total - orcamento['antes'], orcamento['maximo'])
+
+    def _depois_do_flush(self, sessao, contexto):
+        # O flush do commit roda depois de before_commit: os INSERT/UPDATE dele
+        # também precisam ser contados antes do COMMIT
+        self._antes_do_commit(sessao)
+
+    def _depois_do_commit(self, sessao):
+        orcamento = getattr(_estado, 'orcamento', None)
+        if orcamento is not None:
+            orcamento['confirmado'] = True
+
+    def verificar_orcamento(self, rota, executadas, maximo, confirmado=False):
+        """Excesso levanta no modo estrito, exceto depois de um commit da rota (aí só avisa e conta)"""
+        if executadas <= maximo:
+            return
+        consultas = getattr(_estado, 'consultas', None) or {}
+        detalhes = '; '.join(
+            f'{quantidade}x {_resumo(chave, 80)}'
+            for chave, (quantidade, _) in sorted(consultas.items(), key=lambda item: -item[1][0])
+        )
+        mensagem = f"{rota} executou {executadas} consultas (orçamento: {maximo}). Na requisição: {detalhes}"
+        if self.estrito and not confirmado:
+            raise OrcamentoConsultasExcedido(mensagem)
+        self.excessos[rota] += 1
+        logger.warning(f"[CONSULTAS] {mensagem}")
+
+    def _encerrar_requisicao(self, erro=None):
+        _estado.consultas = None
+        _estado.perfil = None
+        _estado.orcamento = None
@@ -0,0 +1,229 @@
+"""
+Alocador de números de prontuário
+
+- PostgreSQL: SEQUENCE ``prontuario_seq`` com INCREMENT BY = tamanho do bloco
+- SQLite e demais: linha 'prontuario' da tabela ``sequencias`` incrementada atomicamente
+- Cada processo (worker do gunicorn) recebe um bloco de números e os entrega da
+  memória, então o cadastro nunca lê a tabela de pacientes nem colide no UNIQUE
+- Reservas com prazo curto: o número já sai do contador e o token assinado
+  garante que só o usuário que reservou o utilize até expirar. O token vale
+  para um cadastro só: um número já gravado não é devolvido de novo, e o
+  cadastro segue com um número novo
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+
+from database.models import db, Paciente, Sequencia
+
+logger = logging.getLogger(__name__)
+
+NOME_SEQUENCIA = 'prontuario'
+SEQUENCIA_POSTGRES = 'prontuario_seq'
+DIGITOS = 6
+
+
+def formatar_prontuario(numero):
+    return str(numero).zfill(DIGITOS)
+
+
+class AlocadorProntuario:
+    """Extensão Flask que entrega prontuários em blocos por processo"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._proximo = 0
+        self._limite = -1  # Bloco vazio
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PRONTUARIO_BLOCO', 20)
+        app.config.setdefault('PRONTUARIO_RESERVA_SEGUNDOS', 600)
+        self.app = app
+        self._serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='reserva-prontuario')
+        app.extensions['alocador_prontuario'] = self
+
+    @property
+    def tamanho_bloco(self):
+        return max(1, int(self.app.config['PRONTUARIO_BLOCO']))
+
+    # ================================
+    # INSTALAÇÃO
+    # ================================
+
+    def instalar(self):
+        """Cria a sequência/contador a partir do maior prontuário existente (somente na inicialização)"""
+        inicio = self._maior_prontuario_existente()
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as conn:
+                conn.execute(db.text(
+                    f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCIA_POSTGRES} '
+                    f'START WITH {inicio + 1} INCREMENT BY {self.tamanho_bloco}'
+                ))
+                incremento = conn.execute(db.text(
+                    'SELECT increment_by FROM pg_sequences '
+                    'WHERE schemaname = current_schema() AND sequencename = :nome'
+                ), {'nome': SEQUENCIA_POSTGRES}).scalar()
+                if incremento != self.tamanho_bloco:
+                    self._trocar_incremento(conn, incremento)
+            return
+
+        try:
+            with db.engine.begin() as conn:
+                existe = conn.execute(
+                    db.select(Sequencia.valor).where(Sequencia.nome == NOME_SEQUENCIA)
+                ).first()
+                if existe is None:
+                    conn.execute(Sequencia.__table__.insert().values(nome=NOME_SEQUENCIA, valor=inicio))
+        except IntegrityError:
+            pass  # Outro processo criou o contador ao mesmo tempo
+
+    def _trocar_incremento(self, conn, incremento_anterior):
+        """
+        PRONTUARIO_BLOCO mudou entre deploys. O próximo nextval com o incremento
+        novo cairia dentro do último bloco entregue (até last_value + incremento
+        anterior - 1), que um worker antigo ainda pode estar usando: a sequência
+        recomeça logo depois dele.
+        """
+        # O ALTER trava a sequência até o commit: nenhum nextval entre a leitura e o setval
+        conn.execute(db.text(f'ALTER SEQUENCE {SEQUENCIA_POSTGRES} INCREMENT BY {self.tamanho_bloco}'))
+        ultimo, chamada = conn.execute(db.text(f'SELECT last_value, is_called FROM {SEQUENCIA_POSTGRES}')).one()
+        ultimo_entregue = ultimo + incremento_anterior - 1 if chamada else ultimo - 1
+        conn.execute(db.text('SELECT setval(:sequencia, :proximo, false)'),
+                     {'sequencia': SEQUENCIA_POSTGRES, 'proximo': ultimo_entregue + 1})
+        logger.info(f"Blocos de prontuário: {incremento_anterior} -> {self.tamanho_bloco}; "
+                    f"próximo bloco a partir de {ultimo_entregue + 1}")
+
+    def _maior_prontuario_existente(self):
+        """Maior prontuário numérico já gravado; ordena por tamanho e valor para evitar CAST"""
+        consulta = db.session.query(Paciente.prontuario).order_by(
+            db.func.length(Paciente.prontuario).desc(), Paciente.prontuario.desc()
+        ).yield_per(100)
+        for (prontuario,) in consulta:
+            if prontuario and prontuario.isdigit():
+                return int(prontuario)
+        return 0
+
+    # ================================
+    # ALOCAÇÃO
+    # ================================
+
+    def _buscar_bloco(self):
+        """Reserva um novo bloco no banco; retorna (primeiro, ultimo)"""
+        bloco = self.tamanho_bloco
+        if db.engine.dialect.name == 'postgresql':
+            try:
+                with db.engine.begin() as conn:
+                    primeiro = conn.execute(db.text(f"SELECT nextval('{SEQUENCIA_POSTGRES}')")).scalar()
+            except ProgrammingError:
+                self.instalar()
+                with db.engine.begin() as conn:
+                    primeiro = conn.execute(db.text(f"SELECT nextval('{SEQUENCIA_POSTGRES}')")).scalar()
+            return primeiro, primeiro + bloco - 1
+
+        tabela = Sequencia.__table__
+        for _ in range(2):
+            # UPDATE e SELECT na mesma transação: o bloqueio de escrita garante atomicidade
+            with db.engine.begin() as conn:
+                atualizadas = conn.execute(
+                    tabela.update()
+                    .where(tabela.c.nome == NOME_SEQUENCIA)
+                    .values(valor=tabela.c.valor + bloco)
+                ).rowcount
+                if atualizadas:
+                    ultimo = conn.execute(
+                        db.select(tabela.c.valor).where(tabela.c.nome == NOME_SEQUENCIA)
+                    ).scalar()
+                    return ultimo - bloco + 1, ultimo
+            # Contador ainda não criado (inicialização não executada)
+            self.instalar()
+        raise RuntimeError('Contador de prontuários indisponível')
+
+    def proximo_numero(self):
+        """Entrega o próximo número do bloco do processo, buscando outro bloco quando acabar"""
+        with self._lock:
+            # Após fork (gunicorn --preload) o bloco herdado do processo pai é descartado
+            if self._pid != os.getpid() or self._proximo > self._limite:
+                self._proximo, self._limite = self._buscar_bloco()
+                self._pid = os.getpid()
+                logger.info(f"Bloco de prontuários {self._proximo}-{self._limite} alocado (pid {self._pid})")
+            numero = self._proximo
+            self._proximo += 1
+        return numero
+
+    def proximo(self):
+        return formatar_prontuario(self.proximo_numero())
+
+    def alocar(self, quantidade):
+        """
+        Aloca vários prontuários de uma vez direto no banco (importação em lote),
+        sem consumir o bloco do processo. Retorna a lista de números formatados.
+        """
+        if quantidade <= 0:
+            return []
+        bloco = self.tamanho_bloco
+        if db.engine.dialect.name == 'postgresql':
+            blocos = -(-quantidade // bloco)
+            with db.engine.begin() as conn:
+                inicios = conn.execute(
+                    db.text(f"SELECT nextval('{SEQUENCIA_POSTGRES}') FROM generate_series(1, :blocos)"),
+                    {'blocos': blocos}
+                ).scalars().all()
+            numeros = [n for inicio in sorted(inicios) for n in range(inicio, inicio + bloco)]
+        else:
+            tabela = Sequencia.__table__
+            with db.engine.begin() as conn:
+                atualizadas = conn.execute(
+                    tabela.update()
+                    .where(tabela.c.nome == NOME_SEQUENCIA)
+                    .values(valor=tabela.c.valor + quantidade)
+                ).rowcount
+                if not atualizadas:
+                    raise RuntimeError('Contador de prontuários não inicializado')
+                ultimo = conn.execute(
+                    db.select(tabela.c.valor).where(tabela.c.nome == NOME_SEQUENCIA)
+                ).scalar()
+            numeros = range(ultimo - quantidade + 1, ultimo + 1)
+        return [formatar_prontuario(n) for n in numeros[:quantidade]]
+
+    # ================================
+    # RESERVAS
+    # ================================
+
+    def reservar(self, usuario_id):
+        """Reserva um prontuário para o usuário; retorna (numero, token, expira_em)"""
+        numero = self.proximo()
+        token = self._serializer.dumps({'n': numero, 'u': usuario_id})
+        expira_em = datetime.utcnow() + timedelta(seconds=self.app.config['PRONTUARIO_RESERVA_SEGUNDOS'])
+        return numero, token, expira_em
+
+    def confirmar_reserva(self, token, usuario_id):
+        """
+        Retorna o número reservado se o token for válido, do mesmo usuário, ainda
+        estiver no prazo e o número não tiver sido usado; caso contrário None (o
+        número expirado fica sem uso).
+
+        A verificação roda na transação do cadastro (índice UNIQUE de
+        ``pacientes.prontuario``); dois cadastros simultâneos com o mesmo token
+        ainda podem passar por ela, e o segundo recebe IntegrityError no commit.
+        """
+        try:
+            dados = self._serializer.loads(token, max_age=self.app.config['PRONTUARIO_RESERVA_SEGUNDOS'])
+        except (SignatureExpired, BadSignature):
+            return None
+        numero = dados.get('n')
+        if dados.get('u') != usuario_id or not numero:
+            return None
+        usado = db.session.execute(
+            db.select(Paciente.id).where(Paciente.prontuario == numero).limit(1)
+        ).first()
+        if usado is not None:
+            logger.info(f"Reserva do prontuário {numero} já utilizada; um novo número será alocado")
+            return None
+        return numero
@@ -0,0 +1,63 @@
+"""
+Unidade de trabalho: uma transação por requisição
+
+Métodos de modelo e serviços que gravam chamam ``confirmar()`` em vez de
+``db.session.commit()``. Fora de uma unidade de trabalho é o mesmo commit de
+sempre; numa rota marcada com ``@unidade_de_trabalho`` as alterações só são
+enviadas no fim da rota, num único commit (ou desfeitas, se ela falhar).
+
+Assim um login bem-sucedido (zerar tentativas, último acesso, rehash da senha,
+auditoria síncrona) vira um UPDATE e um COMMIT, em vez de um commit por passo.
+
+Rotas de escrita que respondem com os objetos que acabaram de gravar usam
+``@manter_carregados``: os commits delas não expiram a sessão, e a resposta (e
+o evento publicado) não recarrega do banco cada linha que acabou de enviar.
+"""
+from functools import wraps
+
+from flask import g, has_request_context
+
+from database.models import db
+
+
+def em_unidade_de_trabalho():
+    return has_request_context() and g.get('unidade_de_trabalho', False)
+
+
+def confirmar():
+    """Commit agora, ou no fim da unidade de trabalho aberta nesta requisição"""
+    if not em_unidade_de_trabalho():
+        db.session.commit()
+
+
+def unidade_de_trabalho(funcao):
+    """Executa a rota numa transação só: commit ao retornar, rollback em caso de exceção"""
+    @wraps(funcao)
+    def executar(*args, **kwargs):
+        if em_unidade_de_trabalho():
+            return funcao(*args, **kwargs)
+        g.unidade_de_trabalho = True
+        try:
+            resposta = funcao(*args, **kwargs)
+            db.session.commit()
+            return resposta
+        except BaseException:
+            db.session.rollback()
+            raise
+        finally:
+            g.unidade_de_trabalho = False
+    return executar
+
+
+def manter_carregados(funcao):
+    """Executa a rota com expire_on_commit desligado na sessão da requisição"""
+    @wraps(funcao)
+    def executar(*args, **kwargs):
+        sessao = db.session()
+        anterior = sessao.expire_on_commit
+        sessao.expire_on_commit = False
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            sessao.expire_on_commit = anterior
+    return executar
@@ -0,0 +1 @@
+"""Serviços de apoio da aplicação (cache, integrações externas e tarefas em segundo plano)"""
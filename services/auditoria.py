@@ -0,0 +1,238 @@
+"""
+Gravação assíncrona do log de auditoria
+
+As requisições apenas enfileiram o registro (fila em memória limitada); uma
+thread em segundo plano grava em lote quando junta AUDITORIA_LOTE registros ou
+a cada AUDITORIA_INTERVALO_SEGUNDOS. No encerramento do processo a fila é
+esvaziada. Quando a fila enche, AUDITORIA_POLITICA_EXCESSO decide:
+
+- ``bloquear``: a requisição espera vaga na fila
+- ``arquivo``: o registro vai para um arquivo JSON Lines (reprocessado depois)
+- ``descartar``: o registro é descartado e contabilizado
+"""
+from datetime import datetime
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from database.models import db
+from database.transacao import confirmar
+
+logger = logging.getLogger(__name__)
+
+POLITICAS = ('bloquear', 'arquivo', 'descartar')
+_SINAL_PARADA = object()  # Acorda a thread de gravação no encerramento
+
+
+class GravadorAuditoria:
+    """Extensão Flask que grava LogAuditoria fora da thread da requisição"""
+
+    def __init__(self, app=None, modelo=None):
+        self._lock = threading.Lock()
+        self._lock_arquivo = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._parar = threading.Event()
+        self.contadores = {'enfileirados': 0, 'gravados': 0, 'em_arquivo': 0, 'descartados': 0, 'falhas': 0}
+        if app is not None and modelo is not None:
+            self.init_app(app, modelo)
+
+    def init_app(self, app, modelo):
+        politica = app.config['AUDITORIA_POLITICA_EXCESSO']
+        if politica not in POLITICAS:
+            raise ValueError(f"AUDITORIA_POLITICA_EXCESSO inválida: {politica}")
+        self.app = app
+        self.modelo = modelo
+        self.assincrona = app.config['AUDITORIA_ASSINCRONA']
+        self.politica = politica
+        self.tamanho_lote = app.config['AUDITORIA_LOTE']
+        self.intervalo = app.config['AUDITORIA_INTERVALO_SEGUNDOS']
+        self.arquivo_excesso = app.config['AUDITORIA_ARQUIVO_EXCESSO']
+        self.fila = queue.Queue(maxsize=app.config['AUDITORIA_FILA_TAMANHO'])
+        app.extensions['gravador_auditoria'] = self
+        atexit.register(self.encerrar)
+
+    # ================================
+    # ENFILEIRAMENTO
+    # ================================
+
+    def registrar(self, usuario_id, ip_address, acao, detalhes):
+        """Registra uma atividade; no modo assíncrono retorna sem esperar o banco"""
+        registro = {
+            'usuario_id': usuario_id,
+            'ip_address': ip_address,
+            'acao': acao,
+            'detalhes': detalhes,
+            'data_hora': datetime.utcnow()
+        }
+
+        if not self.assincrona:
+            db.session.add(self.modelo(**{k: v for k, v in registro.items() if k != 'data_hora'}))
+            confirmar()
+            return
+
+        self._garantir_thread()
+        try:
+            if self.politica == 'bloquear':
+                self.fila.put(registro)
+            else:
+                self.fila.put_nowait(registro)
+        except queue.Full:
+            if self.politica == 'arquivo':
+                self._gravar_arquivo([registro])
+            else:
+                self._contar('descartados')
+                logger.warning(f"Fila de auditoria cheia, registro descartado: {acao}")
+            return
+        self._contar('enfileirados')
+
+    def _contar(self, chave, quantidade=1):
+        with self._lock:
+            self.contadores[chave] += quantidade
+
+    def _garantir_thread(self):
+        """Inicia a thread de gravação no processo atual (também após fork do gunicorn)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Fila herdada do processo pai pertence a ele
+                self.fila = queue.Queue(maxsize=self.fila.maxsize)
+            self._parar.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._executar, name='gravador-auditoria', daemon=True)
+            self._thread.start()
+
+    # ================================
+    # GRAVAÇÃO EM LOTE
+    # ================================
+
+    def _executar(self):
+        while not self._parar.is_set():
+            lote = self._coletar_lote()
+            if lote:
+                self._gravar_lote(lote)
+
+    def _coletar_lote(self):
+        """Espera o primeiro registro e junta outros até encher o lote ou vencer o intervalo"""
+        lote = []
+        prazo = None
+        while len(lote) < self.tamanho_lote:
+            restante = self.intervalo if prazo is None else prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                registro = self.fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            if registro is _SINAL_PARADA:
+                break
+            lote.append(registro)
+            if prazo is None:
+                prazo = time.monotonic() + self.intervalo
+        return lote
+
+    def _gravar_lote(self, lote):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(self.modelo.__table__.insert(), lote)
+            self._contar('gravados', len(lote))
+        except Exception as e:
+            self._contar('falhas')
+            logger.error(f"Erro ao gravar {len(lote)} registros de auditoria: {str(e)}")
+            if self.politica == 'descartar':
+                self._contar('descartados', len(lote))
+            else:
+                self._gravar_arquivo(lote)
+
+    def _gravar_arquivo(self, registros):
+        """Anexa registros ao arquivo de pendências (JSON Lines)"""
+        try:
+            with self._lock_arquivo:
+                pasta = os.path.dirname(self.arquivo_excesso)
+                if pasta:
+                    os.makedirs(pasta, exist_ok=True)
+                with open(self.arquivo_excesso, 'a', encoding='utf-8') as f:
+                    for registro in registros:
+                        f.write(json.dumps(dict(registro, data_hora=registro['data_hora'].isoformat())) + '\n')
+            self._contar('em_arquivo', len(registros))
+        except OSError as e:
+            self._contar('descartados', len(registros))
+            logger.error(f"Erro ao gravar arquivo de auditoria pendente: {str(e)}")
+
+    def esvaziar(self):
+        """Grava imediatamente tudo o que estiver na fila"""
+        lote = []
+        while True:
+            try:
+                registro = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if registro is _SINAL_PARADA:
+                continue
+            lote.append(registro)
+            if len(lote) >= self.tamanho_lote:
+                self._gravar_lote(lote)
+                lote = []
+        if lote:
+            self._gravar_lote(lote)
+
+    def encerrar(self, timeout=5):
+        """Para a thread e grava os registros restantes (chamado no encerramento do processo)"""
+        self._parar.set()
+        if self._thread is not None and self._pid == os.getpid():
+            try:
+                self.fila.put_nowait(_SINAL_PARADA)
+            except queue.Full:
+                pass  # A thread está ocupada gravando e verá o evento de parada
+            self._thread.join(timeout)
+        if self._pid == os.getpid():
+            self.esvaziar()
+
+    def reprocessar_arquivo(self):
+        """
+        Grava no banco os registros do arquivo de pendências; retorna a quantidade.
+
+        O arquivo vira ``.processando`` (anexado ao de uma tentativa anterior
+        que falhou, se houver) e todos os lotes entram em uma única transação:
+        uma falha no meio não deixa lotes gravados que a próxima tentativa
+        repetiria, e nada do ``.processando`` se perde.
+        """
+        processando = self.arquivo_excesso + '.processando'
+        with self._lock_arquivo:
+            if os.path.exists(self.arquivo_excesso):
+                if os.path.exists(processando):
+                    with open(self.arquivo_excesso, 'rb') as origem, open(processando, 'ab') as destino:
+                        shutil.copyfileobj(origem, destino)
+                    os.remove(self.arquivo_excesso)
+                else:
+                    os.replace(self.arquivo_excesso, processando)
+        if not os.path.exists(processando):
+            return 0
+
+        total = 0
+        lote = []
+        with open(processando, encoding='utf-8') as f, db.engine.begin() as conn:
+            for linha in f:
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                registro['data_hora'] = datetime.fromisoformat(registro['data_hora'])
+                lote.append(registro)
+                if len(lote) >= self.tamanho_lote:
+                    conn.execute(self.modelo.__table__.insert(), lote)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                conn.execute(self.modelo.__table__.insert(), lote)
+                total += len(lote)
+        os.remove(processando)
+        return total
@@ -0,0 +1,184 @@
+"""
+Bloqueio temporário de login por tentativas erradas
+
+Armazenamento das tentativas (BLOQUEIO_ARMAZENAMENTO):
+
+- ``banco``: contador na linha do usuário (UPDATE atômico; ver
+  ``Usuario.bloquear_temporariamente``); correto com vários workers, sem
+  serviço extra
+- ``redis://...``: contador por janela fixa (SET NX EX + INCR) e chave de bloqueio
+  com expiração no Redis, compartilhados por todos os workers e máquinas; uma
+  tentativa errada não grava nada no banco
+- ``memoria``: o mesmo, num dicionário do processo (testes e um worker só)
+
+Em todos os casos o bloqueio é lembrado em memória até expirar: um usuário
+bloqueado é recusado antes de ler a linha dele e de rodar o bcrypt. Só
+bloqueios são guardados localmente (nunca a ausência deles), então um
+bloqueio feito em outro worker vale aqui na próxima consulta ao armazenamento.
+
+Com o Redis fora do ar o login não falha: o erro é registrado e, por
+PAUSA_APOS_FALHA segundos, as tentativas são contadas em memória no próprio
+worker. O Redis precisa ser 2.6.12 ou mais novo (SET com NX e EX).
+"""
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PAUSA_APOS_FALHA = 30  # Segundos sem consultar o armazenamento compartilhado depois de um erro
+
+
+class ArmazenamentoMemoria:
+    """Contadores com expiração no próprio processo"""
+
+    def __init__(self):
+        self._valores = {}  # chave -> (valor, expira_em monotônico)
+        self._lock = threading.Lock()
+
+    def _vigente(self, chave, agora):
+        item = self._valores.get(chave)
+        if item is not None and item[1] <= agora:
+            del self._valores[chave]
+            return None
+        return item
+
+    def incrementar(self, chave, segundos):
+        """Conta na janela fixa que começa no primeiro incremento"""
+        agora = time.monotonic()
+        with self._lock:
+            item = self._vigente(chave, agora)
+            valor = 1 if item is None else item[0] + 1
+            self._valores[chave] = (valor, agora + segundos if item is None else item[1])
+            return valor
+
+    def definir(self, chave, valor, segundos):
+        with self._lock:
+            self._valores[chave] = (valor, time.monotonic() + segundos)
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._vigente(chave, time.monotonic())
+            return None if item is None else item[0]
+
+    def remover(self, *chaves):
+        with self._lock:
+            for chave in chaves:
+                self._valores.pop(chave, None)
+
+
+class ArmazenamentoRedis:
+    """Os mesmos contadores no Redis, compartilhados entre processos"""
+
+    def __init__(self, url, prefixo='bloqueio:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("BLOQUEIO_ARMAZENAMENTO aponta para Redis, mas o pacote 'redis' não está instalado")
+        self.cliente = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.prefixo = prefixo
+
+    def incrementar(self, chave, segundos):
+        # MULTI: a chave nasce com a expiração da janela e o INCR a preserva, então
+        # a janela não se estende a cada erro (EXPIRE ... NX exigiria o Redis 7)
+        pipe = self.cliente.pipeline()
+        pipe.set(self.prefixo + chave, 0, ex=max(1, int(segundos)), nx=True)
+        pipe.incr(self.prefixo + chave)
+        return pipe.execute()[1]
+
+    def definir(self, chave, valor, segundos):
+        self.cliente.set(self.prefixo + chave, valor, ex=max(1, int(segundos)))
+
+    def obter(self, chave):
+        valor = self.cliente.get(self.prefixo + chave)
+        return None if valor is None else float(valor)
+
+    def remover(self, *chaves):
+        self.cliente.delete(*(self.prefixo + chave for chave in chaves))
+
+
+def criar_armazenamento(destino):
+    """Armazenamento para BLOQUEIO_ARMAZENAMENTO; None para 'banco'"""
+    if destino == 'banco':
+        return None
+    if destino == 'memoria':
+        return ArmazenamentoMemoria()
+    if destino.startswith(('redis://', 'rediss://', 'unix://')):
+        return ArmazenamentoRedis(destino)
+    raise ValueError(f"BLOQUEIO_ARMAZENAMENTO inválido: {destino}")
+
+
+class ControleBloqueios:
+    """Extensão Flask com as tentativas de login e os bloqueios vigentes"""
+
+    def __init__(self, app=None):
+        self._bloqueios = {}  # username -> bloqueado até (datetime local)
+        self._lock = threading.Lock()
+        self._reserva = ArmazenamentoMemoria()  # Enquanto o armazenamento configurado estiver fora do ar
+        self._indisponivel_ate = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limite = app.config['BLOQUEIO_TENTATIVAS']
+        self.duracao = timedelta(minutes=app.config['BLOQUEIO_MINUTOS'])
+        self.armazenamento = criar_armazenamento(app.config['BLOQUEIO_ARMAZENAMENTO'])
+        app.extensions['controle_bloqueios'] = self
+
+    @property
+    def no_banco(self):
+        return self.armazenamento is None
+
+    def bloqueado_ate(self, username):
+        """Fim do bloqueio vigente do usuário, ou None"""
+        agora = datetime.now()
+        ate = self._bloqueios.get(username)
+        if ate is None and self.armazenamento is not None:
+            fim = self._executar('obter', 'ativo:' + username)
+            ate = datetime.fromtimestamp(fim) if fim else None
+        if ate is None or ate <= agora:
+            if ate is not None:
+                self.esquecer(username)
+            return None
+        self.lembrar(username, ate)
+        return ate
+
+    def registrar_falha(self, username):
+        """Conta uma tentativa errada; retorna (tentativas, bloqueado_ate ou None)"""
+        segundos = self.duracao.total_seconds()
+        tentativas = self._executar('incrementar', 'tentativas:' + username, segundos)
+        if tentativas < self.limite:
+            return tentativas, None
+        ate = datetime.now() + self.duracao
+        self._executar('definir', 'ativo:' + username, ate.timestamp(), segundos)
+        self._executar('remover', 'tentativas:' + username)
+        self.lembrar(username, ate)
+        return tentativas, ate
+
+    def limpar(self, username):
+        """Login correto: zera as tentativas"""
+        self.esquecer(username)
+        if self.armazenamento is not None:
+            self._executar('remover', 'tentativas:' + username, 'ativo:' + username)
+            self._reserva.remover('tentativas:' + username, 'ativo:' + username)
+
+    def _executar(self, operacao, *args):
+        """Operação no armazenamento configurado, ou no de reserva em memória se ele falhar"""
+        if time.monotonic() >= self._indisponivel_ate:
+            try:
+                return getattr(self.armazenamento, operacao)(*args)
+            except Exception as e:
+                logger.error(f"[BLOQUEIOS] Armazenamento indisponível ({operacao}); "
+                             f"contando tentativas em memória por {PAUSA_APOS_FALHA}s: {str(e)}")
+                self._indisponivel_ate = time.monotonic() + PAUSA_APOS_FALHA
+        return getattr(self._reserva, operacao)(*args)
+
+    def lembrar(self, username, ate):
+        if ate is not None and ate > datetime.now():
+            with self._lock:
+                self._bloqueios[username] = ate
+
+    def esquecer(self, username):
+        with self._lock:
+            self._bloqueios.pop(username, None)
@@ -0,0 +1,142 @@
+"""
+Requisições condicionais e cache de respostas JSON por versão do recurso
+
+A rota informa uma ``versao`` barata de ler (atualizado_em, contagens) e uma
+função que monta os dados. O ETag sai da versão, não do corpo. Não há
+Last-Modified: datas com resolução de segundos não mudam numa alteração no
+mesmo segundo nem quando uma linha é excluída, e um If-Modified-Since sozinho
+daria 304 com dados antigos.
+
+1. If-None-Match bate: 304 sem consultar nem serializar
+2. o worker já tem o corpo dessa versão: devolve os bytes guardados
+3. senão monta, codifica uma vez e guarda (LRU de CACHE_RESPOSTAS_MAXIMO corpos)
+
+Como a versão é lida do banco a cada requisição, um corpo guardado nunca é
+servido depois que outro worker altera o recurso. As rotas de escrita ainda
+chamam ``invalidar`` com os grupos afetados para liberar a memória na hora, e
+as alterações de movimentação chegam pelo barramento de eventos (de todos os
+workers, com o backend Redis).
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+
+from services.metricas import medir
+from services.serializacao import codificar
+
+
+def chave_da_requisicao():
+    """Rota e parâmetros da URL (em ordem fixa): identificam a representação"""
+    return (request.path, tuple(sorted(request.args.items(multi=True))))
+
+
+def calcular_etag(chave, versao):
+    bruto = repr((chave, versao)).encode('utf-8')
+    return hashlib.blake2b(bruto, digest_size=16).hexdigest()
+
+
+class CacheRespostas:
+    """Extensão Flask com os corpos JSON já codificados, por chave e versão"""
+
+    def __init__(self, app=None, barramento=None, canal_movimentacoes='movimentacoes'):
+        self._entradas = OrderedDict()  # chave -> (etag, corpo, cabecalhos, grupos)
+        self._grupos = {}  # grupo -> chaves
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, barramento, canal_movimentacoes)
+
+    def init_app(self, app, barramento=None, canal_movimentacoes='movimentacoes'):
+        self.maximo = app.config['CACHE_RESPOSTAS_MAXIMO']
+        self.tamanho_maximo = app.config['CACHE_RESPOSTAS_TAMANHO_MAXIMO']
+        if barramento is not None:
+            barramento.ouvir(canal_movimentacoes, self._ao_alterar_movimentacao)
+        app.extensions['cache_respostas'] = self
+
+    # ================================
+    # RESPOSTA
+    # ================================
+
+    def responder(self, versao, renderizar, grupos=(), chave=None):
+        """
+        Resposta condicional para a requisição atual.
+
+        ``renderizar()`` retorna os dados (ou ``(dados, cabecalhos)``) e só é
+        chamada se nem o cliente nem este worker tiverem a ``versao``.
+        ``grupos`` são os nomes usados por ``invalidar`` (ex.: ('paciente', 7)).
+        """
+        chave = chave or chave_da_requisicao()
+        etag = calcular_etag(chave, versao)
+
+        if not is_resource_modified(request.environ, etag=etag):
+            resposta = Response(status=304)
+        else:
+            entrada = self._obter(chave, etag)
+            if entrada is None:
+                resultado = renderizar()
+                dados, cabecalhos = resultado if isinstance(resultado, tuple) else (resultado, {})
+                with medir('json'):
+                    corpo = codificar(dados)
+                entrada = (etag, corpo, dict(cabecalhos), tuple(grupos))
+                self._guardar(chave, entrada)
+            resposta = Response(entrada[1], headers=entrada[2], mimetype='application/json')
+
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+        return resposta
+
+    # ================================
+    # ARMAZENAMENTO
+    # ================================
+
+    def _obter(self, chave, etag):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] != etag:
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada
+
+    def _guardar(self, chave, entrada):
+        if self.maximo <= 0 or len(entrada[1]) > self.tamanho_maximo:
+            return
+        with self._lock:
+            self._descartar(chave)
+            self._entradas[chave] = entrada
+            for grupo in entrada[3]:
+                self._grupos.setdefault(grupo, set()).add(chave)
+            while len(self._entradas) > self.maximo:
+                self._descartar(next(iter(self._entradas)))
+
+    def _descartar(self, chave):
+        entrada = self._entradas.pop(chave, None)
+        if entrada is None:
+            return
+        for grupo in entrada[3]:
+            chaves = self._grupos.get(grupo)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._grupos[grupo]
+
+    def invalidar(self, *grupos):
+        """Descarta os corpos guardados dos grupos informados"""
+        with self._lock:
+            for grupo in grupos:
+                for chave in tuple(self._grupos.get(grupo, ())):
+                    self._descartar(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._grupos.clear()
+
+    def _ao_alterar_movimentacao(self, evento):
+        paciente_id = evento.dados.get('paciente_id')
+        if paciente_id is not None:
+            self.invalidar(('paciente', paciente_id))
+
+    def __len__(self):
+        return len(self._entradas)
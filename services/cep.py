@@ -0,0 +1,305 @@
+"""
+Resolução de CEP em camadas
+
+1. Cache LRU em memória com TTL (por processo)
+2. Tabela local ``ceps`` (CEPs já resolvidos e bases importadas offline)
+3. ViaCEP via sessão HTTP com keep-alive, somente em falta no cache,
+   protegida por um circuit breaker para que uma queda do serviço não prenda workers
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import csv
+import itertools
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from database.models import db, Cep
+from services.metricas import medir
+
+logger = logging.getLogger(__name__)
+
+NAO_ENCONTRADO = object()  # Marca CEPs inexistentes no cache (cache negativo)
+CAMPOS = ('logradouro', 'bairro', 'cidade', 'estado', 'complemento')
+
+
+class ServicoCepIndisponivel(Exception):
+    """ViaCEP fora do ar, lento ou com o circuito aberto"""
+
+
+def limpar_cep(cep):
+    return ''.join(filter(str.isdigit, cep or ''))
+
+
+def formatar_cep(cep_limpo):
+    return f"{cep_limpo[:5]}-{cep_limpo[5:]}"
+
+
+class CacheLRU:
+    """Dicionário limitado com expiração; o item menos usado sai primeiro"""
+
+    def __init__(self, capacidade, ttl_segundos):
+        self.capacidade = capacidade
+        self.ttl = ttl_segundos
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def definir(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + self.ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class CircuitBreaker:
+    """
+    Fechado: chamadas passam. Após N falhas seguidas abre e recusa chamadas por
+    ``tempo_aberto`` segundos; depois deixa passar uma tentativa (meio-aberto).
+    """
+
+    def __init__(self, falhas_para_abrir, tempo_aberto):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._tentativa_em_andamento = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self._falhas < self.falhas_para_abrir:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self._aberto_ate else 'meio-aberto'
+
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == 'fechado':
+                return True
+            if estado == 'meio-aberto' and not self._tentativa_em_andamento:
+                self._tentativa_em_andamento = True
+                return True
+            return False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._tentativa_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._tentativa_em_andamento = False
+            if self._falhas >= self.falhas_para_abrir:
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+
+
+class ResolvedorCep:
+    """Extensão Flask para consulta de CEP"""
+
+    def __init__(self, app=None):
+        self._sessao_local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.cache = CacheLRU(config['CEP_CACHE_TAMANHO'], config['CEP_CACHE_TTL_SEGUNDOS'])
+        self.circuito = CircuitBreaker(config['CEP_FALHAS_PARA_ABRIR'], config['CEP_TEMPO_ABERTO_SEGUNDOS'])
+        self.timeout = (config['CEP_TIMEOUT_CONEXAO'], config['CEP_TIMEOUT_LEITURA'])
+        app.extensions['resolvedor_cep'] = self
+
+    @property
+    def sessao(self):
+        """Sessão HTTP com pool de conexões keep-alive (uma por thread)"""
+        sessao = getattr(self._sessao_local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+            sessao.mount('https://', adaptador)
+            sessao.mount('http://', adaptador)
+            self._sessao_local.sessao = sessao
+        return sessao
+
+    # ================================
+    # CONSULTA
+    # ================================
+
+    def consultar(self, cep_limpo):
+        """
+        Retorna o endereço (dict) ou None se o CEP não existir.
+        Levanta ServicoCepIndisponivel se não houver dado local e a ViaCEP falhar.
+        """
+        em_cache = self.cache.obter(cep_limpo)
+        if em_cache is NAO_ENCONTRADO:
+            return None
+        if em_cache is not None:
+            return em_cache
+
+        registro = db.session.get(Cep, cep_limpo)
+        if registro and not self._precisa_revalidar(registro):
+            endereco = self._para_dict(registro)
+            self.cache.definir(cep_limpo, endereco)
+            return endereco
+
+        try:
+            endereco = self._consultar_viacep(cep_limpo)
+        except ServicoCepIndisponivel:
+            if registro:
+                # Dado antigo é melhor que nenhum enquanto o serviço está fora
+                return self._para_dict(registro)
+            raise
+
+        if endereco is None:
+            self.cache.definir(cep_limpo, NAO_ENCONTRADO)
+            return None
+
+        try:
+            self._gravar([dict(endereco, cep=cep_limpo, origem='viacep')])
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o CEP {cep_limpo} na tabela local: {str(e)}")
+        self.cache.definir(cep_limpo, endereco)
+        return endereco
+
+    def _precisa_revalidar(self, registro):
+        if registro.origem != 'viacep' or not registro.atualizado_em:
+            return False
+        validade = timedelta(days=self.app.config['CEP_VALIDADE_DIAS'])
+        return datetime.utcnow() - registro.atualizado_em > validade
+
+    def _consultar_viacep(self, cep_limpo):
+        if not self.circuito.permitir():
+            raise ServicoCepIndisponivel('Serviço de CEP temporariamente indisponível')
+
+        try:
+            with medir('viacep'):
+                response = self.sessao.get(self.app.config['CEP_URL'].format(cep=cep_limpo), timeout=self.timeout)
+            if response.status_code == 400:
+                self.circuito.registrar_sucesso()
+                return None
+            response.raise_for_status()
+            dados = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.circuito.registrar_falha()
+            logger.warning(f"Falha ao consultar ViaCEP ({self.circuito.estado}): {str(e)}")
+            raise ServicoCepIndisponivel('Erro de conexão com o serviço de CEP')
+
+        self.circuito.registrar_sucesso()
+        if 'erro' in dados:
+            return None
+        return {
+            'logradouro': dados.get('logradouro', ''),
+            'bairro': dados.get('bairro', ''),
+            'cidade': dados.get('localidade', ''),
+            'estado': dados.get('uf', ''),
+            'complemento': dados.get('complemento', '')
+        }
+
+    @staticmethod
+    def _para_dict(registro):
+        return {campo: getattr(registro, campo) or '' for campo in CAMPOS}
+
+    # ================================
+    # GRAVAÇÃO E IMPORTAÇÃO
+    # ================================
+
+    def _gravar(self, linhas):
+        """Insere ou atualiza CEPs em uma transação própria (não interfere na sessão da requisição)"""
+        if not linhas:
+            return
+        agora = datetime.utcnow()
+        for linha in linhas:
+            linha['atualizado_em'] = agora
+
+        tabela = Cep.__table__
+        dialeto = db.engine.dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            insert = None
+
+        with db.engine.begin() as conn:
+            if insert is None:
+                conn.execute(tabela.delete().where(tabela.c.cep.in_([l['cep'] for l in linhas])))
+                conn.execute(tabela.insert(), linhas)
+            else:
+                comando = insert(tabela)
+                comando = comando.on_conflict_do_update(
+                    index_elements=[tabela.c.cep],
+                    set_={c: comando.excluded[c] for c in CAMPOS + ('origem', 'atualizado_em')}
+                )
+                conn.execute(comando, linhas)
+
+    def importar(self, arquivo, tamanho_lote=5000):
+        """
+        Importa uma base de CEPs em CSV (cabeçalho com cep, logradouro, bairro,
+        cidade/localidade, estado/uf e complemento opcionais). Separador detectado
+        automaticamente. Lê em fluxo, grava em lotes; retorna a quantidade importada.
+        CEP repetido no mesmo lote fica com a última linha: o upsert do PostgreSQL
+        não aceita a mesma chave duas vezes em um comando.
+        """
+        if isinstance(arquivo, str):
+            with open(arquivo, encoding='utf-8-sig', newline='') as f:
+                return self.importar(f, tamanho_lote)
+
+        cabecalho = arquivo.readline()
+        if isinstance(cabecalho, bytes):
+            raise TypeError('Abra o arquivo de CEPs em modo texto')
+        dialeto_csv = csv.Sniffer().sniff(cabecalho, delimiters=',;|\t')
+        leitor = csv.DictReader(itertools.chain([cabecalho], arquivo), dialect=dialeto_csv)
+
+        total = 0
+        lote = {}  # cep -> linha
+        for linha in leitor:
+            linha = {(k or '').strip().lower(): (v or '').strip() for k, v in linha.items()}
+            cep_limpo = limpar_cep(linha.get('cep'))
+            cidade = linha.get('cidade') or linha.get('localidade')
+            estado = (linha.get('estado') or linha.get('uf') or '').upper()
+            if len(cep_limpo) != 8 or not cidade or len(estado) != 2:
+                continue
+            lote[cep_limpo] = {
+                'cep': cep_limpo,
+                'logradouro': linha.get('logradouro', ''),
+                'bairro': linha.get('bairro', ''),
+                'cidade': cidade,
+                'estado': estado,
+                'complemento': linha.get('complemento', ''),
+                'origem': 'importacao'
+            }
+            if len(lote) >= tamanho_lote:
+                self._gravar(list(lote.values()))
+                total += len(lote)
+                lote = {}
+        if lote:
+            self._gravar(list(lote.values()))
+            total += len(lote)
+
+        self.cache.limpar()
+        return total
+
@@ -0,0 +1,58 @@
+"""
+Validação de CPF (dígitos verificadores), individual e em lote
+
+A versão em lote trabalha sobre os bytes ASCII do CPF e pesos pré-calculados,
+evitando um int() por dígito; é usada na importação de milhares de registros.
+"""
+from operator import mul
+
+PESOS_DIGITO_1 = tuple(range(10, 1, -1))  # 10..2 sobre os 9 primeiros dígitos
+PESOS_DIGITO_2 = tuple(range(11, 1, -1))  # 11..2 sobre os 10 primeiros dígitos
+_AJUSTE_1 = ord('0') * sum(PESOS_DIGITO_1)
+_AJUSTE_2 = ord('0') * sum(PESOS_DIGITO_2)
+_SOMENTE_DIGITOS = str.maketrans('', '', '.-/ ')
+
+MENSAGEM_TAMANHO = 'CPF deve conter 11 dígitos'
+MENSAGEM_INVALIDO = 'CPF inválido'
+
+
+def limpar_cpf(cpf):
+    return (cpf or '').translate(_SOMENTE_DIGITOS)
+
+
+def formatar_cpf(cpf_limpo):
+    return f"{cpf_limpo[:3]}.{cpf_limpo[3:6]}.{cpf_limpo[6:9]}-{cpf_limpo[9:]}"
+
+
+def _digito(soma):
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def validar_cpfs(cpfs):
+    """
+    Valida uma sequência de CPFs (formatados ou não).
+    Retorna uma lista de mensagens de erro na mesma ordem; None para CPF válido.
+    """
+    resultado = []
+    for cpf in cpfs:
+        cpf = limpar_cpf(cpf)
+        if len(cpf) != 11 or not (cpf.isascii() and cpf.isdigit()):  # isdigit aceita dígitos de outros alfabetos
+            resultado.append(MENSAGEM_TAMANHO)
+            continue
+        # Todos os dígitos iguais
+        if cpf == cpf[0] * 11:
+            resultado.append(MENSAGEM_INVALIDO)
+            continue
+        b = cpf.encode('ascii')
+        if _digito(sum(map(mul, b, PESOS_DIGITO_1)) - _AJUSTE_1) != b[9] - 48 or \
+           _digito(sum(map(mul, b, PESOS_DIGITO_2)) - _AJUSTE_2) != b[10] - 48:
+            resultado.append(MENSAGEM_INVALIDO)
+            continue
+        resultado.append(None)
+    return resultado
+
+
+def validar_cpf(cpf):
+    """Retorna None se o CPF for válido ou a mensagem de erro"""
+    return validar_cpfs([cpf])[0]
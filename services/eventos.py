@@ -0,0 +1,281 @@
+"""
+Barramento de eventos em tempo real (pub/sub) para telas ao vivo
+
+As rotas publicam um evento depois do commit; o evento é montado e codificado
+uma única vez (já no formato Server-Sent Events) e repassado a todas as telas
+abertas, então o custo de cada alteração não cresce com o número de clientes.
+
+Backends (EVENTOS_BACKEND):
+
+- ``memoria``: entrega só aos assinantes do próprio processo (um worker)
+- ``redis://...``: publica no Redis; cada worker do gunicorn mantém uma thread
+  que recebe os eventos do canal e os repassa aos seus assinantes locais
+
+Cada processo guarda os últimos EVENTOS_HISTORICO eventos por canal para que um
+cliente que reconecta com ``Last-Event-ID`` receba o que perdeu.
+
+As conexões SSE ficam abertas por até EVENTOS_SSE_DURACAO_SEGUNDOS e ocupam
+uma thread do worker gthread cada (a conexão com o banco é devolvida antes do
+fluxo). Para que as telas abertas não tomem as threads das demais rotas, cada
+worker aceita no máximo EVENTOS_SSE_MAXIMO fluxos (padrão: um quarto de
+GUNICORN_THREADS); as telas excedentes recebem 503 e passam a consultar
+``eventos_desde`` a cada EVENTOS_CONSULTA_INTERVALO_SEGUNDOS, uma requisição
+curta que não prende thread.
+
+O backend ``memoria`` só serve a um worker: com WEB_CONCURRENCY > 1 um evento
+publicado no worker A nunca chegaria às telas do worker B, então a aplicação
+se recusa a iniciar sem o Redis.
+"""
+from collections import deque, namedtuple
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+Evento = namedtuple('Evento', 'id tipo dados sse')
+
+
+def formatar_sse(id_, tipo, dados):
+    """Serializa um evento no formato text/event-stream"""
+    return f"id: {id_}\nevent: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
+
+
+class Assinatura:
+    """Fila de eventos de um cliente conectado"""
+
+    def __init__(self, barramento, canal, tamanho):
+        self.barramento = barramento
+        self.canal = canal
+        self.fila = queue.Queue(maxsize=tamanho)
+        self.perdeu_eventos = False
+        self.fluxo = False  # Ocupa uma das vagas de EVENTOS_SSE_MAXIMO
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: em vez de bloquear o publicador, avisa que precisa recarregar
+            self.perdeu_eventos = True
+
+    def obter(self, timeout):
+        """Próximo evento ou None se nada chegou dentro de ``timeout`` segundos"""
+        try:
+            return self.fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cancelar(self):
+        """Remove a assinatura (e libera a vaga do fluxo); pode ser chamado mais de uma vez"""
+        self.barramento._remover(self)
+
+
+class BackendMemoria:
+    """Entrega direta aos assinantes do processo atual"""
+
+    def __init__(self, entregar):
+        self.entregar = entregar
+
+    def iniciar(self):
+        pass
+
+    def publicar(self, canal, mensagem):
+        self.entregar(canal, mensagem)
+
+    def encerrar(self):
+        pass
+
+
+class BackendRedis:
+    """PUBLISH/PSUBSCRIBE no Redis; uma thread por processo repassa os eventos recebidos"""
+
+    def __init__(self, url, entregar, prefixo='eventos:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENTOS_BACKEND aponta para Redis, mas o pacote 'redis' não está instalado")
+        self.cliente = redis.Redis.from_url(url)
+        self.entregar = entregar
+        self.prefixo = prefixo
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def publicar(self, canal, mensagem):
+        self.iniciar()
+        self.cliente.publish(self.prefixo + canal, json.dumps(mensagem, ensure_ascii=False, default=str))
+
+    def iniciar(self):
+        """Inicia o ouvinte no processo atual (também após fork do gunicorn)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._ouvir, name='ouvinte-eventos', daemon=True)
+            self._thread.start()
+
+    def _ouvir(self):
+        espera = 1
+        while not self._parar.is_set():
+            try:
+                pubsub = self.cliente.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefixo + '*')
+                espera = 1
+                for mensagem in pubsub.listen():
+                    if self._parar.is_set():
+                        break
+                    canal = mensagem['channel']
+                    if isinstance(canal, bytes):
+                        canal = canal.decode('utf-8')
+                    self.entregar(canal[len(self.prefixo):], json.loads(mensagem['data']))
+            except Exception as e:
+                logger.warning(f"Conexão do barramento com o Redis perdida, nova tentativa em {espera}s: {str(e)}")
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    def encerrar(self):
+        self._parar.set()
+
+
+class BarramentoEventos:
+    """Extensão Flask com publicação e assinatura de eventos por canal"""
+
+    def __init__(self, app=None):
+        self._assinantes = {}
+        self._ouvintes = {}
+        self._historico = {}
+        self._lock = threading.Lock()
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.tamanho_fila = app.config['EVENTOS_FILA_ASSINANTE']
+        self.tamanho_historico = app.config['EVENTOS_HISTORICO']
+        self.maximo_fluxos = app.config['EVENTOS_SSE_MAXIMO']
+        self._vagas_fluxo = threading.BoundedSemaphore(self.maximo_fluxos) if self.maximo_fluxos > 0 else None
+        destino = app.config['EVENTOS_BACKEND']
+        if destino == 'memoria':
+            if app.config['WEB_CONCURRENCY'] > 1:
+                raise RuntimeError(
+                    f"EVENTOS_BACKEND 'memoria' não entrega eventos entre os {app.config['WEB_CONCURRENCY']} "
+                    "workers (WEB_CONCURRENCY); configure EVENTOS_BACKEND com a URL do Redis"
+                )
+            self.backend = BackendMemoria(self._entregar)
+        elif destino.startswith(('redis://', 'rediss://', 'unix://')):
+            self.backend = BackendRedis(destino, self._entregar)
+        else:
+            raise ValueError(f"EVENTOS_BACKEND inválido: {destino}")
+        app.extensions['barramento_eventos'] = self
+
+    # ================================
+    # PUBLICAÇÃO
+    # ================================
+
+    def publicar(self, canal, tipo, dados):
+        """Publica um evento no canal; falhas do backend não afetam a requisição"""
+        mensagem = {'id': uuid.uuid4().hex, 'tipo': tipo, 'dados': dados}
+        try:
+            self.backend.publicar(canal, mensagem)
+        except Exception as e:
+            logger.error(f"Erro ao publicar evento {tipo} no canal {canal}: {str(e)}")
+
+    def _entregar(self, canal, mensagem):
+        """Recebe uma mensagem do backend, codifica uma vez e repassa aos assinantes locais"""
+        evento = Evento(
+            mensagem['id'], mensagem['tipo'], mensagem['dados'],
+            formatar_sse(mensagem['id'], mensagem['tipo'], mensagem['dados'])
+        )
+        with self._lock:
+            historico = self._historico.get(canal)
+            if historico is None:
+                historico = self._historico[canal] = deque(maxlen=self.tamanho_historico)
+            historico.append(evento)
+            assinantes = tuple(self._assinantes.get(canal, ()))
+            ouvintes = tuple(self._ouvintes.get(canal, ()))
+        for funcao in ouvintes:
+            try:
+                funcao(evento)
+            except Exception as e:
+                logger.error(f"Erro no ouvinte {getattr(funcao, '__qualname__', funcao)} do canal {canal}: {str(e)}")
+        for assinatura in assinantes:
+            assinatura.entregar(evento)
+
+    # ================================
+    # ASSINATURA
+    # ================================
+
+    def iniciar(self):
+        """Garante a recepção de eventos neste processo (ouvinte do Redis após o fork)"""
+        self.backend.iniciar()
+
+    def assinar(self, canal):
+        self.iniciar()
+        assinatura = Assinatura(self, canal, self.tamanho_fila)
+        with self._lock:
+            self._assinantes.setdefault(canal, set()).add(assinatura)
+        return assinatura
+
+    def abrir_fluxo(self, canal):
+        """
+        Assinatura para uma conexão SSE, ou None se o worker já mantém
+        EVENTOS_SSE_MAXIMO fluxos abertos (o cliente deve consultar em intervalos)
+        """
+        if self._vagas_fluxo is None or not self._vagas_fluxo.acquire(blocking=False):
+            return None
+        assinatura = self.assinar(canal)
+        assinatura.fluxo = True
+        return assinatura
+
+    def ouvir(self, canal, funcao):
+        """Registra uma função chamada com cada Evento do canal (índices em memória, etc.)"""
+        with self._lock:
+            self._ouvintes.setdefault(canal, []).append(funcao)
+
+    def _remover(self, assinatura):
+        with self._lock:
+            assinantes = self._assinantes.get(assinatura.canal, set())
+            if assinatura not in assinantes:
+                return
+            assinantes.discard(assinatura)
+        if assinatura.fluxo:
+            self._vagas_fluxo.release()
+
+    def eventos_desde(self, canal, ultimo_id):
+        """
+        Eventos posteriores a ``ultimo_id`` no histórico deste processo (todos
+        se ``ultimo_id`` for vazio). Retorna None se o id não estiver mais no
+        histórico (o cliente deve recarregar).
+        """
+        with self._lock:
+            historico = list(self._historico.get(canal, ()))
+        if ultimo_id == '':
+            return historico
+        for posicao, evento in enumerate(historico):
+            if evento.id == ultimo_id:
+                return historico[posicao + 1:]
+        return None
+
+    def ultimo_evento(self, canal):
+        """Id do evento mais recente do histórico (None se vazio): ponto de partida das consultas"""
+        with self._lock:
+            historico = self._historico.get(canal)
+            return historico[-1].id if historico else None
+
+    def total_fluxos(self):
+        """Conexões SSE abertas neste worker"""
+        with self._lock:
+            return sum(1 for assinantes in self._assinantes.values() for a in assinantes if a.fluxo)
+
+    def total_assinantes(self, canal=None):
+        with self._lock:
+            if canal is not None:
+                return len(self._assinantes.get(canal, ()))
+            return sum(len(a) for a in self._assinantes.values())
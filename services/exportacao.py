@@ -0,0 +1,127 @@
+"""
+Exportação em fluxo (NDJSON ou CSV, opcionalmente gzip)
+
+As linhas vêm de um SELECT só com as colunas exportadas, lido com cursor do
+lado do servidor (``stream_results``/``yield_per``) e codificado em blocos, de
+modo que a memória usada não depende do tamanho da tabela. O filtro por
+``atualizado_em`` permite extrações incrementais.
+"""
+from datetime import date, datetime
+import csv
+import io
+import json
+import zlib
+
+from database.models import db, Paciente, Endereco, Movimentacao
+
+FORMATOS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+LINHAS_POR_BLOCO = 500
+
+
+class ErroExportacao(Exception):
+    """Entidade, formato ou filtro de exportação inválido"""
+
+
+ENTIDADES = {
+    'pacientes': (Paciente, [
+        'id', 'prontuario', 'nome', 'data_nascimento', 'rg', 'cpf', 'sexo', 'raca', 'nacionalidade',
+        'nome_mae', 'mae_desconhecida', 'nome_pai', 'email', 'telefone', 'convenio', 'numero_cartao',
+        'titular_cartao', 'data_cadastro', 'atualizado_em', 'ativo'
+    ]),
+    'enderecos': (Endereco, [
+        'id', 'paciente_id', 'cep', 'estado', 'cidade', 'bairro', 'logradouro', 'numero', 'complemento',
+        'ponto_referencia', 'principal', 'criado_em', 'atualizado_em'
+    ]),
+    'movimentacoes': (Movimentacao, [
+        'id', 'paciente_id', 'tipo', 'status', 'prioridade', 'profissional_responsavel', 'observacoes',
+        'data_entrada', 'data_saida', 'criado_em', 'atualizado_em', 'usuario_id', 'ativo'
+    ]),
+}
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def interpretar_data(valor):
+    """Aceita datas ISO 8601 ('2025-01-31' ou '2025-01-31T22:00:00')"""
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(valor.replace('Z', ''))
+    except ValueError:
+        raise ErroExportacao(f"Data inválida: {valor}. Use o formato ISO 8601.")
+
+
+def montar_consulta(entidade, desde=None, ate=None):
+    if entidade not in ENTIDADES:
+        raise ErroExportacao(f"Entidade inválida: {entidade}. Use {', '.join(ENTIDADES)}.")
+    modelo, colunas = ENTIDADES[entidade]
+    consulta = db.select(*(getattr(modelo, c) for c in colunas))
+    if desde is not None:
+        # Incremental: janela [desde, ate) ordenada pela data de alteração
+        consulta = consulta.where(modelo.atualizado_em >= desde)
+        if ate is not None:
+            consulta = consulta.where(modelo.atualizado_em < ate)
+        return consulta.order_by(modelo.atualizado_em, modelo.id), colunas
+    return consulta.order_by(modelo.id), colunas
+
+
+def _linhas(consulta, tamanho_lote):
+    """Itera as linhas com cursor no servidor; mantém só um lote em memória"""
+    with db.engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, yield_per=tamanho_lote).execute(consulta)
+        for particao in resultado.partitions():
+            yield particao
+
+
+def gerar_exportacao(entidade, formato='ndjson', desde=None, ate=None, compactar=False, tamanho_lote=1000):
+    """
+    Valida os parâmetros (levanta ErroExportacao antes de começar a resposta)
+    e retorna um gerador de blocos de bytes com o conteúdo exportado
+    """
+    if formato not in FORMATOS:
+        raise ErroExportacao(f"Formato inválido: {formato}. Use ndjson ou csv.")
+    consulta, colunas = montar_consulta(entidade, desde, ate)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compactar else None  # wbits=31: formato gzip
+
+    def blocos():
+        if formato == 'csv':
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(colunas)
+            for particao in _linhas(consulta, tamanho_lote):
+                for inicio in range(0, len(particao), LINHAS_POR_BLOCO):
+                    escritor.writerows(
+                        [v.isoformat() if isinstance(v, (datetime, date)) else v for v in linha]
+                        for linha in particao[inicio:inicio + LINHAS_POR_BLOCO]
+                    )
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            codificar = json.JSONEncoder(ensure_ascii=False, default=_valor_json).encode
+            for particao in _linhas(consulta, tamanho_lote):
+                for inicio in range(0, len(particao), LINHAS_POR_BLOCO):
+                    yield ''.join(
+                        codificar(dict(zip(colunas, linha))) + '\n'
+                        for linha in particao[inicio:inicio + LINHAS_POR_BLOCO]
+                    )
+
+    def codificados():
+        for bloco in blocos():
+            dados = bloco.encode('utf-8')
+            if compressor is None:
+                yield dados
+            else:
+                comprimido = compressor.compress(dados)
+                if comprimido:
+                    yield comprimido
+        if compressor is not None:
+            yield compressor.flush()
+
+    return codificados()
@@ -0,0 +1,278 @@
+"""
+Índice em memória das filas de atendimento
+
+Cada fila é identificada por (tipo, status) da movimentação e mantida como um
+heap ordenado por (peso da prioridade, data_entrada, id). Remoções são
+preguiçosas: a entrada antiga continua no heap até chegar ao topo ou até a
+próxima compactação, e só vale se ainda for a entrada viva daquele id.
+
+- ``proximos(n)`` percorre o heap a partir da raiz com uma fronteira própria,
+  sem retirar nada: O(n log n), independente do tamanho da fila
+- ``tamanhos()`` lê contadores já mantidos: O(1) por fila
+
+O índice é montado do banco no primeiro uso em cada processo e atualizado pelos
+eventos de movimentação do barramento (services/eventos.py). Com o backend em
+memória e vários workers, cada worker só vê as próprias escritas; por isso o
+índice é reconstruído a cada FILA_RESSINCRONIZAR_SEGUNDOS (0 desativa).
+"""
+from datetime import datetime
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from database.models import db, Paciente, Movimentacao
+
+logger = logging.getLogger(__name__)
+
+# Menor peso é atendido antes; prioridades não listadas entram como PESO_PADRAO
+PESOS_PRIORIDADE = {
+    'sala_vermelha': 0,
+    'idoso_80': 1,
+    'idoso_60': 2,
+    'gestante': 2,
+    'lactante': 2,
+    'pessoa_crianca_colo': 2,
+    'mobilidade_reduzida': 2,
+    'espectro_autista': 2,
+    'obeso': 2,
+    'raio_x': 3,
+}
+PESO_PADRAO = 9
+
+# Status que tiram a movimentação de qualquer fila
+STATUS_ENCERRADOS = frozenset({
+    'concluido', 'finalizado', 'cancelado', 'alta_medica', 'transferencia',
+    'internado', 'acompanhamento_ambulatorial'
+})
+
+COMPACTAR_A_PARTIR_DE = 64  # Entradas mortas toleradas antes de reorganizar o heap
+
+
+def peso_prioridade(prioridade):
+    return PESOS_PRIORIDADE.get(prioridade, PESO_PADRAO)
+
+
+def _data(valor):
+    if isinstance(valor, str):
+        return datetime.fromisoformat(valor)
+    return valor or datetime.min
+
+
+def em_fila(dados):
+    """Movimentação aberta: ativa, sem data de saída e com status não encerrado"""
+    return (dados.get('ativo', True) is not False
+            and not dados.get('data_saida')
+            and dados.get('status') not in STATUS_ENCERRADOS)
+
+
+class FilaPrioridade:
+    """Heap de uma fila com remoção preguiçosa"""
+
+    __slots__ = ('heap', 'vivos', 'mortos')
+
+    def __init__(self):
+        self.heap = []
+        self.vivos = {}  # id -> entrada viva
+        self.mortos = 0
+
+    def __len__(self):
+        return len(self.vivos)
+
+    def inserir(self, entrada):
+        """``entrada`` = (peso, data_entrada, id, sequencia, item)"""
+        self.vivos[entrada[2]] = entrada
+        heapq.heappush(self.heap, entrada)
+
+    def remover(self, id_):
+        if self.vivos.pop(id_, None) is None:
+            return
+        self.mortos += 1
+        heap = self.heap
+        while heap and self.vivos.get(heap[0][2]) is not heap[0]:
+            heapq.heappop(heap)
+            self.mortos -= 1
+        if self.mortos > COMPACTAR_A_PARTIR_DE and self.mortos > len(self.vivos):
+            self.heap = list(self.vivos.values())
+            heapq.heapify(self.heap)
+            self.mortos = 0
+
+    def proximos(self, limite):
+        """As ``limite`` primeiras entradas vivas, em ordem, sem alterar o heap"""
+        heap = self.heap
+        resultado = []
+        if not heap or limite <= 0:
+            return resultado
+        fronteira = [(heap[0], 0)]
+        while fronteira and len(resultado) < limite:
+            entrada, posicao = heapq.heappop(fronteira)
+            if self.vivos.get(entrada[2]) is entrada:
+                resultado.append(entrada)
+            for filho in (2 * posicao + 1, 2 * posicao + 2):
+                if filho < len(heap):
+                    heapq.heappush(fronteira, (heap[filho], filho))
+        return resultado
+
+
+class IndiceFila:
+    """Extensão Flask com as filas de atendimento em memória"""
+
+    def __init__(self, app=None, barramento=None, canal='movimentacoes'):
+        self._filas = {}
+        self._local = {}  # id -> (tipo, status) da fila em que está
+        self._lock = threading.RLock()
+        self._lock_carga = threading.Lock()
+        self._sequencia = itertools.count()
+        self._pid = None
+        self._carregado_em = 0
+        self._durante_carga = None
+        if app is not None and barramento is not None:
+            self.init_app(app, barramento, canal)
+
+    def init_app(self, app, barramento, canal='movimentacoes'):
+        self.app = app
+        self.barramento = barramento
+        self.ressincronizar = app.config['FILA_RESSINCRONIZAR_SEGUNDOS']
+        barramento.ouvir(canal, self._ao_receber_evento)
+        app.extensions['indice_fila'] = self
+
+    # ================================
+    # CARGA
+    # ================================
+
+    def _precisa_carregar(self):
+        vencido = self.ressincronizar and time.monotonic() - self._carregado_em > self.ressincronizar
+        return self._pid != os.getpid() or vencido
+
+    def _garantir_carregado(self):
+        if not self._precisa_carregar():
+            return
+        with self._lock_carga:
+            if self._precisa_carregar():
+                self.reconstruir()
+
+    def reconstruir(self):
+        """Monta todas as filas a partir das movimentações abertas no banco"""
+        self.barramento.iniciar()
+        with self._lock:
+            self._durante_carga = []
+
+        try:
+            linhas = db.session.execute(
+                db.select(
+                    Movimentacao.id, Movimentacao.paciente_id, Movimentacao.tipo, Movimentacao.status,
+                    Movimentacao.prioridade, Movimentacao.data_entrada, Paciente.nome, Paciente.prontuario
+                )
+                .join(Paciente, Paciente.id == Movimentacao.paciente_id)
+                .where(
+                    Movimentacao.ativo == True,
+                    Movimentacao.data_saida.is_(None),
+                    Movimentacao.status.not_in(STATUS_ENCERRADOS)
+                )
+            ).all()
+        except Exception:
+            with self._lock:
+                self._durante_carga = None
+            raise
+
+        filas = {}
+        local = {}
+        for id_, paciente_id, tipo, status, prioridade, data_entrada, nome, prontuario in linhas:
+            entrada = self._entrada({
+                'id': id_, 'paciente_id': paciente_id, 'tipo': tipo, 'status': status,
+                'prioridade': prioridade, 'data_entrada': data_entrada,
+                'paciente_nome': nome, 'paciente_prontuario': prontuario
+            })
+            fila = filas.get((tipo, status))
+            if fila is None:
+                fila = filas[(tipo, status)] = FilaPrioridade()
+            fila.vivos[id_] = entrada
+            fila.heap.append(entrada)
+            local[id_] = (tipo, status)
+        for fila in filas.values():
+            heapq.heapify(fila.heap)
+
+        with self._lock:
+            self._filas = filas
+            self._local = local
+            # Eventos que chegaram durante a consulta valem sobre o retrato do banco
+            for tipo_evento, dados in self._durante_carga:
+                self._aplicar(tipo_evento, dados)
+            self._durante_carga = None
+            self._pid = os.getpid()
+            self._carregado_em = time.monotonic()
+        logger.info(f"Filas de atendimento carregadas: {len(local)} movimentações em {len(filas)} filas")
+
+    def _entrada(self, dados):
+        data_entrada = _data(dados.get('data_entrada'))
+        item = {
+            'id': dados['id'],
+            'paciente_id': dados.get('paciente_id'),
+            'paciente_nome': dados.get('paciente_nome'),
+            'paciente_prontuario': dados.get('paciente_prontuario'),
+            'tipo': dados.get('tipo'),
+            'status': dados.get('status'),
+            'prioridade': dados.get('prioridade'),
+            'data_entrada': data_entrada.isoformat() if data_entrada != datetime.min else None
+        }
+        return (peso_prioridade(dados.get('prioridade')), data_entrada, dados['id'], next(self._sequencia), item)
+
+    # ================================
+    # ATUALIZAÇÃO INCREMENTAL
+    # ================================
+
+    def _ao_receber_evento(self, evento):
+        self.aplicar(evento.tipo, evento.dados)
+
+    def aplicar(self, tipo_evento, dados):
+        """Aplica uma alteração de movimentação (evento do barramento) às filas"""
+        with self._lock:
+            if self._durante_carga is not None:
+                self._durante_carga.append((tipo_evento, dados))
+            if self._pid == os.getpid():
+                self._aplicar(tipo_evento, dados)
+
+    def _aplicar(self, tipo_evento, dados):
+        id_ = dados['id']
+        chave = self._local.pop(id_, None)
+        if chave is not None:
+            fila = self._filas[chave]
+            fila.remover(id_)
+            if not fila:
+                del self._filas[chave]
+        if tipo_evento == 'movimentacao_excluida' or not em_fila(dados):
+            return
+        chave = (dados.get('tipo'), dados.get('status'))
+        fila = self._filas.get(chave)
+        if fila is None:
+            fila = self._filas[chave] = FilaPrioridade()
+        fila.inserir(self._entrada(dados))
+        self._local[id_] = chave
+
+    # ================================
+    # CONSULTA
+    # ================================
+
+    def _selecionar(self, tipo=None, status=None):
+        return [
+            (chave, fila) for chave, fila in self._filas.items()
+            if (tipo is None or chave[0] == tipo) and (status is None or chave[1] == status)
+        ]
+
+    def proximos(self, limite, tipo=None, status=None):
+        """Próximos ``limite`` pacientes das filas selecionadas, na ordem de atendimento"""
+        self._garantir_carregado()
+        with self._lock:
+            candidatos = [fila.proximos(limite) for _, fila in self._selecionar(tipo, status)]
+        return [entrada[4] for entrada in itertools.islice(heapq.merge(*candidatos), limite)]
+
+    def tamanhos(self, tipo=None, status=None):
+        """Quantidade de movimentações em cada fila (tipo, status) selecionada"""
+        self._garantir_carregado()
+        with self._lock:
+            return [
+                {'tipo': tipo_, 'status': status_, 'tamanho': len(fila)}
+                for (tipo_, status_), fila in sorted(self._selecionar(tipo, status), key=lambda f: f[0])
+            ]
@@ -0,0 +1,135 @@
+"""
+Cache de fragmentos de template e bytecode do Jinja em disco
+
+Trechos de página que só dependem do perfil (ou de nada) são marcados no
+template e renderizados uma vez por worker::
+
+    {% fragmento 'cartoes', current_user.tipo, versao_modulos %}
+        ...
+    {% endfragmento %}
+
+A chave é o template, a versão dele (hash do código-fonte), o nome do
+fragmento e os valores informados. Nada que varie por usuário ou requisição
+(nome, token CSRF) pode ficar dentro de um fragmento sem entrar na chave.
+Com o recarregamento automático de templates (desenvolvimento) o cache fica
+desligado e as edições aparecem na hora.
+
+Templates compilados vão para TEMPLATES_CACHE_PASTA (padrão: instance/jinja);
+``flask compilar-templates`` no build deixa tudo compilado antes do primeiro
+worker subir.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class CacheBytecodeDisco(FileSystemBytecodeCache):
+    """Bytecode dos templates em disco; a pasta só é criada ao gravar o primeiro"""
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+class ExtensaoFragmentos(Extension):
+    """Tag {% fragmento nome[, chave...] %}...{% endfragmento %}"""
+
+    tags = {'fragmento'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(cache_fragmentos=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        chaves = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            chaves.append(parser.parse_expression())
+        corpo = parser.parse_statements(('name:endfragmento',), drop_needle=True)
+        chamada = self.call_method('_renderizar', [nodes.Const(parser.name), nodes.List(chaves)])
+        return nodes.CallBlock(chamada, [], [], corpo).set_lineno(lineno)
+
+    def _renderizar(self, template, chaves, caller):
+        cache = self.environment.cache_fragmentos
+        if cache is None or template is None:  # Template sem nome (from_string): sem versão para a chave
+            return caller()
+        return cache.obter(template, tuple(chaves), caller)
+
+
+class CacheFragmentos:
+    """Extensão Flask com os fragmentos renderizados (LRU por worker) e o cache de bytecode"""
+
+    def __init__(self, app=None):
+        self._fragmentos = OrderedDict()
+        self._versoes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.maximo = app.config['FRAGMENTOS_MAXIMO']
+        pasta = app.config['TEMPLATES_CACHE_PASTA'] or os.path.join(app.instance_path, 'jinja')
+        app.jinja_env.bytecode_cache = CacheBytecodeDisco(pasta)
+        app.jinja_env.add_extension(ExtensaoFragmentos)
+        app.jinja_env.cache_fragmentos = self
+        app.extensions['cache_fragmentos'] = self
+
+    @property
+    def ativo(self):
+        # Lido por renderização: app.debug liga o recarregamento depois do init_app
+        return self.maximo > 0 and not self.app.jinja_env.auto_reload
+
+    # ================================
+    # FRAGMENTOS
+    # ================================
+
+    def versao(self, template):
+        """Hash do código-fonte do template (calculado uma vez por worker)"""
+        versao = self._versoes.get(template)
+        if versao is None:
+            env = self.app.jinja_env
+            fonte = env.loader.get_source(env, template)[0]
+            versao = self._versoes[template] = hashlib.blake2b(fonte.encode('utf-8'), digest_size=8).hexdigest()
+        return versao
+
+    def obter(self, template, chaves, renderizar):
+        if not self.ativo:
+            return renderizar()
+        chave = (template, self.versao(template)) + chaves
+        with self._lock:
+            fragmento = self._fragmentos.get(chave)
+            if fragmento is not None:
+                self._fragmentos.move_to_end(chave)
+                return fragmento
+        fragmento = Markup(renderizar())
+        with self._lock:
+            self._fragmentos[chave] = fragmento
+            while len(self._fragmentos) > self.maximo:
+                self._fragmentos.popitem(last=False)
+        return fragmento
+
+    def limpar(self):
+        with self._lock:
+            self._fragmentos.clear()
+            self._versoes.clear()
+
+    def __len__(self):
+        return len(self._fragmentos)
+
+    # ================================
+    # COMPILAÇÃO
+    # ================================
+
+    def compilar_templates(self):
+        """Carrega (e compila, se o bytecode não estiver em disco) todos os templates HTML"""
+        env = self.app.jinja_env
+        nomes = env.list_templates(filter_func=lambda nome: nome.endswith('.html'))
+        for nome in nomes:
+            env.get_template(nome)
+        return len(nomes)
@@ -0,0 +1,117 @@
+"""
+Ficha do paciente com o histórico de atendimentos
+
+- ``versao_paciente``: versão do conjunto (atualizado_em de paciente, endereço
+  e movimentações + quantidade de movimentações), base do ETag das rotas do
+  paciente (services/cache_respostas.py)
+- ``carregar_paciente``: paciente e endereço principal em uma única consulta
+- ``pagina_movimentacoes``: movimentações mais recentes primeiro, paginadas por
+  keyset (data_entrada, id) usando o índice (paciente_id, data_entrada)
+"""
+from datetime import datetime
+import base64
+import json
+
+from database.models import db, Paciente, Endereco, Movimentacao
+from services import serializacao
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+
+
+# ================================
+# CURSOR
+# ================================
+
+def codificar_cursor(data_entrada, id_):
+    bruto = json.dumps([data_entrada.isoformat() if data_entrada else None, id_]).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    try:
+        data_entrada, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(data_entrada), int(id_)
+    except Exception:
+        raise ValueError('Cursor de paginação inválido')
+
+
+# ================================
+# CONSULTAS
+# ================================
+
+def versao_paciente(paciente_id):
+    """
+    Versão do paciente e de tudo que aparece na ficha, ou None se o paciente
+    não existir. Consulta só índices; é o que decide o 304.
+    """
+    ultima_movimentacao = db.select(db.func.max(Movimentacao.atualizado_em)) \
+        .where(Movimentacao.paciente_id == Paciente.id).correlate(Paciente).scalar_subquery()
+    total_movimentacoes = db.select(db.func.count(Movimentacao.id)) \
+        .where(Movimentacao.paciente_id == Paciente.id).correlate(Paciente).scalar_subquery()
+
+    linha = db.session.execute(
+        db.select(Paciente.atualizado_em, Endereco.id, Endereco.atualizado_em, ultima_movimentacao, total_movimentacoes)
+        .select_from(Paciente)
+        .outerjoin(Endereco, db.and_(Endereco.paciente_id == Paciente.id, Endereco.principal == True))
+        .where(Paciente.id == paciente_id)
+        .limit(1)
+    ).first()
+    if linha is None:
+        return None
+    return tuple(linha)
+
+
+def carregar_paciente(paciente_id, campos=None):
+    """
+    Dados do paciente no formato de GET /api/paciente/<id> (endereço principal
+    embutido) mais o total de movimentações, ou None se não existir.
+    """
+    esquema = serializacao.PACIENTE_DETALHE
+    campos = campos or esquema.padrao
+    total_movimentacoes = db.select(db.func.count(Movimentacao.id)) \
+        .where(Movimentacao.paciente_id == Paciente.id).correlate(Paciente).scalar_subquery()
+
+    auxiliares = (Endereco.id, total_movimentacoes)
+    linha = db.session.execute(
+        db.select(*auxiliares, *esquema.colunas(campos))
+        .select_from(Paciente)
+        .outerjoin(Endereco, db.and_(Endereco.paciente_id == Paciente.id, Endereco.principal == True))
+        .where(Paciente.id == paciente_id)
+        .limit(1)
+    ).first()
+    if linha is None:
+        return None
+
+    dados = esquema.de_linhas([linha], campos, deslocamento=len(auxiliares))[0]
+    if linha[0] is None:
+        for campo in serializacao.CAMPOS_ENDERECO.intersection(dados):
+            del dados[campo]
+    dados['total_movimentacoes'] = linha[1]
+    return dados
+
+
+def pagina_movimentacoes(paciente_id, campos=None, limite=None, cursor=None):
+    """
+    Movimentações do paciente, mais recentes primeiro. Sem ``limite`` retorna
+    todas; com ``limite`` retorna (lista, proximo_cursor).
+    """
+    esquema = serializacao.MOVIMENTACAO
+    campos = campos or esquema.padrao
+    consulta = db.select(*esquema.colunas(campos), Movimentacao.data_entrada, Movimentacao.id) \
+        .where(Movimentacao.paciente_id == paciente_id)
+    if cursor:
+        data_entrada, id_ = decodificar_cursor(cursor)
+        consulta = consulta.where(db.tuple_(Movimentacao.data_entrada, Movimentacao.id) < (data_entrada, id_))
+    consulta = consulta.order_by(Movimentacao.data_entrada.desc(), Movimentacao.id.desc())
+
+    if limite is None:
+        return esquema.de_linhas(db.session.execute(consulta).all(), campos), None
+
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    linhas = db.session.execute(consulta.limit(limite + 1)).all()
+    proximo_cursor = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = codificar_cursor(linhas[-1][-2], linhas[-1][-1])
+    return esquema.de_linhas(linhas, campos), proximo_cursor
@@ -0,0 +1,295 @@
+"""
+Importação em lote de pacientes (CSV ou NDJSON)
+
+O arquivo é lido em fluxo, em lotes de ``tamanho_lote`` linhas. Para cada lote:
+
+1. validação dos campos obrigatórios, datas, valores aceitos (sexo, CEP, UF),
+   tamanho máximo de cada coluna e CPF (validação vetorizada)
+2. deduplicação por CPF dentro do lote e contra o banco (uma consulta por lote)
+3. alocação dos prontuários em bloco
+4. INSERT em massa de Paciente e Endereco em uma única transação
+
+Cada lote gera um evento de progresso com os erros por linha; nada além do lote
+atual fica em memória. Se o banco recusar o INSERT de um lote, a transação dele
+é desfeita, o evento traz ``falha`` e cada linha do lote entra nos erros; os
+lotes seguintes continuam.
+"""
+from datetime import datetime
+import csv
+import itertools
+import json
+import logging
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from database.models import db, Paciente, Endereco, normalizar_nome
+from services.cep import limpar_cep, formatar_cep
+from services.cpf import limpar_cpf, formatar_cpf, validar_cpfs
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ('csv', 'ndjson')
+FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y')
+VERDADEIRO = {'1', 'true', 'sim', 's', 'yes', 'y', 'x'}
+SEXOS = {'M': 'M', 'MASCULINO': 'M', 'F': 'F', 'FEMININO': 'F'}
+
+
+def _tamanhos(modelo):
+    """Tamanho máximo das colunas de texto do modelo (String(n))"""
+    return {c.name: c.type.length for c in modelo.__table__.columns if getattr(c.type, 'length', None)}
+
+
+TAMANHOS_PACIENTE = _tamanhos(Paciente)
+TAMANHOS_ENDERECO = _tamanhos(Endereco)
+
+
+class ErroImportacao(Exception):
+    """Arquivo ou parâmetros de importação inválidos"""
+
+
+def detectar_formato(nome_arquivo, tipo_conteudo=None):
+    nome = (nome_arquivo or '').lower()
+    tipo = (tipo_conteudo or '').lower()
+    if nome.endswith(('.ndjson', '.jsonl')) or 'ndjson' in tipo or 'jsonl' in tipo:
+        return 'ndjson'
+    if nome.endswith('.csv') or 'csv' in tipo:
+        return 'csv'
+    return None
+
+
+def ler_registros(arquivo, formato):
+    """Itera (numero_linha, dict) sobre um arquivo texto, sem carregá-lo inteiro"""
+    if formato == 'csv':
+        cabecalho = arquivo.readline()
+        if not cabecalho:
+            return
+        dialeto = csv.Sniffer().sniff(cabecalho, delimiters=',;|\t')
+        leitor = csv.DictReader(itertools.chain([cabecalho], arquivo), dialect=dialeto)
+        for registro in leitor:
+            yield leitor.line_num, {(k or '').strip().lower(): (v or '').strip() for k, v in registro.items()}
+    elif formato == 'ndjson':
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                yield numero, None
+                continue
+            yield numero, registro if isinstance(registro, dict) else None
+    else:
+        raise ErroImportacao(f"Formato não suportado: {formato}. Use csv ou ndjson.")
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _data(valor):
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _excede(campos, tamanhos):
+    """Mensagem de erro para o primeiro campo maior que a coluna, ou None"""
+    for campo, valor in campos.items():
+        limite = tamanhos.get(campo)
+        if limite and isinstance(valor, str) and len(valor) > limite:
+            return f"Campo '{campo}' excede {limite} caracteres"
+    return None
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    return str(valor or '').strip().lower() in VERDADEIRO
+
+
+class ImportadorPacientes:
+    """Executa a importação; ``alocador`` é o AlocadorProntuario da aplicação"""
+
+    def __init__(self, alocador, tamanho_lote=1000):
+        self.alocador = alocador
+        self.tamanho_lote = tamanho_lote
+
+    def importar(self, arquivo, formato):
+        """
+        Gera um evento por lote: {'lote', 'lidos', 'importados', 'duplicados', 'erros': [...]}.
+        O chamador acumula o resumo (ver ``resumir``).
+        """
+        registros = ler_registros(arquivo, formato)
+        for numero_lote in itertools.count(1):
+            lote = list(itertools.islice(registros, self.tamanho_lote))
+            if not lote:
+                break
+            yield self._processar_lote(numero_lote, lote)
+
+    def _processar_lote(self, numero_lote, lote):
+        erros = []
+        validos = []
+        for linha, registro in lote:
+            if registro is None:
+                erros.append({'linha': linha, 'erro': 'Linha mal formada'})
+                continue
+            paciente, endereco, erro = self._montar_paciente(registro)
+            if erro:
+                erros.append({'linha': linha, 'erro': erro})
+                continue
+            validos.append((linha, paciente, endereco))
+
+        # CPF: validação vetorizada dos que foram informados
+        com_cpf = [(i, item[1]['cpf']) for i, item in enumerate(validos) if item[1]['cpf']]
+        invalidos = set()
+        for (i, cpf), erro in zip(com_cpf, validar_cpfs(cpf for _, cpf in com_cpf)):
+            if erro:
+                invalidos.add(i)
+                erros.append({'linha': validos[i][0], 'erro': f'{erro}: {cpf}'})
+        validos = [item for i, item in enumerate(validos) if i not in invalidos]
+        for _, paciente, _ in validos:
+            if paciente['cpf']:
+                paciente['cpf'] = formatar_cpf(limpar_cpf(paciente['cpf']))
+
+        # Deduplicação: dentro do lote e contra o banco em uma única consulta
+        cpfs = {p['cpf'] for _, p, _ in validos if p['cpf']}
+        existentes = set()
+        if cpfs:
+            variantes = cpfs | {limpar_cpf(cpf) for cpf in cpfs}
+            for (cpf,) in db.session.execute(db.select(Paciente.cpf).where(Paciente.cpf.in_(variantes))):
+                existentes.add(formatar_cpf(limpar_cpf(cpf)))
+        duplicados = 0
+        vistos = set()
+        unicos = []
+        for linha, paciente, endereco in validos:
+            cpf = paciente['cpf']
+            if cpf and (cpf in existentes or cpf in vistos):
+                duplicados += 1
+                erros.append({'linha': linha, 'erro': f'CPF já cadastrado: {cpf}'})
+                continue
+            if cpf:
+                vistos.add(cpf)
+            unicos.append((linha, paciente, endereco))
+
+        evento = {
+            'lote': numero_lote,
+            'lidos': len(lote),
+            'importados': 0,
+            'duplicados': duplicados,
+            'erros': erros
+        }
+        if unicos:
+            try:
+                evento['importados'] = self._gravar(unicos)
+            except SQLAlchemyError as e:
+                # A transação do lote já foi desfeita por engine.begin()
+                logger.error(f"[IMPORTACAO] Lote {numero_lote} recusado pelo banco: {str(e)}")
+                evento['falha'] = f'Lote não gravado: {e.__class__.__name__}'
+                erros.extend({'linha': linha, 'erro': evento['falha']} for linha, _, _ in unicos)
+                erros.sort(key=lambda erro: erro['linha'])
+        return evento
+
+    def _montar_paciente(self, registro):
+        """Retorna (paciente, endereço ou None, erro): os dois dicionários prontos para o INSERT"""
+        nome = _texto(registro.get('nome'))
+        if not nome:
+            return None, None, 'Nome é obrigatório'
+        data_nascimento = _data(_texto(registro.get('data_nascimento')))
+        if not data_nascimento:
+            return None, None, 'Data de nascimento ausente ou inválida (use YYYY-MM-DD ou DD/MM/YYYY)'
+        sexo = SEXOS.get((_texto(registro.get('sexo')) or 'M').upper())
+        if not sexo:
+            return None, None, 'Sexo inválido (use M ou F)'
+        paciente = {
+            'nome': nome,
+            'nome_normalizado': normalizar_nome(nome),
+            'data_nascimento': data_nascimento,
+            'cpf': _texto(registro.get('cpf')),
+            'rg': _texto(registro.get('rg')),
+            'sexo': sexo,
+            'raca': _texto(registro.get('raca')) or 'NÃO INFORMADA',
+            'nacionalidade': _texto(registro.get('nacionalidade')) or 'BRASILEIRA',
+            'nome_mae': _texto(registro.get('nome_mae')),
+            'mae_desconhecida': _booleano(registro.get('mae_desconhecida')),
+            'nome_pai': _texto(registro.get('nome_pai')),
+            'email': _texto(registro.get('email')),
+            'telefone': _texto(registro.get('telefone')),
+            'convenio': _texto(registro.get('convenio')) or 'sus',
+            'numero_cartao': _texto(registro.get('numero_cartao')),
+            'titular_cartao': _texto(registro.get('titular_cartao')),
+        }
+        # O CPF é validado e formatado (14 caracteres) depois, em lote
+        erro = _excede({k: v for k, v in paciente.items() if k != 'cpf'}, TAMANHOS_PACIENTE)
+        if erro:
+            return None, None, erro
+
+        endereco = None
+        if _texto(registro.get('cep')):
+            cep = limpar_cep(_texto(registro.get('cep')))
+            if len(cep) != 8:
+                return None, None, f"CEP inválido: {registro.get('cep')}"
+            endereco = {
+                'cep': formatar_cep(cep),
+                'estado': (_texto(registro.get('estado')) or '').upper(),
+                'cidade': _texto(registro.get('cidade')) or '',
+                'bairro': _texto(registro.get('bairro')) or 'NÃO INFORMADO',
+                'logradouro': _texto(registro.get('logradouro')) or 'NÃO INFORMADO',
+                'numero': _texto(registro.get('numero')) or 'S/N',
+                'complemento': _texto(registro.get('complemento')),
+                'ponto_referencia': _texto(registro.get('ponto_referencia')),
+                'principal': True
+            }
+            if endereco['estado'] and not (len(endereco['estado']) == 2 and endereco['estado'].isalpha()):
+                return None, None, f"UF inválida: {endereco['estado']}"
+            erro = _excede(endereco, TAMANHOS_ENDERECO)
+            if erro:
+                return None, None, erro
+        return paciente, endereco, None
+
+    def _gravar(self, unicos):
+        """Pacientes e endereços do lote em uma transação; retorna quantos pacientes entraram"""
+        prontuarios = self.alocador.alocar(len(unicos))
+        pacientes = []
+        enderecos_por_prontuario = {}
+        for prontuario, (_, paciente, endereco) in zip(prontuarios, unicos):
+            paciente['prontuario'] = prontuario
+            pacientes.append(paciente)
+            if endereco:
+                enderecos_por_prontuario[prontuario] = endereco
+
+        tabela_pacientes = Paciente.__table__
+        with db.engine.begin() as conn:
+            if enderecos_por_prontuario:
+                ids = conn.execute(
+                    tabela_pacientes.insert().returning(tabela_pacientes.c.id, tabela_pacientes.c.prontuario),
+                    pacientes
+                ).all()
+                enderecos = [
+                    dict(enderecos_por_prontuario[prontuario], paciente_id=id_)
+                    for id_, prontuario in ids if prontuario in enderecos_por_prontuario
+                ]
+                conn.execute(Endereco.__table__.insert(), enderecos)
+            else:
+                conn.execute(tabela_pacientes.insert(), pacientes)
+        return len(pacientes)
+
+
+def resumir(eventos, limite_erros=1000):
+    """Consome os eventos de progresso e devolve o total; guarda até ``limite_erros`` erros"""
+    resumo = {'lidos': 0, 'importados': 0, 'duplicados': 0, 'total_erros': 0, 'lotes_com_falha': 0, 'erros': []}
+    for evento in eventos:
+        if evento.get('falha'):
+            resumo['lotes_com_falha'] += 1
+        resumo['lidos'] += evento['lidos']
+        resumo['importados'] += evento['importados']
+        resumo['duplicados'] += evento['duplicados']
+        resumo['total_erros'] += len(evento['erros'])
+        espaco = limite_erros - len(resumo['erros'])
+        if espaco > 0:
+            resumo['erros'].extend(evento['erros'][:espaco])
+    return resumo
@@ -0,0 +1,316 @@
+"""
+Instrumentação das requisições e exportação no formato Prometheus
+
+Por requisição são medidos:
+
+- latência por endpoint (histograma) e contagem por status
+- consultas SQL: quantidade e tempo (eventos do engine do SQLAlchemy)
+- espera para obter uma conexão do pool (inclui abrir uma nova, se preciso)
+  e, na coleta, a ocupação atual do pool (em uso, livres, excedentes)
+- dependências medidas com ``medir('nome')``: ViaCEP, bcrypt, serialização JSON
+
+Os totais vão para GET /metrics e, se METRICAS_SERVER_TIMING, para o
+cabeçalho Server-Timing (aparece na aba Network do navegador). Com
+METRICAS_ATIVAS desligado nada é registrado no Flask nem no SQLAlchemy e
+``medir`` devolve um contexto vazio.
+
+Os valores são do processo: com vários workers, cada um exporta os seus (o
+rótulo ``pid`` identifica o worker).
+"""
+from bisect import bisect_left
+import contextlib
+import os
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Limites dos histogramas, em segundos
+FAIXAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAIXAS_ESPERA = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_estado = threading.local()  # Medições da requisição em andamento nesta thread
+_NULO = contextlib.nullcontext()
+
+
+# ================================
+# TIPOS DE MÉTRICA
+# ================================
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=''):
+    partes = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class Contador:
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valores=(), quantidade=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + quantidade
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} counter']
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for valores, total in itens:
+            linhas.append(f'{self.nome}{_rotulos(self.rotulos, valores)} {total}')
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome, descricao, rotulos=(), faixas=FAIXAS_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.faixas = faixas
+        self._series = {}  # valores dos rótulos -> [contagens por faixa..., +Inf, soma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, valores=()):
+        posicao = bisect_left(self.faixas, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.faixas) + 1) + [0.0]
+            serie[posicao] += 1
+            serie[-1] += valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            itens = sorted((valores, list(serie)) for valores, serie in self._series.items())
+        for valores, serie in itens:
+            acumulado = 0
+            for limite, quantidade in zip(self.faixas + ('+Inf',), serie):
+                acumulado += quantidade
+                faixa = _rotulos(self.rotulos, valores, f'le="{limite}"')
+                linhas.append(f'{self.nome}_bucket{faixa} {acumulado}')
+            linhas.append(f'{self.nome}_sum{_rotulos(self.rotulos, valores)} {serie[-1]:.6f}')
+            linhas.append(f'{self.nome}_count{_rotulos(self.rotulos, valores)} {acumulado}')
+        return linhas
+
+
+# ================================
+# MEDIÇÕES DA REQUISIÇÃO
+# ================================
+
+class _Medicao:
+    __slots__ = ('metricas', 'tempos', 'nome', 'inicio')
+
+    def __init__(self, metricas, tempos, nome):
+        self.metricas = metricas
+        self.tempos = tempos
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracao = time.perf_counter() - self.inicio
+        self.tempos[self.nome] = self.tempos.get(self.nome, 0.0) + duracao
+        self.metricas.dependencias.observar(duracao, (self.nome,))
+        return False
+
+
+def medir(nome):
+    """
+    Mede um trecho (``with medir('viacep'): ...``) dentro de uma requisição
+    instrumentada; fora dela, ou com as métricas desligadas, não faz nada.
+    """
+    requisicao = getattr(_estado, 'requisicao', None)
+    if requisicao is None:
+        return _NULO
+    return _Medicao(requisicao[0], requisicao[1], nome)
+
+
+class Metricas:
+    """Extensão Flask com as métricas de desempenho do processo"""
+
+    def __init__(self, app=None, db=None):
+        self.ativas = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db=None):
+        self.ativas = app.config['METRICAS_ATIVAS']
+        self.server_timing = app.config['METRICAS_SERVER_TIMING']
+        app.extensions['metricas'] = self
+        if not self.ativas:
+            return
+
+        self.requisicoes = Histograma(
+            'hospital_requisicao_segundos', 'Latência das requisições por endpoint', ('endpoint', 'metodo')
+        )
+        self.respostas = Contador(
+            'hospital_respostas_total', 'Respostas por endpoint e status', ('endpoint', 'metodo', 'status')
+        )
+        self.sql_consultas = Contador(
+            'hospital_sql_consultas_total', 'Consultas SQL executadas durante requisições', ('endpoint',)
+        )
+        self.sql_tempo = Contador(
+            'hospital_sql_segundos_total', 'Tempo em consultas SQL durante requisições', ('endpoint',)
+        )
+        self.sql_por_requisicao = Histograma(
+            'hospital_sql_requisicao_segundos', 'Tempo em SQL por requisição', ('endpoint',)
+        )
+        self.espera_pool = Histograma(
+            'hospital_pool_checkout_segundos', 'Tempo para obter uma conexão do pool', (), FAIXAS_ESPERA
+        )
+        self.dependencias = Histograma(
+            'hospital_dependencia_segundos', 'Tempo em dependências (ViaCEP, bcrypt, JSON)', ('dependencia',)
+        )
+        self._todas = (
+            self.requisicoes, self.respostas, self.sql_consultas, self.sql_tempo,
+            self.sql_por_requisicao, self.espera_pool, self.dependencias
+        )
+
+        event.listen(Engine, 'before_cursor_execute', self._antes_sql)
+        event.listen(Engine, 'after_cursor_execute', self._depois_sql)
+        # Engines lidos na primeira requisição: o init_app não abre contexto nem toca no banco
+        self._db = db
+        self.engines = None if db is not None else {}
+        self._lock_engines = threading.Lock()
+
+        app.before_request(self._iniciar_requisicao)
+        app.after_request(self._finalizar_requisicao)
+        app.teardown_request(self._encerrar_requisicao)
+
+    # ================================
+    # SQL E POOL
+    # ================================
+
+    def _antes_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(_estado, 'requisicao', None) is not None:
+            conn.info['metricas_inicio'] = time.perf_counter()
+
+    def _depois_sql(self, conn, cursor, statement, parameters, context, executemany):
+        requisicao = getattr(_estado, 'requisicao', None)
+        inicio = conn.info.pop('metricas_inicio', None)
+        if requisicao is None or inicio is None:
+            return
+        tempos = requisicao[1]
+        tempos['sql'] = tempos.get('sql', 0.0) + time.perf_counter() - inicio
+        requisicao[2][0] += 1
+
+    def _carregar_engines(self):
+        """Engines da aplicação com o checkout do pool cronometrado (chamado com contexto ativo)"""
+        with self._lock_engines:
+            if self.engines is None:
+                engines = dict(self._db.engines)
+                for engine in engines.values():
+                    self._instrumentar_pool(engine)
+                    event.listen(engine, 'engine_disposed', self._instrumentar_pool)
+                self.engines = engines
+
+    def _instrumentar_pool(self, engine):
+        """Cronometra o checkout do pool (o SQLAlchemy não tem evento antes da espera)"""
+        pool = engine.pool
+        obter = pool._do_get
+        if getattr(obter, 'instrumentado', False):
+            return
+
+        def _do_get():
+            inicio = time.perf_counter()
+            try:
+                return obter()
+            finally:
+                duracao = time.perf_counter() - inicio
+                self.espera_pool.observar(duracao)
+                requisicao = getattr(_estado, 'requisicao', None)
+                if requisicao is not None:
+                    requisicao[1]['pool'] = requisicao[1].get('pool', 0.0) + duracao
+
+        _do_get.instrumentado = True
+        pool._do_get = _do_get
+
+    # ================================
+    # REQUISIÇÃO
+    # ================================
+
+    def _iniciar_requisicao(self):
+        if self.engines is None:
+            self._carregar_engines()
+        # (extensão, tempos por dependência, [consultas SQL], início)
+        _estado.requisicao = (self, {}, [0], time.perf_counter())
+
+    def _finalizar_requisicao(self, resposta):
+        requisicao = getattr(_estado, 'requisicao', None)
+        if requisicao is None:
+            return resposta
+        _, tempos, consultas, inicio = requisicao
+        total = time.perf_counter() - inicio
+        endpoint = request.endpoint or 'nao_encontrado'
+        metodo = request.method
+
+        self.requisicoes.observar(total, (endpoint, metodo))
+        self.respostas.incrementar((endpoint, metodo, str(resposta.status_code)))
+        if consultas[0]:
+            self.sql_consultas.incrementar((endpoint,), consultas[0])
+            self.sql_tempo.incrementar((endpoint,), tempos.get('sql', 0.0))
+            self.sql_por_requisicao.observar(tempos.get('sql', 0.0), (endpoint,))
+
+        if self.server_timing:
+            partes = [f'{nome};dur={duracao * 1000:.1f}' for nome, duracao in tempos.items() if nome != 'sql']
+            if consultas[0]:
+                partes.append(f'sql;dur={tempos.get("sql", 0.0) * 1000:.1f};desc="{consultas[0]} consultas"')
+            partes.append(f'app;dur={total * 1000:.1f}')
+            resposta.headers.add('Server-Timing', ', '.join(partes))
+        return resposta
+
+    def _encerrar_requisicao(self, erro=None):
+        _estado.requisicao = None
+
+    # ================================
+    # EXPORTAÇÃO
+    # ================================
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)"""
+        if not self.ativas:
+            return ''
+        linhas = [
+            '# HELP hospital_processo_info Worker que respondeu a coleta',
+            '# TYPE hospital_processo_info gauge',
+            f'hospital_processo_info{{pid="{os.getpid()}"}} 1',
+        ]
+        for metrica in self._todas:
+            linhas.extend(metrica.exportar())
+        linhas.extend(self._exportar_pools())
+        return '\n'.join(linhas) + '\n'
+
+    def _exportar_pools(self):
+        """Ocupação atual do pool de cada banco (QueuePool; SQLite em memória não tem)"""
+        linhas = [
+            '# HELP hospital_pool_conexoes Conexões do pool do worker por estado',
+            '# TYPE hospital_pool_conexoes gauge',
+            '# HELP hospital_pool_tamanho Tamanho configurado do pool (sem o excedente)',
+            '# TYPE hospital_pool_tamanho gauge',
+        ]
+        for bind, engine in (self.engines or {}).items():
+            pool = engine.pool  # Lido a cada coleta: o pool é trocado após o fork
+            if not hasattr(pool, 'checkedout'):
+                continue
+            banco = bind or 'principal'
+            for estado, valor in (
+                ('em_uso', pool.checkedout()),
+                ('livres', pool.checkedin()),
+                ('excedentes', max(0, pool.overflow())),
+            ):
+                linhas.append(f'hospital_pool_conexoes{_rotulos(("banco", "estado"), (banco, estado))} {valor}')
+            linhas.append(f'hospital_pool_tamanho{_rotulos(("banco",), (banco,))} {pool.size()}')
+        return linhas
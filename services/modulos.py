@@ -0,0 +1,163 @@
+"""
+Catálogo dos módulos do sistema, montado uma vez na inicialização
+
+As definições viram tuplas imutáveis com a classe de prioridade já resolvida,
+um índice por id e a lista de módulos visíveis para cada perfil. As rotas só
+leem o estado atual, que é trocado por inteiro (nunca alterado no lugar), então
+threads simultâneas não veem um catálogo pela metade.
+
+O status de cada módulo vem de verificações de saúde (banco, ViaCEP, ...)
+rodadas por uma thread em segundo plano a cada MODULOS_SAUDE_INTERVALO_SEGUNDOS,
+mais a lista MODULOS_MANUTENCAO. Quando algum status muda, o estado ganha uma
+versão nova; ela entra na chave do fragmento dos cartões em modulos.html, que é
+refeito para cada perfil no próximo acesso (ver services/fragmentos.py).
+"""
+from collections import namedtuple
+from types import MappingProxyType
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+Modulo = namedtuple('Modulo', 'id titulo icone permissoes priority_class status_class pagina')
+Estado = namedtuple('Estado', 'versao por_id por_perfil')
+
+PRIORIDADE_ALTA = frozenset(['reception', 'risk', 'doctor', 'nurse', 'pharmacy'])
+PRIORIDADE_MEDIA = frozenset(['lab', 'xray', 'nutrition', 'medical-accounts'])
+
+ATIVO = 'status-active'
+MANUTENCAO = 'status-maintenance'
+FORA_DO_AR = 'status-offline'
+
+TODOS = '*'  # Chave das verificações que valem para todos os módulos
+
+
+def classe_prioridade(modulo_id):
+    if modulo_id in PRIORIDADE_ALTA:
+        return 'priority-high'
+    if modulo_id in PRIORIDADE_MEDIA:
+        return 'priority-medium'
+    return 'priority-low'
+
+
+class RegistroModulos:
+    """Extensão Flask com o catálogo de módulos e o status de saúde"""
+
+    def __init__(self, app=None, definicoes=(), verificacoes=None):
+        self._estado = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        if app is not None:
+            self.init_app(app, definicoes, verificacoes)
+
+    def init_app(self, app, definicoes, verificacoes=None):
+        """
+        ``verificacoes``: id do módulo (ou ``'*'``) -> função sem argumentos que
+        retorna None se estiver tudo bem, ou um status; exceção = fora do ar.
+        """
+        self.app = app
+        self.intervalo = app.config['MODULOS_SAUDE_INTERVALO_SEGUNDOS']
+        self.manutencao = frozenset(filter(None, (m.strip() for m in app.config['MODULOS_MANUTENCAO'].split(','))))
+        self.verificacoes = dict(verificacoes or {})
+
+        pasta = os.path.join(app.root_path, app.template_folder, 'modulos')
+        self._modulos = tuple(
+            Modulo(
+                id=d['id'],
+                titulo=d['titulo'],
+                icone=d['icone'],
+                permissoes=frozenset(d['permissoes']),
+                priority_class=classe_prioridade(d['id']),
+                status_class=ATIVO,
+                pagina=os.path.exists(os.path.join(pasta, f"{d['id']}.html"))
+            )
+            for d in definicoes
+        )
+        self._perfis = frozenset(p for m in self._modulos for p in m.permissoes)
+        self._estado = self._montar(0, {m.id: MANUTENCAO if m.id in self.manutencao else ATIVO for m in self._modulos})
+        app.extensions['registro_modulos'] = self
+
+    def _montar(self, versao, status):
+        por_id = {m.id: m._replace(status_class=status[m.id]) for m in self._modulos}
+        por_perfil = {
+            perfil: tuple(m for m in por_id.values() if perfil in m.permissoes)
+            for perfil in self._perfis
+        }
+        return Estado(versao, MappingProxyType(por_id), MappingProxyType(por_perfil))
+
+    # ================================
+    # CONSULTA
+    # ================================
+
+    def obter(self, modulo_id):
+        self._garantir_monitor()
+        return self._estado.por_id.get(modulo_id)
+
+    def visiveis(self, perfil):
+        self._garantir_monitor()
+        return self._estado.por_perfil.get(perfil, ())
+
+    @property
+    def versao(self):
+        """Muda a cada troca de status; use na chave de caches do que depende dele"""
+        self._garantir_monitor()
+        return self._estado.versao
+
+    # ================================
+    # SAÚDE
+    # ================================
+
+    def verificar(self):
+        """Roda as verificações e troca o estado se algum status mudou"""
+        falhas = {}
+        for alvo, verificacao in self.verificacoes.items():
+            try:
+                resultado = verificacao()
+            except Exception as e:
+                logger.warning(f"[MODULOS] Verificação de saúde '{alvo}' falhou: {str(e)}")
+                resultado = FORA_DO_AR
+            if resultado:
+                falhas[alvo] = resultado
+
+        status = {}
+        for m in self._modulos:
+            if falhas.get(TODOS) == FORA_DO_AR or falhas.get(m.id) == FORA_DO_AR:
+                status[m.id] = FORA_DO_AR
+            elif m.id in self.manutencao or TODOS in falhas or m.id in falhas:
+                status[m.id] = MANUTENCAO
+            else:
+                status[m.id] = ATIVO
+
+        atual = self._estado
+        if any(atual.por_id[m.id].status_class != status[m.id] for m in self._modulos):
+            self._estado = self._montar(atual.versao + 1, status)
+            logger.info(f"[MODULOS] Status atualizado: {', '.join(f'{k}={v}' for k, v in status.items() if v != ATIVO) or 'todos ativos'}")
+
+    def _garantir_monitor(self):
+        """Inicia a thread de verificação no processo atual (também após fork do gunicorn)"""
+        if not self.verificacoes or self.intervalo <= 0:
+            return
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._monitorar, name='saude-modulos', daemon=True)
+            self._thread.start()
+
+    def _monitorar(self):
+        while not self._parar.is_set():
+            with self.app.app_context():
+                try:
+                    self.verificar()
+                except Exception:
+                    logger.exception("[MODULOS] Erro ao atualizar o status dos módulos")
+            self._parar.wait(self.intervalo)
+
+    def encerrar(self):
+        self._parar.set()
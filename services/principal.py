@@ -0,0 +1,130 @@
+"""
+Principal de sessão em cache
+
+O ``user_loader`` do Flask-Login passa a devolver um ``Principal``: um retrato
+compacto do usuário (somente as colunas usadas por requisição, sem os campos de
+texto grandes) mantido em memória por USUARIO_CACHE_TTL_SEGUNDOS. O retrato já
+traz o prazo de expiração da senha, então o ``before_request`` não acessa o banco.
+
+O cache do processo é invalidado quando a linha do usuário é alterada (no
+flush e de novo no commit ou rollback da sessão, para descartar um retrato que
+outra requisição tenha lido antes do commit) ou em login/logout; nos demais
+workers o TTL curto limita a defasagem.
+"""
+from datetime import timedelta
+import threading
+import time
+
+from flask import current_app
+from flask_login import user_logged_in, user_logged_out
+from sqlalchemy.orm import object_session
+
+from database.models import db
+
+
+class Principal:
+    """Usuário autenticado somente leitura, compatível com Flask-Login"""
+
+    __slots__ = ('id', 'username', 'nome', 'email', 'tipo', 'ativo', 'two_factor_enabled', 'senha_expira_em')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, **campos):
+        for campo in self.__slots__:
+            setattr(self, campo, campos.get(campo))
+
+    @property
+    def is_active(self):
+        return bool(self.ativo)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, outro):
+        return getattr(outro, 'id', None) == self.id and self.id is not None
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def carregar(self):
+        """Linha completa do usuário (ORM) para operações que alteram dados"""
+        return db.session.get(current_app.extensions['cache_principal'].modelo, self.id)
+
+    def registrar_atividade(self, ip_address, acao, detalhes):
+        current_app.extensions['gravador_auditoria'].registrar(
+            usuario_id=self.id,
+            ip_address=ip_address,
+            acao=acao,
+            detalhes=detalhes
+        )
+
+
+class CachePrincipal:
+    """Extensão Flask que mantém os Principals por id de usuário"""
+
+    colunas = ('id', 'username', 'nome', 'email', 'tipo', 'ativo', 'two_factor_enabled', 'ultima_alteracao_senha')
+
+    def __init__(self, app=None, modelo=None):
+        self._itens = {}
+        self._lock = threading.Lock()
+        if app is not None and modelo is not None:
+            self.init_app(app, modelo)
+
+    def init_app(self, app, modelo):
+        self.app = app
+        self.modelo = modelo
+        self.ttl = app.config['USUARIO_CACHE_TTL_SEGUNDOS']
+        self.validade_senha = timedelta(days=app.config['SENHA_VALIDADE_DIAS'])
+        app.extensions['cache_principal'] = self
+
+        db.event.listen(modelo, 'after_update', self._ao_alterar_usuario)
+        db.event.listen(modelo, 'after_delete', self._ao_alterar_usuario)
+        db.event.listen(db.session, 'after_commit', self._ao_encerrar_transacao)
+        db.event.listen(db.session, 'after_rollback', self._ao_encerrar_transacao)
+        user_logged_in.connect(self._ao_mudar_sessao, app)
+        user_logged_out.connect(self._ao_mudar_sessao, app)
+
+    def obter(self, usuario_id):
+        """Principal do usuário, do cache ou de uma consulta só com as colunas necessárias"""
+        agora = time.monotonic()
+        item = self._itens.get(usuario_id)
+        if item is not None and item[1] > agora:
+            return item[0]
+
+        linha = db.session.execute(
+            db.select(*(getattr(self.modelo, c) for c in self.colunas)).where(self.modelo.id == usuario_id)
+        ).first()
+        if linha is None:
+            self.invalidar(usuario_id)
+            return None
+
+        campos = linha._asdict()
+        ultima_alteracao = campos.pop('ultima_alteracao_senha')
+        campos['senha_expira_em'] = ultima_alteracao + self.validade_senha if ultima_alteracao else None
+        principal = Principal(**campos)
+        with self._lock:
+            self._itens[usuario_id] = (principal, agora + self.ttl)
+        return principal
+
+    def invalidar(self, usuario_id):
+        with self._lock:
+            self._itens.pop(usuario_id, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def _ao_alterar_usuario(self, mapper, connection, alvo):
+        self.invalidar(alvo.id)
+        sessao = object_session(alvo)
+        if sessao is not None:
+            sessao.info.setdefault('principais_alterados', set()).add(alvo.id)
+
+    def _ao_encerrar_transacao(self, sessao):
+        for usuario_id in sessao.info.pop('principais_alterados', ()):
+            self.invalidar(usuario_id)
+
+    def _ao_mudar_sessao(self, remetente, user=None, **extra):
+        if user is not None and getattr(user, 'id', None) is not None:
+            self.invalidar(user.id)
@@ -0,0 +1,248 @@
+"""
+Logs estruturados e assíncronos
+
+A thread da requisição só monta o registro e o coloca numa fila em memória
+(``QueueHandler``); um ``QueueListener`` por processo formata e grava no
+arquivo rotativo e no console. Cada linha é um objeto JSON com o id da
+requisição (cabeçalho X-Request-ID, recebido ou gerado), método, caminho e
+usuário, além dos campos passados em ``extra=``.
+
+- LOG_NIVEL e LOG_NIVEIS ('sqlalchemy.engine=WARNING,services.fila=DEBUG')
+  definem o nível do root e de cada logger
+- Registros DEBUG são amostrados por requisição (LOG_AMOSTRA_DEBUG): numa
+  requisição sorteada saem todos, nas demais nenhum
+- Fila cheia descarta o registro (contabilizado) em vez de bloquear a requisição
+- LOG_ACESSO grava uma linha por requisição (status, duração, tamanho)
+
+Com vários workers escrevendo no mesmo arquivo a rotação não é coordenada;
+em produção prefira o console (LOG_ARQUIVO vazio) e o coletor da plataforma.
+"""
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import g, has_request_context, request, session
+
+REQUEST_ID_VALIDO = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Atributos de todo LogRecord; o que sobrar veio de extra= e vai para o JSON
+_ATRIBUTOS_PADRAO = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+# ================================
+# FORMATAÇÃO E FILTROS
+# ================================
+
+class FormatadorJson(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record):
+        dados = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+            'origem': f'{record.module}:{record.lineno}',
+            'pid': record.process,
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and valor is not None:
+                dados[chave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados['excecao'] = record.exc_text
+        if record.stack_info:
+            dados['pilha'] = record.stack_info
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FiltroContexto(logging.Filter):
+    """
+    Roda na thread que gerou o registro (antes da fila): anexa os dados da
+    requisição e aplica a amostragem de DEBUG.
+    """
+
+    def __init__(self, taxa_debug):
+        super().__init__()
+        self.taxa_debug = taxa_debug
+
+    def filter(self, record):
+        if has_request_context():
+            contexto = g.get('log_contexto')
+            if contexto is None:
+                return record.levelno > logging.DEBUG
+            if record.levelno <= logging.DEBUG and not contexto['amostrado']:
+                return False
+            record.request_id = contexto['request_id']
+            record.metodo = contexto['metodo']
+            record.caminho = contexto['caminho']
+            record.usuario_id = contexto['usuario_id']
+        elif record.levelno <= logging.DEBUG and random.random() >= self.taxa_debug:
+            return False
+        return True
+
+
+class ManipuladorFila(QueueHandler):
+    """QueueHandler não bloqueante com um QueueListener por processo"""
+
+    def __init__(self, destinos, tamanho_fila):
+        super().__init__(queue.Queue(maxsize=tamanho_fila))
+        self.destinos = destinos
+        self.ouvinte = None
+        self.descartados = 0
+        self._pid = None
+        self._lock_ouvinte = threading.Lock()
+
+    def _garantir_ouvinte(self):
+        """Inicia o ouvinte no processo atual (também após fork do gunicorn)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock_ouvinte:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Fila herdada do processo pai pertence a ele
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.ouvinte = QueueListener(self.queue, *self.destinos, respect_handler_level=True)
+            self.ouvinte.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Mensagem e traceback resolvidos aqui; os campos extras seguem intactos.
+        # Sem cópia do registro: este é o único handler (tudo propaga até o root).
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def emit(self, record):
+        self._garantir_ouvinte()
+        super().emit(record)
+
+    def encerrar(self):
+        """Grava o que restou na fila (chamado no encerramento do processo)"""
+        if self.ouvinte is not None and self._pid == os.getpid():
+            self.ouvinte.stop()
+            self.ouvinte = None
+            self._pid = None
+
+
+# ================================
+# EXTENSÃO
+# ================================
+
+def interpretar_niveis(texto):
+    """'sqlalchemy.engine=WARNING,app=DEBUG' -> {'sqlalchemy.engine': 'WARNING', 'app': 'DEBUG'}"""
+    niveis = {}
+    for item in (texto or '').split(','):
+        if not item.strip():
+            continue
+        nome, _, nivel = item.partition('=')
+        nivel = nivel.strip().upper()
+        if not nome.strip() or not isinstance(logging.getLevelName(nivel), int):
+            raise ValueError(f"LOG_NIVEIS inválido: {item.strip()}")
+        niveis[nome.strip()] = nivel
+    return niveis
+
+
+class ArquivoRotativo(RotatingFileHandler):
+    """Arquivo rotativo que só cria a pasta quando grava o primeiro registro"""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class RegistroEstruturado:
+    """Extensão Flask que configura os logs do processo e o id de cada requisição"""
+
+    def __init__(self, app=None):
+        self.manipulador = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.taxa_debug = app.config['LOG_AMOSTRA_DEBUG']
+        self.acesso = app.config['LOG_ACESSO']
+        self.logger_acesso = logging.getLogger('acesso')
+
+        formatador = FormatadorJson() if app.config['LOG_FORMATO'] == 'json' else logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s [in %(pathname)s:%(lineno)d]'
+        )
+        destinos = [logging.StreamHandler()]
+        arquivo = app.config['LOG_ARQUIVO']
+        if arquivo:
+            destinos.append(ArquivoRotativo(
+                arquivo, maxBytes=app.config['LOG_TAMANHO_MAXIMO'], backupCount=app.config['LOG_ARQUIVOS'],
+                encoding='utf-8', delay=True
+            ))
+        for destino in destinos:
+            destino.setFormatter(formatador)
+
+        self.manipulador = ManipuladorFila(destinos, app.config['LOG_FILA_TAMANHO'])
+        self.manipulador.addFilter(FiltroContexto(self.taxa_debug))
+
+        raiz = logging.getLogger()
+        for anterior in [h for h in raiz.handlers if isinstance(h, ManipuladorFila)]:
+            raiz.removeHandler(anterior)
+        raiz.addHandler(self.manipulador)
+        raiz.setLevel(app.config['LOG_NIVEL'].upper())
+
+        # Tudo passa pelo root: sem o handler padrão do Flask no logger da aplicação
+        from flask.logging import default_handler
+        app.logger.removeHandler(default_handler)
+        app.logger.setLevel(logging.NOTSET)
+        for nome, nivel in interpretar_niveis(app.config['LOG_NIVEIS']).items():
+            logging.getLogger(nome).setLevel(nivel)
+
+        app.before_request(self._iniciar_requisicao)
+        app.after_request(self._finalizar_requisicao)
+        app.extensions['registro_estruturado'] = self
+        atexit.register(self.manipulador.encerrar)
+
+    # ================================
+    # REQUISIÇÃO
+    # ================================
+
+    def _iniciar_requisicao(self):
+        recebido = request.headers.get('X-Request-ID', '')
+        g.request_id = recebido if REQUEST_ID_VALIDO.match(recebido) else uuid.uuid4().hex
+        g.log_inicio = time.perf_counter()
+        # Lido uma vez por requisição; o filtro só copia para cada registro
+        g.log_contexto = {
+            'request_id': g.request_id,
+            'metodo': request.method,
+            'caminho': request.path,
+            'usuario_id': session.get('_user_id'),  # Gravado pelo Flask-Login; sem consultar o banco
+            'amostrado': random.random() < self.taxa_debug,
+        }
+
+    def _finalizar_requisicao(self, resposta):
+        resposta.headers['X-Request-ID'] = g.get('request_id', '')
+        if self.acesso:
+            duracao = (time.perf_counter() - g.get('log_inicio', time.perf_counter())) * 1000
+            self.logger_acesso.info(
+                '%s %s %s', request.method, request.path, resposta.status_code,
+                extra={'status': resposta.status_code, 'duracao_ms': round(duracao, 2),
+                       # Em respostas em fluxo (SSE, NDJSON) calcular o tamanho consumiria o gerador
+                       'tamanho': None if resposta.is_streamed else resposta.calculate_content_length()}
+            )
+        return resposta
@@ -0,0 +1,153 @@
+"""
+Hash e verificação de senhas (bcrypt) fora da thread da requisição
+
+Cada verificação custa centenas de milissegundos de CPU. Na troca de plantão,
+com dezenas de logins ao mesmo tempo, isso ocupava os workers do gunicorn e
+atrasava as rotas de pacientes. Aqui o bcrypt roda num pool de processos:
+
+- SENHAS_PROCESSOS processos por worker (padrão: núcleos / WEB_CONCURRENCY),
+  com prioridade reduzida (SENHAS_PRIORIDADE, ``nice``) para que o sistema
+  operacional atenda antes as requisições
+- no máximo SENHAS_CONCORRENCIA operações em andamento por worker; quem não
+  conseguir vaga em SENHAS_ESPERA_SEGUNDOS recebe ServicoSenhasOcupado (a
+  rota responde 503) em vez de entrar numa fila sem limite
+- um login correto com hash de custo diferente de BCRYPT_LOG_ROUNDS devolve
+  também o hash novo, calculado no mesmo processo, para ser gravado
+
+Com SENHAS_PROCESSOS = 0 (testes) o bcrypt roda na própria thread.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+class ServicoSenhasOcupado(Exception):
+    """Todas as vagas de verificação de senha do worker estão ocupadas"""
+
+
+def custo_do_hash(hash_senha):
+    """Custo (log2 das rodadas) gravado no hash: '$2b$12$...' -> 12"""
+    try:
+        return int(hash_senha.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+# ================================
+# FUNÇÕES DOS PROCESSOS
+# ================================
+
+def _gerar(senha, custo):
+    return bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds=custo)).decode('utf-8')
+
+
+def _verificar(hash_senha, senha, custo):
+    try:
+        valida = bcrypt.checkpw(senha.encode('utf-8'), hash_senha.encode('utf-8'))
+    except ValueError:  # Hash corrompido ou em outro formato
+        return False, None
+    if valida and custo_do_hash(hash_senha) != custo:
+        return True, _gerar(senha, custo)
+    return valida, None
+
+
+def _iniciar_processo(prioridade):
+    if prioridade and hasattr(os, 'nice'):
+        os.nice(prioridade)
+
+
+class ServicoSenhas:
+    """Extensão Flask com o pool de processos do bcrypt"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.custo = app.config['BCRYPT_LOG_ROUNDS']
+        self.processos = app.config['SENHAS_PROCESSOS']
+        self.prioridade = app.config['SENHAS_PRIORIDADE']
+        self.espera = app.config['SENHAS_ESPERA_SEGUNDOS']
+        self._vagas = threading.BoundedSemaphore(app.config['SENHAS_CONCORRENCIA'])
+        app.extensions['servico_senhas'] = self
+        atexit.register(self.encerrar)
+
+    # ================================
+    # OPERAÇÕES
+    # ================================
+
+    def gerar_hash(self, senha):
+        """Hash bcrypt com o custo configurado"""
+        return self._executar(_gerar, senha, self.custo)
+
+    def verificar(self, hash_senha, senha):
+        """
+        Retorna ``(valida, novo_hash)``; ``novo_hash`` só vem quando a senha
+        confere e o hash gravado foi gerado com outro custo.
+        """
+        if not hash_senha or senha is None:
+            return False, None
+        return self._executar(_verificar, hash_senha, senha, self.custo)
+
+    def _executar(self, funcao, *args):
+        if not self._vagas.acquire(timeout=self.espera):
+            logger.warning("[SENHAS] Sem vaga para verificação de senha; requisição recusada")
+            raise ServicoSenhasOcupado()
+        try:
+            executor = self._obter_executor()
+            if executor is None:
+                return funcao(*args)
+            try:
+                return executor.submit(funcao, *args).result()
+            except BrokenProcessPool:
+                # Processo morto (OOM, sinal): recria na próxima chamada e resolve esta aqui
+                logger.exception("[SENHAS] Pool de processos interrompido; recriando")
+                self._descartar_executor(executor)
+                return funcao(*args)
+        finally:
+            self._vagas.release()
+
+    # ================================
+    # POOL DE PROCESSOS
+    # ================================
+
+    def _obter_executor(self):
+        """Pool do processo atual; criado no primeiro uso (também após fork do gunicorn)"""
+        if self.processos <= 0:
+            return None
+        if self._pid == os.getpid() and self._executor is not None:
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid() or self._executor is None:
+                # Processos filhos por forkserver/spawn: não herdam as threads do worker
+                metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processos,
+                    mp_context=multiprocessing.get_context(metodo),
+                    initializer=_iniciar_processo,
+                    initargs=(self.prioridade,)
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _descartar_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def encerrar(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,267 @@
+"""
+Serialização das respostas JSON por projeção de colunas
+
+Em vez de carregar instâncias ORM e montar um dict campo a campo (``to_dict``)
+para o ``jsonify`` percorrer de novo, as rotas de leitura:
+
+1. escolhem os campos pelo ``Esquema`` do recurso (``?fields=id,nome,prontuario``
+   ou uma projeção nomeada, ``?projecao=resumo``)
+2. consultam só essas colunas, recebendo tuplas
+3. montam os dicts com ``zip`` e codificam com orjson, que serializa date e
+   datetime nativamente (sem isoformat() por linha)
+
+Sem o orjson instalado, cai para o json da biblioteca padrão com o mesmo
+formato de saída. ``comparar`` mede os dois caminhos (``flask medir-serializacao``).
+"""
+from collections import namedtuple
+from datetime import date, datetime
+import json
+import time
+
+from flask import Response, jsonify
+
+from database.models import db, Paciente, Endereco, Movimentacao
+from services.metricas import medir
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+Campo = namedtuple('Campo', 'nome coluna converter')
+
+
+class ErroCampos(ValueError):
+    """Campo inexistente pedido em ?fields="""
+
+
+# ================================
+# CODIFICAÇÃO
+# ================================
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+_codificador_padrao = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_valor_json)
+
+
+def codificar(dados):
+    """Serializa para bytes UTF-8; datas no formato ISO 8601"""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_NON_STR_KEYS)
+    return _codificador_padrao.encode(dados).encode('utf-8')
+
+
+def resposta_json(dados, status=200, headers=None):
+    with medir('json'):
+        corpo = codificar(dados)
+    return Response(corpo, status=status, headers=headers, mimetype='application/json')
+
+
+# ================================
+# ESQUEMAS
+# ================================
+
+class Esquema:
+    """
+    Campos expostos de um recurso: (nome, coluna[, conversor]).
+    ``padrao`` são os campos devolvidos quando nem ?fields= nem ?projecao= são
+    informados; ``projecoes`` nomeia conjuntos fixos de campos (ex.: 'resumo').
+    """
+
+    def __init__(self, campos, padrao=None, projecoes=None):
+        self.campos = {}
+        for definicao in campos:
+            nome, coluna, converter = (tuple(definicao) + (None,))[:3]
+            self.campos[nome] = Campo(nome, coluna, converter)
+        self.padrao = tuple(self.campos[nome] for nome in (padrao or self.campos))
+        self.projecoes = {'completo': self.padrao}
+        for nome, campos_projecao in (projecoes or {}).items():
+            self.projecoes[nome] = tuple(self.campos[campo] for campo in campos_projecao)
+
+    def selecionar(self, fields=None, projecao=None):
+        """
+        Campos pedidos em ``fields`` ('id,nome' ou lista) ou pela ``projecao`` nomeada;
+        ``fields`` tem precedência. Levanta ErroCampos para nomes inexistentes.
+        """
+        if not fields:
+            if not projecao:
+                return self.padrao
+            if projecao not in self.projecoes:
+                raise ErroCampos(f"Projeção inválida: {projecao}. Use {', '.join(self.projecoes)}.")
+            return self.projecoes[projecao]
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        nomes = [nome.strip() for nome in fields if nome.strip()]
+        desconhecidos = [nome for nome in nomes if nome not in self.campos]
+        if desconhecidos:
+            raise ErroCampos(
+                f"Campos inválidos: {', '.join(desconhecidos)}. Disponíveis: {', '.join(self.campos)}"
+            )
+        return tuple(self.campos[nome] for nome in dict.fromkeys(nomes)) or self.padrao
+
+    def usa_modelo(self, campos, modelo):
+        """Indica se algum dos campos vem do ``modelo`` (para evitar JOINs desnecessários)"""
+        return any(campo.coluna.class_ is modelo for campo in campos)
+
+    def colunas(self, campos):
+        """Colunas para o SELECT, rotuladas com o nome do campo"""
+        return [campo.coluna.label(campo.nome) for campo in campos]
+
+    def de_linhas(self, linhas, campos, deslocamento=0):
+        """Converte tuplas do banco em dicts; colunas além dos campos (no fim) são ignoradas"""
+        nomes = [campo.nome for campo in campos]
+        conversores = [(i, campo.converter) for i, campo in enumerate(campos) if campo.converter]
+        if not conversores:
+            if deslocamento:
+                return [dict(zip(nomes, linha[deslocamento:])) for linha in linhas]
+            return [dict(zip(nomes, linha)) for linha in linhas]
+        resultado = []
+        for linha in linhas:
+            valores = list(linha[deslocamento:deslocamento + len(nomes)])
+            for i, converter in conversores:
+                valores[i] = converter(valores[i])
+            resultado.append(dict(zip(nomes, valores)))
+        return resultado
+
+    def de_objeto(self, objeto, campos=None):
+        """Mesmo formato a partir de uma instância ORM já carregada (respostas de escrita)"""
+        dados = {}
+        for campo in campos or self.padrao:
+            valor = getattr(objeto, campo.coluna.key)
+            dados[campo.nome] = campo.converter(valor) if campo.converter else valor
+        return dados
+
+
+def _data_ou_vazio(formato):
+    def converter(valor):
+        return valor.strftime(formato) if valor else ''
+    return converter
+
+
+PACIENTE = Esquema([
+    ('id', Paciente.id),
+    ('prontuario', Paciente.prontuario),
+    ('nome', Paciente.nome),
+    ('data_nascimento', Paciente.data_nascimento),
+    ('rg', Paciente.rg),
+    ('cpf', Paciente.cpf),
+    ('sexo', Paciente.sexo),
+    ('raca', Paciente.raca),
+    ('nacionalidade', Paciente.nacionalidade),
+    ('nome_mae', Paciente.nome_mae),
+    ('mae_desconhecida', Paciente.mae_desconhecida),
+    ('nome_pai', Paciente.nome_pai),
+    ('email', Paciente.email),
+    ('telefone', Paciente.telefone),
+    ('convenio', Paciente.convenio),
+    ('numero_cartao', Paciente.numero_cartao),
+    ('titular_cartao', Paciente.titular_cartao),
+    ('data_cadastro', Paciente.data_cadastro),
+    ('atualizado_em', Paciente.atualizado_em),
+    ('ativo', Paciente.ativo),
+], padrao=(
+    'id', 'prontuario', 'nome', 'data_nascimento', 'rg', 'cpf', 'sexo', 'raca', 'nacionalidade',
+    'nome_mae', 'mae_desconhecida', 'nome_pai', 'email', 'telefone', 'convenio', 'numero_cartao',
+    'titular_cartao', 'data_cadastro', 'ativo'
+), projecoes={
+    # O que a lista de resultados da busca exibe
+    'resumo': ('id', 'prontuario', 'nome', 'cpf', 'rg', 'data_nascimento', 'sexo'),
+})
+
+# Formato histórico de GET /api/paciente/<id>: datas como texto e endereço principal embutido
+PACIENTE_DETALHE = Esquema([
+    ('id', Paciente.id),
+    ('prontuario', Paciente.prontuario),
+    ('nome', Paciente.nome),
+    ('cpf', Paciente.cpf),
+    ('rg', Paciente.rg),
+    ('data_nascimento', Paciente.data_nascimento, _data_ou_vazio('%Y-%m-%d')),
+    ('sexo', Paciente.sexo),
+    ('raca', Paciente.raca),
+    ('nacionalidade', Paciente.nacionalidade),
+    ('telefone', Paciente.telefone),
+    ('nome_mae', Paciente.nome_mae),
+    ('nome_pai', Paciente.nome_pai),
+    ('email', Paciente.email),
+    ('mae_desconhecida', Paciente.mae_desconhecida),
+    ('convenio', Paciente.convenio),
+    ('numero_cartao', Paciente.numero_cartao),
+    ('titular_cartao', Paciente.titular_cartao),
+    ('data_cadastro', Paciente.data_cadastro, _data_ou_vazio('%d/%m/%Y %H:%M')),
+    ('atualizado_em', Paciente.atualizado_em),
+    ('cep', Endereco.cep),
+    ('estado', Endereco.estado),
+    ('cidade', Endereco.cidade),
+    ('bairro', Endereco.bairro),
+    ('logradouro', Endereco.logradouro),
+    ('numero', Endereco.numero),
+    ('complemento', Endereco.complemento),
+    ('ponto_referencia', Endereco.ponto_referencia),
+], padrao=(
+    'id', 'prontuario', 'nome', 'cpf', 'rg', 'data_nascimento', 'sexo', 'raca', 'nacionalidade',
+    'telefone', 'nome_mae', 'nome_pai', 'email', 'mae_desconhecida', 'convenio', 'numero_cartao',
+    'titular_cartao', 'data_cadastro', 'cep', 'estado', 'cidade', 'bairro', 'logradouro', 'numero',
+    'complemento', 'ponto_referencia'
+), projecoes={
+    'resumo': ('id', 'prontuario', 'nome', 'cpf', 'rg', 'data_nascimento', 'sexo'),
+})
+CAMPOS_ENDERECO = frozenset(
+    nome for nome, campo in PACIENTE_DETALHE.campos.items() if campo.coluna.class_ is Endereco
+)
+
+MOVIMENTACAO = Esquema([
+    ('id', Movimentacao.id),
+    ('paciente_id', Movimentacao.paciente_id),
+    ('tipo', Movimentacao.tipo),
+    ('status', Movimentacao.status),
+    ('prioridade', Movimentacao.prioridade),
+    ('profissional_responsavel', Movimentacao.profissional_responsavel),
+    ('observacoes', Movimentacao.observacoes),
+    ('data_entrada', Movimentacao.data_entrada),
+    ('data_saida', Movimentacao.data_saida),
+    ('data_movimentacao', Movimentacao.data_entrada),  # Alias para compatibilidade
+    ('criado_em', Movimentacao.criado_em),
+    ('atualizado_em', Movimentacao.atualizado_em),
+    ('usuario_id', Movimentacao.usuario_id),
+    ('ativo', Movimentacao.ativo),
+])
+
+
+# ================================
+# MEDIÇÃO
+# ================================
+
+def comparar(modelo, esquema, limite=5000, repeticoes=3):
+    """
+    Mede (em ms, melhor de ``repeticoes``) to_dict + jsonify contra projeção +
+    codificar sobre até ``limite`` linhas do modelo. Requer contexto de aplicação.
+    """
+    campos = esquema.padrao
+
+    def via_orm():
+        objetos = db.session.execute(db.select(modelo).limit(limite)).scalars().all()
+        corpo = jsonify([objeto.to_dict() for objeto in objetos]).get_data()
+        db.session.expunge_all()
+        return corpo
+
+    def via_projecao():
+        linhas = db.session.execute(db.select(*esquema.colunas(campos)).limit(limite)).all()
+        return codificar(esquema.de_linhas(linhas, campos))
+
+    resultado = {}
+    for nome, funcao in (('orm_to_dict_jsonify', via_orm), ('projecao_codificar', via_projecao)):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            tamanho = len(funcao())
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        resultado[nome] = {'ms': round(min(tempos), 2), 'bytes': tamanho}
+    resultado['linhas'] = db.session.execute(
+        db.select(db.func.count()).select_from(db.select(modelo.id).limit(limite).subquery())
+    ).scalar()
+    resultado['codificador'] = 'orjson' if orjson is not None else 'json'
+    return resultado
@@ -1,5 +1,6 @@
 // Variáveis globais
 let pacienteSelecionado = null;
+let reservaPendente = null;  // Promise da reserva de prontuário em andamento
 
 // Sistema de Notificações Toast
 function showToast(type, title, message, duration = 3000) {
@@ -175,6 +176,16 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // Função para criar novo paciente
 async function createNewPatient(dados) {
+    // Esperar a reserva em andamento; cada reserva vale para um cadastro só
+    if (reservaPendente) {
+        await reservaPendente;
+    }
+    
+    // Enviar a reserva do prontuário exibido no formulário
+    if (window.reservaProntuario) {
+        dados.reserva_prontuario = window.reservaProntuario;
+    }
+    
     const response = await fetch('/api/pacientes', {
         method: 'POST',
         credentials: 'include',  // Incluir cookies de sessão
@@ -184,6 +195,11 @@ async function createNewPatient(dados) {
         }
     });
     
+    if (response.ok) {
+        // Reserva consumida: não pode ir em outro envio
+        window.reservaProntuario = null;
+    }
+    
     if (!response.ok) {
         let errorMessage = 'Erro ao cadastrar paciente';
         try {
@@ -208,9 +224,9 @@ async function createNewPatient(dados) {
     // Oferecer opção de imprimir etiqueta
     showEtiquetaOption(resultado.id, resultado.nome);
     
-    // Limpar formulário e gerar novo prontuário
+    // Limpar formulário e reservar novo prontuário (o Salvar só volta depois dela)
     document.getElementById('patientForm').reset();
-    gerarNumeroProntuario();
+    await gerarNumeroProntuario();
 }
 
 // Função para atualizar paciente existente
@@ -344,8 +360,24 @@ function initCpfValidation() {
     });
 }
 
-// Função para gerar número do prontuário
-async function gerarNumeroProntuario() {
+// Função para gerar número do prontuário (chamadas simultâneas compartilham a mesma reserva)
+function gerarNumeroProntuario() {
+    if (!reservaPendente) {
+        reservaPendente = reservarProntuario().finally(() => {
+            reservaPendente = null;
+        });
+    }
+    return reservaPendente;
+}
+
+async function reservarProntuario() {
+    // Sem envio até a nova reserva chegar: a anterior pode já ter sido usada
+    window.reservaProntuario = null;
+    const btnSalvar = document.getElementById('btnSalvar');
+    if (btnSalvar) {
+        btnSalvar.disabled = true;
+    }
+    
     try {
         const response = await fetch('/api/proximo-prontuario', {
             credentials: 'include'  // Incluir cookies de sessão
@@ -357,9 +389,14 @@ async function gerarNumeroProntuario() {
             if (prontuarioInput) {
                 prontuarioInput.value = dados.numero;
             }
+            window.reservaProntuario = dados.reserva;
         }
     } catch (error) {
         console.error('Erro ao gerar prontuário:', error);
+    } finally {
+        if (btnSalvar) {
+            btnSalvar.disabled = false;
+        }
     }
 }
 
@@ -644,7 +681,7 @@ window.searchPatients = async function(query) {
         // Mostrar loading
         showSearchLoading();
         
-        const url = `/api/pacientes?search=${encodeURIComponent(query)}`;
+        const url = `/api/pacientes?search=${encodeURIComponent(query)}&projecao=resumo`;
         
         const response = await fetch(url, {
             method: 'GET',
@@ -774,7 +811,8 @@ async function selectPatientForView(patientId) {
         console.log(`🔍 Iniciando carregamento do paciente ID: ${patientId}`);
         showInfo('Carregando', 'Carregando dados do paciente...');
         
-        const response = await fetch(`/api/paciente/${patientId}`, {
+        // Ficha completa (paciente + movimentações recentes) em uma requisição
+        const response = await fetch(`/api/paciente/${patientId}/detalhes`, {
             method: 'GET',
             credentials: 'include',  // Incluir cookies de sessão
             headers: {
@@ -790,7 +828,8 @@ async function selectPatientForView(patientId) {
             throw new Error(`Erro ${response.status}: ${errorText}`);
         }
 
-        const patient = await response.json();
+        const dados = await response.json();
+        const patient = dados.paciente;
         console.log('📄 Dados do paciente recebidos:', patient);
         
         // Verificar se os dados do paciente são válidos
@@ -802,6 +841,11 @@ async function selectPatientForView(patientId) {
         // Armazenar paciente selecionado globalmente
         pacienteSelecionado = patient;
         
+        // Histórico já veio junto: evita uma segunda requisição na aba de movimentações
+        if (!dados.proximo_cursor) {
+            movimentacoesCache.set(patient.id, dados.movimentacoes);
+        }
+        
         // NOVA FUNCIONALIDADE: Sincronizar com todas as abas
         syncPatientDataToAllTabs(patient);
         
@@ -1389,6 +1433,90 @@ function updatePatientStatus(newStatus, movementType = null) {
 // Cache para armazenar movimentações
 let movimentacoesCache = new Map();
 
+// Atualizações ao vivo (SSE): alterações feitas em outras estações invalidam o cache.
+// Sem EventSource, ou quando o servidor recusa o fluxo (503: worker sem vaga),
+// a tela consulta /api/movimentacoes/eventos/recentes e tenta o fluxo de novo depois.
+const EVENTOS_TIPOS = ['movimentacao_criada', 'movimentacao_atualizada', 'movimentacao_excluida'];
+const EVENTOS_NOVA_TENTATIVA_FLUXO_MS = 5 * 60 * 1000;
+
+function iniciarEventosMovimentacoes() {
+    let ultimoEvento = null;
+
+    const recarregarSelecionado = (pacienteId) => {
+        if (pacienteSelecionado && pacienteSelecionado.id && (!pacienteId || pacienteSelecionado.id === pacienteId)) {
+            carregarHistoricoMovimentacoes(pacienteSelecionado.id, true);
+        }
+    };
+
+    const aplicarEvento = (tipo, dados) => {
+        console.log(`📡 [EVENTOS] ${tipo}: movimentação ${dados.id} do paciente ${dados.paciente_id}`);
+        movimentacoesCache.delete(dados.paciente_id);
+        recarregarSelecionado(dados.paciente_id);
+    };
+
+    // Eventos perdidos durante a desconexão: descarta todo o cache
+    const recarregarTudo = () => {
+        movimentacoesCache.clear();
+        recarregarSelecionado(null);
+    };
+
+    const consultar = (ate) => {
+        const passo = async () => {
+            let intervalo = 10;
+            try {
+                const parametros = ultimoEvento === null ? '' : `?ultimo_evento=${encodeURIComponent(ultimoEvento)}`;
+                const resposta = await fetch(`/api/movimentacoes/eventos/recentes${parametros}`, { credentials: 'same-origin' });
+                if (resposta.ok) {
+                    const dados = await resposta.json();
+                    if (dados.recarregar) {
+                        recarregarTudo();
+                    }
+                    dados.eventos.forEach(evento => aplicarEvento(evento.tipo, evento.dados));
+                    ultimoEvento = dados.ultimo_evento;
+                    intervalo = dados.intervalo;
+                }
+            } catch (erro) {
+                console.warn('⚠️ [EVENTOS] Falha na consulta de eventos:', erro);
+            }
+            if (Date.now() < ate) {
+                setTimeout(passo, intervalo * 1000);
+            } else {
+                abrirFluxo();
+            }
+        };
+        passo();
+    };
+
+    const abrirFluxo = () => {
+        const parametros = ultimoEvento ? `?ultimo_evento=${encodeURIComponent(ultimoEvento)}` : '';
+        const fonte = new EventSource(`/api/movimentacoes/eventos${parametros}`);
+
+        EVENTOS_TIPOS.forEach(tipo => {
+            fonte.addEventListener(tipo, (evento) => {
+                ultimoEvento = evento.lastEventId || ultimoEvento;
+                aplicarEvento(tipo, JSON.parse(evento.data));
+            });
+        });
+        fonte.addEventListener('recarregar', recarregarTudo);
+
+        fonte.addEventListener('error', () => {
+            // Queda de rede: o navegador reconecta sozinho. Resposta de erro (503): fecha de vez
+            if (fonte.readyState === EventSource.CLOSED) {
+                console.warn('⚠️ [EVENTOS] Fluxo ao vivo indisponível; consultando em intervalos');
+                consultar(Date.now() + EVENTOS_NOVA_TENTATIVA_FLUXO_MS);
+            }
+        });
+    };
+
+    if (window.EventSource) {
+        abrirFluxo();
+    } else {
+        consultar(Infinity);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', iniciarEventosMovimentacoes);
+
 // Função para salvar nova movimentação
 async function salvarMovimentacao() {
     try {
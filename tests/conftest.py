@@ -0,0 +1,86 @@
+"""
+Fixtures compartilhadas: a aplicação com TestingConfig (SQLite em memória,
+auditoria síncrona, perfil de consultas com orçamento estrito) e um cliente já
+autenticado como o admin padrão.
+"""
+import os
+import sys
+
+os.environ['FLASK_ENV'] = 'testing'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+
+import pytest
+
+import app as aplicacao
+from database import migracoes
+from database.models import db, Paciente, Movimentacao
+
+
+@pytest.fixture
+def app():
+    """Banco novo por teste; cada requisição do cliente abre seu próprio contexto (e sessão)"""
+    aplicacao.limiter.enabled = False
+    with aplicacao.app.app_context():
+        migracoes.migrar()
+        aplicacao.criar_admin_padrao()
+    yield aplicacao.app
+    with aplicacao.app.app_context():
+        db.drop_all()
+        # A tabela FTS5 da busca não faz parte dos modelos e sobreviveria no banco em memória
+        db.session.execute(db.text('DROP TABLE IF EXISTS pacientes_fts'))
+        db.session.commit()
+    aplicacao.cache_principal.limpar()
+    aplicacao.cache_respostas.limpar()
+    aplicacao.indice_fila._pid = None  # Filas em memória são remontadas do banco do próximo teste
+    aplicacao.perfil_consultas.excessos.clear()
+    aplicacao.controle_bloqueios._bloqueios.clear()
+    aplicacao.controle_bloqueios.init_app(aplicacao.app)  # Armazenamento em memória novo: tentativas zeradas
+    aplicacao.resolvedor_cep.init_app(aplicacao.app)  # Cache de CEPs vazio e circuito fechado
+
+
+@pytest.fixture
+def admin_id(app):
+    with app.app_context():
+        return aplicacao.Usuario.query.filter_by(username='admin').one().id
+
+
+@pytest.fixture
+def cliente(app, admin_id):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['_user_id'] = str(admin_id)
+        sessao['_fresh'] = True
+    return cliente
+
+
+@pytest.fixture
+def criar_paciente(app):
+    """Grava um paciente e retorna o id"""
+    def criar(nome='Maria da Silva', **campos):
+        with app.app_context():
+            paciente = Paciente(
+                prontuario=campos.pop('prontuario', None) or aplicacao.alocador_prontuario.proximo(),
+                nome=nome,
+                data_nascimento=campos.pop('data_nascimento', date(1980, 5, 17)),
+                sexo=campos.pop('sexo', 'F'),
+                raca=campos.pop('raca', 'parda'),
+                **campos
+            )
+            db.session.add(paciente)
+            db.session.commit()
+            return paciente.id
+    return criar
+
+
+@pytest.fixture
+def criar_movimentacao(app, admin_id):
+    """Grava uma movimentação e retorna o id"""
+    def criar(paciente_id, tipo='emergencia', status='aguardando_acolhimento', **campos):
+        with app.app_context():
+            movimentacao = Movimentacao(paciente_id=paciente_id, tipo=tipo, status=status, usuario_id=admin_id, **campos)
+            db.session.add(movimentacao)
+            db.session.commit()
+            return movimentacao.id
+    return criar
@@ -0,0 +1,129 @@
+"""
+Gravação assíncrona do log de auditoria: lotes, encerramento e política de excesso
+"""
+import atexit
+from datetime import datetime
+import time
+
+import pytest
+
+import app as aplicacao
+from database.models import db
+from services.auditoria import GravadorAuditoria
+
+
+@pytest.fixture
+def gravador(app, admin_id, monkeypatch, tmp_path):
+    """Gravador assíncrono próprio (o da aplicação é síncrono nos testes)"""
+    def criar(**config):
+        valores = dict(AUDITORIA_ASSINCRONA=True, AUDITORIA_LOTE=3, AUDITORIA_INTERVALO_SEGUNDOS=10.0,
+                       AUDITORIA_FILA_TAMANHO=100, AUDITORIA_POLITICA_EXCESSO='arquivo',
+                       AUDITORIA_ARQUIVO_EXCESSO=str(tmp_path / 'pendente.jsonl'))
+        valores.update(config)
+        for chave, valor in valores.items():
+            monkeypatch.setitem(app.config, chave, valor)
+        monkeypatch.setitem(app.extensions, 'gravador_auditoria', aplicacao.gravador_auditoria)
+        novo = GravadorAuditoria(app, aplicacao.LogAuditoria)
+        criados.append(novo)
+        return novo
+
+    criados = []
+    yield criar
+    for novo in criados:
+        novo.encerrar(timeout=1)
+        atexit.unregister(novo.encerrar)
+
+
+def contar_registros(app, acao='TESTE'):
+    with app.app_context():
+        return aplicacao.LogAuditoria.query.filter_by(acao=acao).count()
+
+
+def esperar(condicao, segundos=2.0):
+    limite = time.monotonic() + segundos
+    while not condicao() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicao()
+
+
+def test_registros_gravados_em_lote_fora_da_requisicao(app, admin_id, gravador):
+    auditoria = gravador()
+    for _ in range(2):
+        auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'x')
+    assert auditoria.contadores['enfileirados'] == 2
+    assert contar_registros(app) == 0  # Lote incompleto espera o intervalo
+
+    auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'x')
+    assert esperar(lambda: auditoria.contadores['gravados'] == 3)
+    assert contar_registros(app) == 3
+
+    auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'ultimo')
+    auditoria.encerrar(timeout=1)  # Encerramento grava o que restou na fila
+    assert contar_registros(app) == 4
+
+
+def test_fila_cheia_vai_para_arquivo_e_e_reprocessada(app, admin_id, gravador, monkeypatch, tmp_path):
+    auditoria = gravador(AUDITORIA_FILA_TAMANHO=1)
+    monkeypatch.setattr(auditoria, '_garantir_thread', lambda: None)  # Ninguém consome a fila
+    auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'na fila')
+    auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'no arquivo')
+    assert auditoria.contadores['em_arquivo'] == 1
+    assert 'no arquivo' in (tmp_path / 'pendente.jsonl').read_text(encoding='utf-8')
+
+    with app.app_context():
+        assert auditoria.reprocessar_arquivo() == 1
+    assert not (tmp_path / 'pendente.jsonl').exists()
+    assert contar_registros(app) == 1
+
+
+def test_reprocessamento_anexa_pendencias_e_nao_duplica_apos_falha(app, admin_id, gravador, tmp_path):
+    auditoria = gravador()  # Lotes de 3
+    registro = {'usuario_id': admin_id, 'ip_address': None, 'acao': 'TESTE', 'detalhes': 'x',
+                'data_hora': datetime.utcnow()}
+    auditoria._gravar_arquivo([registro] * 2)
+    (tmp_path / 'pendente.jsonl').rename(tmp_path / 'pendente.jsonl.processando')  # Tentativa anterior
+    auditoria._gravar_arquivo([registro] * 3)
+    with open(tmp_path / 'pendente.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{corrompido\n')  # Falha depois do primeiro lote
+
+    with app.app_context():
+        with pytest.raises(ValueError):
+            auditoria.reprocessar_arquivo()
+    assert contar_registros(app) == 0  # Primeiro lote desfeito junto
+    processando = tmp_path / 'pendente.jsonl.processando'
+    assert not (tmp_path / 'pendente.jsonl').exists()
+    assert len(processando.read_text(encoding='utf-8').splitlines()) == 6
+
+    processando.write_text(processando.read_text(encoding='utf-8').replace('{corrompido\n', ''), encoding='utf-8')
+    auditoria._gravar_arquivo([registro])  # Novas pendências durante a falha
+    with app.app_context():
+        assert auditoria.reprocessar_arquivo() == 6
+        assert auditoria.reprocessar_arquivo() == 0
+    assert contar_registros(app) == 6
+    assert not processando.exists()
+
+
+def test_fila_cheia_com_descarte_so_contabiliza(app, admin_id, gravador, monkeypatch):
+    auditoria = gravador(AUDITORIA_FILA_TAMANHO=1, AUDITORIA_POLITICA_EXCESSO='descartar')
+    monkeypatch.setattr(auditoria, '_garantir_thread', lambda: None)
+    for _ in range(3):
+        auditoria.registrar(admin_id, '127.0.0.1', 'TESTE', 'x')
+    assert auditoria.contadores['descartados'] == 2
+    assert auditoria.contadores['enfileirados'] == 1
+
+
+def test_falha_do_banco_manda_o_lote_para_o_arquivo(app, admin_id, gravador, tmp_path):
+    auditoria = gravador()
+    with app.app_context():
+        db.session.execute(db.text('DROP TABLE log_auditoria'))
+        db.session.commit()
+    auditoria._gravar_lote([{'usuario_id': admin_id, 'ip_address': None, 'acao': 'TESTE',
+                             'detalhes': 'x', 'data_hora': datetime.utcnow()}])
+    assert auditoria.contadores['falhas'] == 1
+    assert auditoria.contadores['em_arquivo'] == 1
+    assert (tmp_path / 'pendente.jsonl').exists()
+
+
+def test_politica_invalida_e_recusada(app, gravador):
+    with pytest.raises(ValueError):
+        gravador(AUDITORIA_POLITICA_EXCESSO='ignorar')
@@ -0,0 +1,190 @@
+"""
+Bloqueio temporário de login: armazenamento das tentativas e rota /login
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as aplicacao
+from database.models import db
+from services import bloqueios
+from services.bloqueios import ArmazenamentoMemoria, ArmazenamentoRedis, ControleBloqueios, PAUSA_APOS_FALHA
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """time.monotonic do módulo controlado pelo teste"""
+    agora = [1000.0]
+    monkeypatch.setattr(bloqueios.time, 'monotonic', lambda: agora[0])
+    return agora
+
+
+class ArmazenamentoForaDoAr:
+    """Redis caído: toda operação falha"""
+
+    def __init__(self):
+        self.chamadas = 0
+
+    def __getattr__(self, operacao):
+        def falhar(*args):
+            self.chamadas += 1
+            raise ConnectionError('Connection refused')
+        return falhar
+
+
+class PipelineRedisFalso:
+    """SET (com NX/EX) e INCR sobre um dicionário, como num MULTI/EXEC"""
+
+    def __init__(self, dados, expiracoes):
+        self.dados, self.expiracoes, self.comandos = dados, expiracoes, []
+
+    def set(self, chave, valor, ex=None, nx=False):
+        self.comandos.append(('set', chave, valor, ex, nx))
+
+    def incr(self, chave):
+        self.comandos.append(('incr', chave))
+
+    def execute(self):
+        resultados = []
+        for comando in self.comandos:
+            if comando[0] == 'set':
+                _, chave, valor, ex, nx = comando
+                if nx and chave in self.dados:
+                    resultados.append(None)
+                    continue
+                self.dados[chave], self.expiracoes[chave] = valor, ex
+                resultados.append(True)
+            else:
+                self.dados[comando[1]] += 1  # INCR mantém a expiração
+                resultados.append(self.dados[comando[1]])
+        return resultados
+
+
+def entrar(cliente, senha, username='admin'):
+    return cliente.post('/login', data={'username': username, 'password': senha}).get_json()
+
+
+def test_armazenamento_memoria_conta_em_janela_fixa(relogio):
+    armazenamento = ArmazenamentoMemoria()
+    assert armazenamento.incrementar('tentativas:ana', 60) == 1
+    relogio[0] += 50
+    assert armazenamento.incrementar('tentativas:ana', 60) == 2  # Não estende a janela
+    relogio[0] += 10
+    assert armazenamento.obter('tentativas:ana') is None
+    assert armazenamento.incrementar('tentativas:ana', 60) == 1
+
+    armazenamento.definir('ativo:ana', 123.0, 5)
+    assert armazenamento.obter('ativo:ana') == 123.0
+    armazenamento.remover('ativo:ana', 'tentativas:ana', 'inexistente')
+    assert armazenamento.obter('ativo:ana') is None
+
+
+def test_controle_bloqueia_ao_atingir_o_limite_e_limpa_no_login(relogio):
+    controle = ControleBloqueios()
+    controle.limite = 3
+    controle.duracao = timedelta(minutes=15)
+    controle.armazenamento = ArmazenamentoMemoria()
+
+    assert controle.registrar_falha('ana') == (1, None)
+    assert controle.registrar_falha('ana') == (2, None)
+    tentativas, ate = controle.registrar_falha('ana')
+    assert tentativas == 3
+    assert ate > datetime.now() + timedelta(minutes=14)
+    assert controle.bloqueado_ate('ana') == ate
+    assert controle.bloqueado_ate('bruno') is None
+
+    # Outro worker: sem a lembrança local, o bloqueio vem do armazenamento compartilhado
+    outro = ControleBloqueios()
+    outro.armazenamento = controle.armazenamento
+    assert outro.bloqueado_ate('ana') is not None
+
+    controle.limpar('ana')
+    assert controle.bloqueado_ate('ana') is None
+    assert controle.registrar_falha('ana') == (1, None)
+
+
+def test_bloqueio_vencido_e_esquecido():
+    controle = ControleBloqueios()
+    controle.armazenamento = ArmazenamentoMemoria()
+    controle.lembrar('ana', datetime.now() + timedelta(seconds=30))
+    controle._bloqueios['ana'] = datetime.now() - timedelta(seconds=1)
+    assert controle.bloqueado_ate('ana') is None
+    assert 'ana' not in controle._bloqueios
+
+
+@pytest.mark.parametrize('armazenamento', ['memoria', 'banco'])
+def test_login_recusado_durante_o_bloqueio(app, armazenamento, monkeypatch):
+    controle = aplicacao.controle_bloqueios
+    if armazenamento == 'banco':
+        monkeypatch.setattr(controle, 'armazenamento', None)
+    cliente = app.test_client()
+
+    assert 'Mais 1 tentativa' not in entrar(cliente, 'errada')['message']
+    assert 'Mais 1 tentativa' in entrar(cliente, 'errada')['message']
+    entrar(cliente, 'errada')
+
+    resposta = entrar(cliente, 'admin123')
+    assert resposta['status'] == 'error'
+    assert 'temporariamente bloqueada' in resposta['message']
+    with app.app_context():
+        usuario = aplicacao.Usuario.query.filter_by(username='admin').one()
+        assert usuario.bloqueado_ate > datetime.now()
+
+        # Bloqueio vencido: o login correto entra e zera as tentativas
+        usuario.bloqueado_ate = datetime.now() - timedelta(seconds=1)
+        db.session.commit()
+    controle.esquecer('admin')
+    if controle.armazenamento is not None:
+        controle.armazenamento.remover('ativo:admin')
+
+    assert entrar(cliente, 'admin123')['status'] == 'success'
+    with app.app_context():
+        usuario = aplicacao.Usuario.query.filter_by(username='admin').one()
+        assert usuario.tentativas_login == 0
+        assert usuario.bloqueado_ate is None
+
+
+def test_redis_conta_em_janela_fixa_sem_expire_nx():
+    armazenamento = ArmazenamentoRedis.__new__(ArmazenamentoRedis)
+    armazenamento.prefixo = 'bloqueio:'
+    dados, expiracoes, pipelines = {}, {}, []
+
+    def pipeline():
+        pipelines.append(PipelineRedisFalso(dados, expiracoes))
+        return pipelines[-1]
+    armazenamento.cliente = type('ClienteRedis', (), {'pipeline': staticmethod(pipeline)})()
+
+    assert [armazenamento.incrementar('tentativas:ana', 900) for _ in range(3)] == [1, 2, 3]
+    assert expiracoes == {'bloqueio:tentativas:ana': 900}
+    assert {comando[0] for p in pipelines for comando in p.comandos} == {'set', 'incr'}
+
+
+def test_armazenamento_fora_do_ar_usa_a_memoria_do_worker(relogio, caplog):
+    controle = ControleBloqueios()
+    controle.limite = 3
+    controle.duracao = timedelta(minutes=15)
+    controle.armazenamento = fora_do_ar = ArmazenamentoForaDoAr()
+
+    assert controle.bloqueado_ate('ana') is None
+    assert 'indisponível' in caplog.text
+    assert [controle.registrar_falha('ana')[0] for _ in range(2)] == [1, 2]
+    assert controle.registrar_falha('ana')[1] is not None
+    assert controle.bloqueado_ate('ana') is not None
+    assert fora_do_ar.chamadas == 1  # Durante a pausa nem tenta o Redis (cada tentativa custaria o timeout)
+
+    relogio[0] += PAUSA_APOS_FALHA
+    controle.limpar('ana')
+    assert fora_do_ar.chamadas == 2
+    assert controle.registrar_falha('ana') == (1, None)
+
+
+def test_login_com_redis_fora_do_ar(app, monkeypatch):
+    controle = aplicacao.controle_bloqueios
+    monkeypatch.setattr(controle, 'armazenamento', ArmazenamentoForaDoAr())
+    monkeypatch.setattr(controle, '_reserva', ArmazenamentoMemoria())
+    monkeypatch.setattr(controle, '_indisponivel_ate', 0.0)
+    cliente = app.test_client()
+
+    for _ in range(3):
+        assert entrar(cliente, 'errada')['status'] == 'error'
+    assert 'temporariamente bloqueada' in entrar(cliente, 'admin123')['message']
@@ -0,0 +1,79 @@
+"""
+Busca de pacientes (GET /api/pacientes): classificação do termo e paginação por keyset
+"""
+import pytest
+
+from database import busca
+
+NOMES = ['Ana Souza', 'Ângela Lima', 'Bruno Costa', 'Bruno Costa', 'Carla Dias', 'Célia Ramos', 'Davi Nunes']
+
+
+def paginas(cliente, **parametros):
+    """Percorre todas as páginas seguindo X-Proximo-Cursor; retorna (lista de páginas, primeira resposta)"""
+    resultado, primeira, cursor = [], None, None
+    while True:
+        args = dict(parametros, cursor=cursor) if cursor else parametros
+        resposta = cliente.get('/api/pacientes', query_string=args)
+        assert resposta.status_code == 200
+        primeira = primeira or resposta
+        resultado.append([paciente['id'] for paciente in resposta.get_json()])
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        if not cursor:
+            return resultado, primeira
+
+
+def test_cursor_percorre_todos_os_pacientes_sem_repetir(cliente, criar_paciente):
+    ids = [criar_paciente(nome) for nome in NOMES]
+    resultado, primeira = paginas(cliente, limite=2)
+
+    assert [len(pagina) for pagina in resultado] == [2, 2, 2, 1]
+    vistos = [id_ for pagina in resultado for id_ in pagina]
+    # Ordem por nome sem acentos e id: 'Ângela' entre 'Ana' e 'Bruno', homônimos pelo id
+    assert vistos == ids
+    assert primeira.headers['X-Total-Count'] == str(len(NOMES))
+    assert primeira.headers['X-Total-Aproximado'] == 'false'
+    assert 'rel="next"' in primeira.headers['Link']
+
+
+def test_cursor_mantem_o_filtro_e_ignora_cadastros_anteriores_a_posicao(cliente, criar_paciente):
+    ids = {nome: criar_paciente(nome) for nome in ['Bruno Alves', 'Bruno Costa', 'Bruna Melo', 'Carla Dias']}
+    primeira = cliente.get('/api/pacientes', query_string={'search': 'brun', 'limite': 1})
+    assert [p['id'] for p in primeira.get_json()] == [ids['Bruna Melo']]
+    cursor = primeira.headers['X-Proximo-Cursor']
+
+    criar_paciente('Bruna Abreu')  # Antes do cursor: não aparece nas páginas seguintes
+    resultado, _ = paginas(cliente, search='brun', limite=1, cursor=cursor)
+    assert [id_ for pagina in resultado for id_ in pagina] == [ids['Bruno Alves'], ids['Bruno Costa']]
+
+
+def test_cursor_invalido_retorna_400(cliente, criar_paciente):
+    criar_paciente()
+    resposta = cliente.get('/api/pacientes', query_string={'cursor': 'nao-e-um-cursor'})
+    assert resposta.status_code == 400
+    assert 'Cursor' in resposta.get_json()['error']
+
+
+def test_codificar_e_decodificar_cursor():
+    assert busca.decodificar_cursor(busca.codificar_cursor('jose da silva', 42)) == ('jose da silva', 42)
+    assert busca.decodificar_cursor(busca.codificar_cursor(None, 7)) == ('', 7)
+    with pytest.raises(ValueError):
+        busca.decodificar_cursor(busca.codificar_cursor('x', 1)[:-3] + '!!!')
+
+
+@pytest.mark.parametrize('termo, tipo', [
+    ('123.456.789-09', 'cpf'),
+    ('12345678909', 'cpf'),
+    ('42', 'prontuario'),
+    ('000042', 'prontuario'),
+    ('maria', 'nome'),
+    ('', 'nome'),
+])
+def test_classificar_termo(termo, tipo):
+    assert busca.classificar_termo(termo) == tipo
+
+
+def test_busca_por_prontuario_aceita_sem_zeros_a_esquerda(cliente, criar_paciente):
+    id_ = criar_paciente(prontuario='000042')
+    criar_paciente('Outro Paciente')
+    resposta = cliente.get('/api/pacientes', query_string={'search': '42'})
+    assert [p['id'] for p in resposta.get_json()] == [id_]
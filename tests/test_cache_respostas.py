@@ -0,0 +1,99 @@
+"""
+Requisições condicionais (ETag/If-None-Match) e cache de respostas por versão
+"""
+import app as aplicacao
+
+
+def test_paciente_responde_304_enquanto_a_versao_nao_muda(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    primeira = cliente.get(f'/api/paciente/{paciente_id}')
+    etag = primeira.headers['ETag']
+    assert primeira.status_code == 200
+    assert primeira.headers['Cache-Control'] == 'private, no-cache'
+    assert 'Last-Modified' not in primeira.headers  # Só o ETag decide o 304
+
+    repetida = cliente.get(f'/api/paciente/{paciente_id}', headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b''
+    assert repetida.headers['ETag'] == etag
+
+    # Outra representação (projeção) do mesmo paciente tem ETag próprio
+    resumo = cliente.get(f'/api/paciente/{paciente_id}?projecao=resumo', headers={'If-None-Match': etag})
+    assert resumo.status_code == 200
+    assert resumo.headers['ETag'] != etag
+
+
+def test_alteracao_do_paciente_muda_o_etag(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    etag = cliente.get(f'/api/paciente/{paciente_id}').headers['ETag']
+
+    assert cliente.put(f'/api/paciente/{paciente_id}', json={'nome': 'Maria Souza', 'sexo': 'F'}).status_code == 200
+    resposta = cliente.get(f'/api/paciente/{paciente_id}', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200
+    assert resposta.headers['ETag'] != etag
+    assert resposta.get_json()['nome'] == 'Maria Souza'
+
+
+def test_nova_movimentacao_muda_o_etag_da_ficha(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    etag = cliente.get(f'/api/paciente/{paciente_id}/detalhes').headers['ETag']
+
+    cliente.post('/api/movimentacoes', json={
+        'paciente_id': paciente_id, 'tipo': 'emergencia', 'status': 'aguardando_acolhimento'
+    })
+    resposta = cliente.get(f'/api/paciente/{paciente_id}/detalhes', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['movimentacoes']) == 1
+
+
+def test_exclusao_de_movimentacao_nao_gera_304_por_data(cliente, criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente()
+    criar_movimentacao(paciente_id)
+    movimentacao_id = criar_movimentacao(paciente_id)
+    primeira = cliente.get(f'/api/paciente/{paciente_id}/detalhes')
+    etag = primeira.headers['ETag']
+    assert 'Last-Modified' not in primeira.headers
+
+    # A exclusão não move max(atualizado_em); If-Modified-Since sozinho não pode dar 304
+    assert cliente.delete(f'/api/movimentacoes/{movimentacao_id}').status_code == 200
+    depois = 'Fri, 01 Jan 2100 00:00:00 GMT'
+    resposta = cliente.get(f'/api/paciente/{paciente_id}/detalhes', headers={'If-Modified-Since': depois})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['movimentacoes']) == 1
+    resposta = cliente.get(f'/api/paciente/{paciente_id}/detalhes',
+                           headers={'If-None-Match': etag, 'If-Modified-Since': depois})
+    assert resposta.status_code == 200 and resposta.headers['ETag'] != etag
+
+
+def test_busca_responde_304_ate_um_novo_cadastro(cliente, criar_paciente):
+    criar_paciente()
+    etag = cliente.get('/api/pacientes?search=maria').headers['ETag']
+    assert cliente.get('/api/pacientes?search=maria', headers={'If-None-Match': etag}).status_code == 304
+
+    criar_paciente('Maria Oliveira')
+    resposta = cliente.get('/api/pacientes?search=maria', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()) == 2
+
+
+def test_corpo_guardado_por_versao_e_invalidado_por_grupo(app):
+    cache = aplicacao.cache_respostas
+    chamadas = []
+
+    def renderizar():
+        chamadas.append(1)
+        return {'n': len(chamadas)}, {'X-Total-Count': '1'}
+
+    with app.test_request_context('/recurso?a=1'):
+        primeira = cache.responder(1, renderizar, grupos=(('paciente', 7),))
+        segunda = cache.responder(1, renderizar, grupos=(('paciente', 7),))
+        assert primeira.get_data() == segunda.get_data()
+        assert segunda.headers['X-Total-Count'] == '1'
+        assert len(chamadas) == 1
+
+        cache.responder(2, renderizar, grupos=(('paciente', 7),))  # Versão nova: monta de novo
+        assert len(chamadas) == 2
+
+        cache.invalidar(('paciente', 7))
+        assert len(cache) == 0
+        assert cache.responder(2, renderizar).get_json() == {'n': 3}
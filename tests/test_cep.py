@@ -0,0 +1,129 @@
+"""
+Consulta de CEP em camadas (GET /api/consultar-cep): cache, tabela local,
+ViaCEP e circuit breaker
+"""
+from datetime import datetime, timedelta
+import io
+
+import pytest
+import requests
+
+import app as aplicacao
+from database.models import db, Cep
+
+VIACEP = {'cep': '01001-000', 'logradouro': 'Praça da Sé', 'bairro': 'Sé', 'localidade': 'São Paulo', 'uf': 'SP'}
+
+
+class RespostaFalsa:
+    def __init__(self, dados, status_code=200):
+        self.dados = dados
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'{self.status_code}')
+
+    def json(self):
+        return self.dados
+
+
+class SessaoFalsa:
+    """Sessão HTTP do resolvedor: registra as URLs e responde com ``resposta``"""
+
+    def __init__(self):
+        self.urls = []
+        self.resposta = RespostaFalsa(VIACEP)
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        if isinstance(self.resposta, Exception):
+            raise self.resposta
+        return self.resposta
+
+
+@pytest.fixture
+def viacep(app):
+    sessao = SessaoFalsa()
+    aplicacao.resolvedor_cep._sessao_local.sessao = sessao
+    yield sessao
+    del aplicacao.resolvedor_cep._sessao_local.sessao
+
+
+def test_cep_consultado_uma_vez_e_servido_do_cache_e_da_tabela(cliente, viacep):
+    resposta = cliente.get('/api/consultar-cep/01001-000')
+    assert resposta.status_code == 200
+    assert resposta.get_json()['cidade'] == 'São Paulo'
+    assert resposta.get_json()['cep'] == '01001-000'
+    assert viacep.urls == ['https://viacep.com.br/ws/01001000/json/']
+
+    assert cliente.get('/api/consultar-cep/01001000').status_code == 200  # Cache em memória
+    aplicacao.resolvedor_cep.cache.limpar()
+    assert cliente.get('/api/consultar-cep/01001000').get_json()['logradouro'] == 'Praça da Sé'  # Tabela local
+    assert len(viacep.urls) == 1
+
+
+def test_cep_inexistente_fica_em_cache_negativo(cliente, viacep):
+    viacep.resposta = RespostaFalsa({'erro': True})
+    assert cliente.get('/api/consultar-cep/99999999').status_code == 404
+    assert cliente.get('/api/consultar-cep/99999999').status_code == 404
+    assert len(viacep.urls) == 1
+    assert cliente.get('/api/consultar-cep/123').status_code == 400
+
+
+def test_circuito_abre_apos_falhas_seguidas(cliente, viacep, app):
+    viacep.resposta = requests.exceptions.ConnectionError('fora do ar')
+    falhas = app.config['CEP_FALHAS_PARA_ABRIR']
+    for _ in range(falhas):
+        assert cliente.get('/api/consultar-cep/01001000').status_code == 503
+    assert aplicacao.resolvedor_cep.circuito.estado == 'aberto'
+
+    resposta = cliente.get('/api/consultar-cep/01001000')
+    assert resposta.status_code == 503
+    assert 'temporariamente indisponível' in resposta.get_json()['error']
+    assert len(viacep.urls) == falhas  # Circuito aberto: nem tenta
+
+
+def test_dado_vencido_e_servido_quando_a_viacep_falha(cliente, viacep, app):
+    with app.app_context():
+        vencido = datetime.utcnow() - timedelta(days=app.config['CEP_VALIDADE_DIAS'] + 1)
+        db.session.add(Cep(cep='01001000', logradouro='Antigo', cidade='São Paulo', estado='SP',
+                           origem='viacep', atualizado_em=vencido))
+        db.session.commit()
+    viacep.resposta = requests.exceptions.Timeout('lento')
+
+    resposta = cliente.get('/api/consultar-cep/01001000')
+    assert resposta.status_code == 200
+    assert resposta.get_json()['logradouro'] == 'Antigo'
+    assert len(viacep.urls) == 1  # Tentou revalidar
+
+
+def test_importar_base_offline(cliente, viacep, app):
+    base = io.StringIO(
+        'CEP;Logradouro;Bairro;Localidade;UF\n'
+        '20040-020;Av. Rio Branco;Centro;Rio de Janeiro;rj\n'
+        '123;Inválido;;Lugar Nenhum;XX\n'
+        '30130-000;Praça Sete;Centro;Belo Horizonte;MG\n'
+    )
+    with app.app_context():
+        assert aplicacao.resolvedor_cep.importar(base, tamanho_lote=1) == 2
+        assert db.session.get(Cep, '20040020').estado == 'RJ'
+
+    assert cliente.get('/api/consultar-cep/30130-000').get_json()['cidade'] == 'Belo Horizonte'
+    assert viacep.urls == []
+
+
+def test_cep_repetido_no_lote_fica_com_a_ultima_linha(app, monkeypatch):
+    resolvedor = aplicacao.resolvedor_cep
+    lotes = []
+    gravar = resolvedor._gravar
+    monkeypatch.setattr(resolvedor, '_gravar', lambda linhas: (lotes.append([l['cep'] for l in linhas]), gravar(linhas)))
+    base = io.StringIO(
+        'cep,logradouro,cidade,uf\n'
+        '20040-020,Antigo,Rio de Janeiro,RJ\n'
+        '30130-000,Praça Sete,Belo Horizonte,MG\n'
+        '20040020,Av. Rio Branco,Rio de Janeiro,RJ\n'
+    )
+    with app.app_context():
+        assert resolvedor.importar(base) == 2
+        assert lotes == [['20040020', '30130000']]  # Sem chave repetida no upsert
+        assert db.session.get(Cep, '20040020').logradouro == 'Av. Rio Branco'
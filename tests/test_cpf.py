@@ -0,0 +1,25 @@
+"""
+Validação de CPF em lote (services/cpf.py) e POST /api/validar-cpf
+"""
+from services.cpf import MENSAGEM_INVALIDO, MENSAGEM_TAMANHO, validar_cpf, validar_cpfs
+
+ARABE = '١٢٣٤٥٦٧٨٩٠١'  # 12345678901 em dígitos arábico-índicos
+
+
+def test_validar_cpfs_em_lote():
+    assert validar_cpfs(['529.982.247-25', '52998224725', '529.982.247-26', '111.111.111-11', '123', None]) == [
+        None, None, MENSAGEM_INVALIDO, MENSAGEM_INVALIDO, MENSAGEM_TAMANHO, MENSAGEM_TAMANHO
+    ]
+
+
+def test_digitos_fora_do_ascii_sao_recusados_sem_excecao():
+    assert ARABE.isdigit() and len(ARABE) == 11
+    assert validar_cpfs([ARABE, '529.982.247-25']) == [MENSAGEM_TAMANHO, None]
+    assert validar_cpf('５２９９８２２４７２５') == MENSAGEM_TAMANHO  # Dígitos de largura total
+
+
+def test_rota_de_validacao(cliente):
+    assert cliente.post('/api/validar-cpf', json={'cpf': '529.982.247-25'}).get_json()['valid']
+    resposta = cliente.post('/api/validar-cpf', json={'cpf': ARABE})
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {'valid': False, 'message': MENSAGEM_TAMANHO}
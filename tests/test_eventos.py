@@ -0,0 +1,172 @@
+"""
+Barramento de eventos e fluxo SSE das movimentações (GET /api/movimentacoes/eventos)
+"""
+import json
+import threading
+
+import pytest
+
+import app as aplicacao
+from services.eventos import BarramentoEventos
+
+
+@pytest.fixture
+def barramento(app):
+    novo = BarramentoEventos()
+    novo.init_app(app)
+    app.extensions['barramento_eventos'] = aplicacao.barramento_eventos
+    return novo
+
+
+@pytest.fixture
+def fluxo(app, cliente, monkeypatch):
+    """Abre o fluxo SSE e devolve um leitor de blocos; fecha a conexão no fim"""
+    monkeypatch.setitem(app.config, 'EVENTOS_SSE_KEEPALIVE_SEGUNDOS', 1)
+    monkeypatch.setitem(app.config, 'EVENTOS_SSE_DURACAO_SEGUNDOS', 5)
+    abertos = []
+
+    def abrir(url='/api/movimentacoes/eventos', **kwargs):
+        resposta = cliente.get(url, buffered=False, **kwargs)
+        abertos.append(resposta)
+        blocos = iter(resposta.response)
+        return lambda: next(blocos).decode('utf-8')
+
+    yield abrir
+    for resposta in abertos:
+        resposta.close()
+
+
+def dados_sse(bloco):
+    linhas = dict(linha.split(': ', 1) for linha in bloco.strip().splitlines())
+    return linhas['event'], json.loads(linhas['data'])
+
+
+def test_evento_codificado_uma_vez_para_todos_os_assinantes(barramento):
+    assinaturas = [barramento.assinar('canal') for _ in range(3)]
+    barramento.publicar('canal', 'teste', {'id': 1, 'nome': 'Ação'})
+    eventos = [assinatura.obter(timeout=0) for assinatura in assinaturas]
+    assert all(evento is eventos[0] for evento in eventos)
+    assert eventos[0].sse.startswith(f'id: {eventos[0].id}\nevent: teste\ndata: ')
+    assert 'Ação' in eventos[0].sse
+
+    assinaturas[0].cancelar()
+    barramento.publicar('canal', 'teste', {'id': 2})
+    assert assinaturas[0].obter(timeout=0) is None
+    assert assinaturas[1].obter(timeout=0).dados == {'id': 2}
+
+
+def test_historico_para_reconexao(barramento):
+    for id_ in range(3):
+        barramento.publicar('canal', 'teste', {'id': id_})
+    primeiro, segundo, terceiro = barramento._historico['canal']
+    assert barramento.eventos_desde('canal', primeiro.id) == [segundo, terceiro]
+    assert barramento.eventos_desde('canal', terceiro.id) == []
+    assert barramento.eventos_desde('canal', 'desconhecido') is None
+
+
+def test_assinante_lento_e_marcado_sem_travar_a_publicacao(barramento, monkeypatch):
+    monkeypatch.setattr(barramento, 'tamanho_fila', 2)
+    lento = barramento.assinar('canal')
+    for id_ in range(5):
+        barramento.publicar('canal', 'teste', {'id': id_})
+    assert lento.perdeu_eventos
+    assert lento.fila.qsize() == 2
+
+
+def test_fluxo_entrega_alteracoes_de_movimentacao(cliente, criar_paciente, fluxo):
+    paciente_id = criar_paciente()
+    ler = fluxo()
+    assert ler() == 'retry: 3000\n\n'
+
+    resposta = cliente.post('/api/movimentacoes', json={
+        'paciente_id': paciente_id, 'tipo': 'emergencia', 'status': 'aguardando_acolhimento'
+    })
+    tipo, dados = dados_sse(ler())
+    assert tipo == 'movimentacao_criada'
+    assert dados['id'] == resposta.get_json()['id']
+    assert dados['paciente_nome'] == 'Maria da Silva'
+    assert ler() == ': keepalive\n\n'
+
+
+def test_reconexao_recebe_os_eventos_perdidos_do_tipo_pedido(cliente, criar_paciente, fluxo):
+    paciente_id = criar_paciente()
+    ids = [
+        cliente.post('/api/movimentacoes', json={'paciente_id': paciente_id, 'tipo': tipo, 'status': 'aguardando'}).get_json()['id']
+        for tipo in ('emergencia', 'consulta', 'emergencia')
+    ]
+    desconectado_em = aplicacao.barramento_eventos._historico['movimentacoes'][-3].id
+
+    ler = fluxo('/api/movimentacoes/eventos?tipo=emergencia', headers={'Last-Event-ID': desconectado_em})
+    assert ler() == 'retry: 3000\n\n'
+    assert dados_sse(ler())[1]['id'] == ids[2]  # O de consulta fica de fora
+
+    ler = fluxo(headers={'Last-Event-ID': 'expirado'})
+    ler()
+    assert ler() == 'event: recarregar\ndata: {}\n\n'
+
+
+def test_fluxos_limitados_por_worker(app, admin_id, fluxo, monkeypatch):
+    barramento = aplicacao.barramento_eventos
+    monkeypatch.setattr(barramento, '_vagas_fluxo', threading.BoundedSemaphore(1))
+    ler = fluxo()
+    ler()
+    assert barramento.total_fluxos() == 1
+
+    # A segunda tela do mesmo worker não prende outra thread: recebe 503 e passa a consultar
+    outra_tela = app.test_client()
+    with outra_tela.session_transaction() as sessao:
+        sessao['_user_id'] = str(admin_id)
+    recusado = outra_tela.get('/api/movimentacoes/eventos')
+    assert recusado.status_code == 503
+    assert recusado.headers['Retry-After'] == str(app.config['EVENTOS_CONSULTA_INTERVALO_SEGUNDOS'])
+    assert outra_tela.get('/api/fila').status_code == 200
+
+
+def test_vaga_devolvida_mesmo_sem_iniciar_o_fluxo(app, cliente, monkeypatch):
+    barramento = aplicacao.barramento_eventos
+    monkeypatch.setattr(barramento, '_vagas_fluxo', threading.BoundedSemaphore(1))
+    cliente.get('/api/movimentacoes/eventos', buffered=False).close()
+    assert barramento.total_fluxos() == 0
+    resposta = cliente.get('/api/movimentacoes/eventos', buffered=False)
+    assert resposta.status_code == 200
+    resposta.close()
+
+
+def test_assinatura_cancelada_duas_vezes_libera_uma_vaga(barramento):
+    barramento._vagas_fluxo = threading.BoundedSemaphore(2)
+    assinatura = barramento.abrir_fluxo('canal')
+    assinatura.cancelar()
+    assinatura.cancelar()  # BoundedSemaphore acusaria a liberação a mais
+    assert [barramento.abrir_fluxo('canal') is not None for _ in range(3)] == [True, True, False]
+
+
+def test_consulta_por_intervalo_no_lugar_do_fluxo(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    url = '/api/movimentacoes/eventos/recentes'
+    inicio = cliente.get(url).get_json()
+    assert inicio['eventos'] == [] and not inicio['recarregar']
+
+    ids = [
+        cliente.post('/api/movimentacoes', json={'paciente_id': paciente_id, 'tipo': tipo, 'status': 'aguardando'}).get_json()['id']
+        for tipo in ('emergencia', 'consulta')
+    ]
+    novos = cliente.get(url, query_string={'ultimo_evento': inicio['ultimo_evento']}).get_json()
+    assert [e['dados']['id'] for e in novos['eventos']] == ids
+    assert novos['eventos'][0]['tipo'] == 'movimentacao_criada'
+
+    repetida = cliente.get(url, query_string={'ultimo_evento': novos['ultimo_evento']}).get_json()
+    assert repetida['eventos'] == [] and repetida['ultimo_evento'] == novos['ultimo_evento']
+
+    filtrada = cliente.get(url, query_string={'ultimo_evento': inicio['ultimo_evento'], 'tipo': 'consulta'}).get_json()
+    assert [e['dados']['id'] for e in filtrada['eventos']] == ids[1:]
+    assert filtrada['ultimo_evento'] == novos['ultimo_evento']
+
+    expirada = cliente.get(url, query_string={'ultimo_evento': 'expirado'}).get_json()
+    assert expirada['recarregar'] and expirada['ultimo_evento'] == novos['ultimo_evento']
+
+
+def test_memoria_com_varios_workers_nao_inicia(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'WEB_CONCURRENCY', 2)
+    with pytest.raises(RuntimeError, match='Redis'):
+        BarramentoEventos(app)
+    app.extensions['barramento_eventos'] = aplicacao.barramento_eventos
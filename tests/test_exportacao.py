@@ -0,0 +1,69 @@
+"""
+Exportação em fluxo (GET /api/exportar/<entidade>): NDJSON, CSV, gzip e incremental
+"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from services.exportacao import gerar_exportacao
+
+
+def test_exporta_pacientes_em_ndjson(cliente, criar_paciente):
+    ids = [criar_paciente(nome) for nome in ['José Conceição', 'Ana Souza']]
+    resposta = cliente.get('/api/exportar/pacientes')
+    assert resposta.status_code == 200
+    assert resposta.is_streamed
+    assert resposta.mimetype == 'application/x-ndjson'
+    assert resposta.headers['Content-Disposition'] == 'attachment; filename=pacientes.ndjson'
+
+    texto = resposta.get_data(as_text=True)
+    assert 'José Conceição' in texto  # Sem escapes \u
+    linhas = [json.loads(linha) for linha in texto.splitlines()]
+    assert [linha['id'] for linha in linhas] == ids
+    assert linhas[0]['data_nascimento'] == '1980-05-17'
+
+
+def test_exporta_movimentacoes_em_csv_com_gzip(cliente, criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente()
+    criar_movimentacao(paciente_id, observacoes='Dor, febre e "tosse"')
+    resposta = cliente.get('/api/exportar/movimentacoes?formato=csv&gzip=1')
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+
+    linhas = list(csv.DictReader(io.StringIO(gzip.decompress(resposta.get_data()).decode('utf-8'))))
+    assert len(linhas) == 1
+    assert linhas[0]['paciente_id'] == str(paciente_id)
+    assert linhas[0]['observacoes'] == 'Dor, febre e "tosse"'
+
+
+def test_exportacao_incremental_a_partir_do_corte(cliente, criar_paciente):
+    criar_paciente('Antigo')
+    corte = cliente.get('/api/exportar/pacientes').headers['X-Exportacao-Ate']
+    novo = criar_paciente('Novo')
+
+    resposta = cliente.get('/api/exportar/pacientes', query_string={'desde': corte})
+    assert [json.loads(linha)['id'] for linha in resposta.get_data(as_text=True).splitlines()] == [novo]
+
+
+@pytest.mark.parametrize('url', [
+    '/api/exportar/usuarios',
+    '/api/exportar/pacientes?formato=xml',
+    '/api/exportar/pacientes?desde=ontem',
+])
+def test_parametros_invalidos_retornam_400_antes_do_fluxo(cliente, url):
+    resposta = cliente.get(url)
+    assert resposta.status_code == 400
+    assert 'error' in resposta.get_json()
+
+
+def test_lotes_pequenos_nao_mudam_o_conteudo(app, criar_paciente):
+    for indice in range(5):
+        criar_paciente(f'Paciente {indice}')
+    with app.app_context():
+        em_lotes = b''.join(gerar_exportacao('pacientes', 'csv', tamanho_lote=2))
+        de_uma_vez = b''.join(gerar_exportacao('pacientes', 'csv'))
+    assert em_lotes == de_uma_vez
+    assert len(em_lotes.decode('utf-8').splitlines()) == 6
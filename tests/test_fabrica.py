@@ -0,0 +1,117 @@
+"""
+Importação sem efeitos colaterais, criar_app() e o comando inicializar-banco
+"""
+import json
+import os
+import subprocess
+import sys
+
+import app as aplicacao
+from config import url_sqlite_absoluta
+from database import migracoes
+from database.models import db
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, os, threading
+import app
+importado = {'threads': threading.active_count(), 'arquivos': sorted(os.listdir('.'))}
+pronta = app.criar_app()
+print(json.dumps({
+    'importado': importado,
+    'mesma_app': pronta is app.app and app.criar_app() is pronta,
+    'arquivos': sorted(os.listdir('.')),
+    'templates': len(os.listdir('jinja')),
+}))
+"""
+
+
+def test_importar_nao_toca_no_banco_nem_no_disco(tmp_path):
+    ambiente = dict(
+        os.environ,
+        FLASK_ENV='production',
+        DATABASE_URL=f'sqlite:///{tmp_path / "banco.db"}',
+        LOG_ARQUIVO=str(tmp_path / 'logs' / 'hospital.log'),
+        TEMPLATES_CACHE_PASTA=str(tmp_path / 'jinja'),
+        PYTHONPATH=RAIZ,
+    )
+    saida = subprocess.run(
+        [sys.executable, '-c', SCRIPT], cwd=tmp_path, env=ambiente, capture_output=True, text=True, timeout=60
+    )
+    assert saida.returncode == 0, saida.stderr
+    resultado = json.loads(saida.stdout.splitlines()[-1])
+
+    # Só a thread principal e nenhum arquivo (banco, logs, bytecode) na importação
+    assert resultado['importado'] == {'threads': 1, 'arquivos': []}
+    # criar_app compila os templates uma vez e é idempotente; o banco continua intocado
+    assert resultado['mesma_app']
+    assert 'banco.db' not in resultado['arquivos']
+    assert resultado['templates'] > 0
+
+
+SCRIPT_SQLITE_RELATIVO = """
+import json, os, sys
+import flask
+flask.Flask.auto_find_instance_path = lambda self: sys.argv[1]
+import app
+importado = {'instance': os.path.exists(sys.argv[1]), 'engines_metricas': app.metricas.engines}
+app.criar_app()
+preparado = os.path.exists(sys.argv[1])
+with app.app.app_context():
+    app.db.session.execute(app.db.text('SELECT 1'))
+print(json.dumps({
+    'importado': importado,
+    'preparado': preparado,
+    'url': app.app.config['SQLALCHEMY_DATABASE_URI'],
+    'banco': os.path.exists(os.path.join(sys.argv[1], 'banco.db')),
+}))
+"""
+
+
+def test_sqlite_relativo_cria_instance_so_na_primeira_conexao(tmp_path):
+    instancia = tmp_path / 'instance'
+    ambiente = dict(
+        os.environ,
+        FLASK_ENV='production',
+        DATABASE_URL='sqlite:///banco.db',
+        LOG_ARQUIVO='',
+        TEMPLATES_CACHE_PASTA=str(tmp_path / 'jinja'),
+        PYTHONPATH=RAIZ,
+    )
+    saida = subprocess.run(
+        [sys.executable, '-c', SCRIPT_SQLITE_RELATIVO, str(instancia)],
+        cwd=tmp_path, env=ambiente, capture_output=True, text=True, timeout=60
+    )
+    assert saida.returncode == 0, saida.stderr
+    resultado = json.loads(saida.stdout.splitlines()[-1])
+
+    assert resultado['importado'] == {'instance': False, 'engines_metricas': None}
+    assert not resultado['preparado']
+    assert resultado['url'] == f'sqlite:///{instancia / "banco.db"}'
+    assert resultado['banco']
+
+
+def test_url_sqlite_absoluta():
+    assert url_sqlite_absoluta('sqlite:///hospital.db', '/srv/instance') == 'sqlite:////srv/instance/hospital.db'
+    for url in ('sqlite:////dados/hospital.db', 'sqlite:///:memory:', 'sqlite://', 'postgresql://h/db', None):
+        assert url_sqlite_absoluta(url, '/srv/instance') == url
+
+
+def test_inicializar_banco_em_banco_vazio(app):
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(db.text('DROP TABLE IF EXISTS pacientes_fts'))
+        db.session.commit()
+
+    resultado = app.test_cli_runner().invoke(args=['inicializar-banco'])
+    assert resultado.exit_code == 0, resultado.output
+    assert f'{len(migracoes.MIGRACOES)} migração(ões) aplicada(s).' in resultado.output
+    with app.app_context():
+        assert aplicacao.Usuario.query.filter_by(username='admin', tipo='admin').count() == 1
+
+    # Segunda execução (novo deploy): nada a aplicar, admin não duplicado
+    resultado = app.test_cli_runner().invoke(args=['inicializar-banco'])
+    assert '0 migração(ões) aplicada(s).' in resultado.output
+    with app.app_context():
+        assert aplicacao.Usuario.query.filter_by(username='admin').count() == 1
@@ -0,0 +1,91 @@
+"""
+Filas de atendimento em memória: ordem do heap, remoção preguiçosa e
+atualização do índice pelos eventos de movimentação (GET /api/fila)
+"""
+from datetime import datetime, timedelta
+
+from services import fila as modulo_fila
+from services.fila import FilaPrioridade
+
+INICIO = datetime(2024, 3, 1, 8, 0)
+
+
+def entrada(id_, prioridade=None, minutos=0):
+    return (modulo_fila.peso_prioridade(prioridade), INICIO + timedelta(minutes=minutos), id_, id_, {'id': id_})
+
+
+def ids(entradas):
+    return [e[2] for e in entradas]
+
+
+def test_ordem_por_prioridade_chegada_e_id():
+    fila = FilaPrioridade()
+    for e in [entrada(1, minutos=0), entrada(2, 'idoso_60', minutos=5), entrada(3, 'sala_vermelha', minutos=10),
+              entrada(4, 'gestante', minutos=1), entrada(5, minutos=0), entrada(6, 'prioridade_desconhecida')]:
+        fila.inserir(e)
+
+    assert ids(fila.proximos(10)) == [3, 4, 2, 1, 5, 6]
+    assert ids(fila.proximos(2)) == [3, 4]
+    assert fila.proximos(0) == []
+    assert len(fila) == 6
+
+
+def test_remocao_esconde_a_entrada_sem_alterar_as_demais():
+    fila = FilaPrioridade()
+    for id_ in range(1, 8):
+        fila.inserir(entrada(id_, minutos=id_))
+
+    fila.remover(1)  # Topo: sai do heap na hora
+    fila.remover(5)  # Meio: fica morta até subir ao topo
+    fila.remover(42)  # Inexistente: ignorada
+    assert ids(fila.proximos(10)) == [2, 3, 4, 6, 7]
+    assert len(fila) == 5
+    assert fila.mortos == 1
+
+    fila.inserir(entrada(5, 'idoso_80', minutos=99))  # Reinserida: só a entrada nova vale
+    assert ids(fila.proximos(3)) == [5, 2, 3]
+    assert len(fila) == 6
+
+
+def test_compactacao_descarta_entradas_mortas(monkeypatch):
+    monkeypatch.setattr(modulo_fila, 'COMPACTAR_A_PARTIR_DE', 2)
+    fila = FilaPrioridade()
+    for id_ in range(1, 11):
+        fila.inserir(entrada(id_, minutos=id_))
+    for id_ in range(4, 10):
+        fila.remover(id_)
+
+    assert len(fila.heap) < 10
+    assert fila.mortos <= 2
+    assert ids(fila.proximos(10)) == [1, 2, 3, 10]
+
+
+def test_api_fila_segue_cadastros_alteracoes_e_exclusoes(cliente, criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente()
+    comum = criar_movimentacao(paciente_id, data_entrada=INICIO)
+    idoso = criar_movimentacao(paciente_id, prioridade='idoso_80', data_entrada=INICIO + timedelta(minutes=30))
+    outra_fila = criar_movimentacao(paciente_id, status='em_atendimento')
+    criar_movimentacao(paciente_id, status='finalizado')
+
+    filtro = {'tipo': 'emergencia', 'status': 'aguardando_acolhimento'}
+    resposta = cliente.get('/api/fila', query_string=filtro).get_json()
+    assert [p['id'] for p in resposta['proximos']] == [idoso, comum]
+    assert resposta['filas'] == [{'tipo': 'emergencia', 'status': 'aguardando_acolhimento', 'tamanho': 2}]
+
+    todas = cliente.get('/api/fila').get_json()
+    assert [(f['status'], f['tamanho']) for f in todas['filas']] == [('aguardando_acolhimento', 2), ('em_atendimento', 1)]
+
+    # Já carregado: as rotas atualizam o índice pelos eventos, sem recarregar do banco
+    novo = cliente.post('/api/movimentacoes', json={
+        'paciente_id': paciente_id, 'tipo': 'emergencia', 'status': 'aguardando_acolhimento', 'prioridade': 'sala_vermelha'
+    }).get_json()['id']
+    assert cliente.put(f'/api/movimentacoes/{idoso}', json={'status': 'em_atendimento'}).status_code == 200
+    assert cliente.delete(f'/api/movimentacoes/{outra_fila}').status_code == 200
+
+    resposta = cliente.get('/api/fila').get_json()
+    assert [p['id'] for p in resposta['proximos']] == [novo, idoso, comum]
+    assert [(f['status'], f['tamanho']) for f in resposta['filas']] == [('aguardando_acolhimento', 2), ('em_atendimento', 1)]
+
+    assert cliente.put(f'/api/movimentacoes/{comum}', json={'status': 'alta_medica'}).status_code == 200
+    proximos = cliente.get('/api/fila', query_string=filtro).get_json()['proximos']
+    assert [p['id'] for p in proximos] == [novo]
@@ -0,0 +1,107 @@
+"""
+Cache de fragmentos de template e bytecode do Jinja em disco (services/fragmentos.py)
+"""
+import pytest
+from flask import Flask, render_template_string
+from jinja2 import DictLoader
+
+from services.fragmentos import CacheFragmentos
+
+PAGINA = "<p>{% fragmento 'perfil', perfil %}{{ contar() }}:{{ perfil }}{% endfragmento %}|{{ usuario }}</p>"
+
+
+@pytest.fixture
+def montar(tmp_path):
+    """Aplicação mínima com templates em memória; retorna (app, cache, renderizações)"""
+    def criar(maximo=10, **templates):
+        flask_app = Flask('teste_fragmentos')
+        flask_app.config.update(FRAGMENTOS_MAXIMO=maximo, TEMPLATES_CACHE_PASTA=str(tmp_path / 'jinja'))
+        cache = CacheFragmentos(flask_app)
+        flask_app.jinja_env.loader = DictLoader(dict({'pagina.html': PAGINA}, **templates))
+        renderizacoes = []
+        flask_app.jinja_env.globals['contar'] = lambda: renderizacoes.append(1) or len(renderizacoes)
+        return flask_app, cache, renderizacoes
+    return criar
+
+
+def renderizar(flask_app, **contexto):
+    with flask_app.test_request_context():
+        return flask_app.jinja_env.get_template('pagina.html').render(**contexto)
+
+
+def test_fragmento_renderizado_uma_vez_por_chave(montar):
+    flask_app, cache, renderizacoes = montar()
+    assert renderizar(flask_app, perfil='admin', usuario='Ana') == '<p>1:admin|Ana</p>'
+    # Fora do fragmento continua por requisição; dentro vem do cache
+    assert renderizar(flask_app, perfil='admin', usuario='Beto') == '<p>1:admin|Beto</p>'
+    assert renderizar(flask_app, perfil='medico', usuario='Caio') == '<p>2:medico|Caio</p>'
+    assert len(renderizacoes) == 2 and len(cache) == 2
+
+
+def test_conteudo_do_fragmento_nao_e_escapado_de_novo(montar):
+    flask_app, _, _ = montar()
+    primeira = renderizar(flask_app, perfil='<b>', usuario='')
+    assert primeira == renderizar(flask_app, perfil='<b>', usuario='')
+    assert '&lt;b&gt;' in primeira and '&amp;' not in primeira
+
+
+def test_lru_descarta_o_menos_usado(montar):
+    flask_app, cache, renderizacoes = montar(maximo=2)
+    for perfil in ('a', 'b', 'a', 'c'):  # 'b' é o menos usado quando 'c' entra
+        renderizar(flask_app, perfil=perfil)
+    assert len(cache) == 2
+    renderizar(flask_app, perfil='a')
+    assert len(renderizacoes) == 3
+    renderizar(flask_app, perfil='b')
+    assert len(renderizacoes) == 4
+
+
+def test_versao_do_template_entra_na_chave(montar):
+    flask_app, cache, renderizacoes = montar()
+    versao = cache.versao('pagina.html')
+    renderizar(flask_app, perfil='admin')
+
+    flask_app.jinja_env.loader.mapping['pagina.html'] = PAGINA.replace('<p>', '<div>')
+    flask_app.jinja_env.cache.clear()
+    cache.limpar()  # Novo deploy: versões recalculadas
+    assert cache.versao('pagina.html') != versao
+    assert renderizar(flask_app, perfil='admin').startswith('<div>2:')
+    assert len(renderizacoes) == 2
+
+
+def test_desligado_com_recarregamento_ou_maximo_zero(montar):
+    flask_app, cache, renderizacoes = montar(maximo=0)
+    renderizar(flask_app, perfil='admin')
+    renderizar(flask_app, perfil='admin')
+    assert not cache.ativo and len(renderizacoes) == 2
+
+    flask_app, cache, renderizacoes = montar()
+    flask_app.jinja_env.auto_reload = True  # Desenvolvimento: edições aparecem na hora
+    renderizar(flask_app, perfil='admin')
+    renderizar(flask_app, perfil='admin')
+    assert not cache.ativo and len(renderizacoes) == 2 and len(cache) == 0
+
+
+def test_compilar_templates_grava_o_bytecode_em_disco(montar, tmp_path):
+    flask_app, cache, _ = montar(**{'outro.html': '<i>{{ 1 }}</i>', 'dados.txt': 'texto'})
+    pasta = tmp_path / 'jinja'
+    assert not pasta.exists()  # Nada criado antes de compilar
+    assert cache.compilar_templates() == 2  # Só os .html
+    assert len(list(pasta.iterdir())) == 2
+
+    # Outro worker com a mesma pasta carrega do disco sem compilar de novo
+    outro, cache_outro, _ = montar(**{'outro.html': '<i>{{ 1 }}</i>'})
+    carregados = []
+    original = outro.jinja_env.bytecode_cache.load_bytecode
+    outro.jinja_env.bytecode_cache.load_bytecode = lambda bucket: (original(bucket), carregados.append(bucket.code))
+    cache_outro.compilar_templates()
+    assert len(carregados) == 2 and all(codigo is not None for codigo in carregados)
+
+
+def test_template_sem_nome_nao_usa_o_cache(app):
+    cache = app.extensions['cache_fragmentos']
+    antes = len(cache)
+    with app.test_request_context():
+        for _ in range(2):
+            assert render_template_string("{% fragmento 'x', 1 %}ok{% endfragmento %}") == 'ok'
+    assert len(cache) == antes
@@ -0,0 +1,64 @@
+"""
+Ficha do paciente (GET /api/paciente/<id>/detalhes) e histórico paginado de movimentações
+"""
+from datetime import datetime, timedelta
+
+from database.models import db, Endereco
+
+INICIO = datetime(2024, 3, 1, 8, 0)
+
+
+def adicionar_endereco(app, paciente_id, principal, cidade):
+    with app.app_context():
+        db.session.add(Endereco(paciente_id=paciente_id, cep='01001-000', estado='SP', cidade=cidade, bairro='Sé',
+                                logradouro='Praça da Sé', numero='1', principal=principal))
+        db.session.commit()
+
+
+def test_ficha_com_endereco_principal_e_movimentacoes_recentes(app, cliente, criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente()
+    adicionar_endereco(app, paciente_id, False, 'Antiga')
+    adicionar_endereco(app, paciente_id, True, 'São Paulo')
+    ids = [criar_movimentacao(paciente_id, data_entrada=INICIO + timedelta(hours=h)) for h in range(5)]
+
+    ficha = cliente.get(f'/api/paciente/{paciente_id}/detalhes?limite=2').get_json()
+    assert ficha['paciente']['cidade'] == 'São Paulo'
+    assert ficha['paciente']['total_movimentacoes'] == 5
+    assert [m['id'] for m in ficha['movimentacoes']] == [ids[4], ids[3]]
+    assert ficha['proximo_cursor']
+
+
+def test_cursor_da_ficha_continua_no_historico_sem_repetir(cliente, criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente()
+    # Duas entradas no mesmo instante: o id desempata
+    ids = [criar_movimentacao(paciente_id, data_entrada=INICIO + timedelta(hours=h)) for h in (0, 1, 1, 2, 3)]
+    esperado = [ids[4], ids[3], ids[2], ids[1], ids[0]]
+
+    ficha = cliente.get(f'/api/paciente/{paciente_id}/detalhes?limite=2').get_json()
+    vistos = [m['id'] for m in ficha['movimentacoes']]
+    cursor = ficha['proximo_cursor']
+    while cursor:
+        resposta = cliente.get(f'/api/movimentacoes/paciente/{paciente_id}', query_string={'cursor': cursor, 'limite': 2})
+        vistos += [m['id'] for m in resposta.get_json()]
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+    assert vistos == esperado
+
+    sem_limite = cliente.get(f'/api/movimentacoes/paciente/{paciente_id}').get_json()
+    assert [m['id'] for m in sem_limite] == esperado
+
+
+def test_ficha_sem_endereco_e_sem_movimentacoes(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    ficha = cliente.get(f'/api/paciente/{paciente_id}/detalhes').get_json()
+    assert 'cep' not in ficha['paciente']
+    assert ficha['paciente']['total_movimentacoes'] == 0
+    assert ficha['movimentacoes'] == []
+    assert ficha['proximo_cursor'] is None
+
+
+def test_paciente_inexistente_e_cursor_invalido(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    assert cliente.get(f'/api/paciente/{paciente_id + 1}/detalhes').status_code == 404
+    assert cliente.get(f'/api/movimentacoes/paciente/{paciente_id + 1}').status_code == 404
+    resposta = cliente.get(f'/api/movimentacoes/paciente/{paciente_id}?cursor=xyz')
+    assert resposta.status_code == 400
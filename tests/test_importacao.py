@@ -0,0 +1,122 @@
+"""
+Importação em lote de pacientes: erros por linha, lote recusado pelo banco e
+interrupção do fluxo NDJSON
+"""
+import io
+import json
+
+from sqlalchemy.exc import DataError
+
+import app as aplicacao
+from services.importacao import ImportadorPacientes, resumir
+
+
+def ndjson(*registros):
+    return ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in registros)
+
+
+def importar(app, conteudo, tamanho_lote=100):
+    with app.test_request_context():
+        importador = ImportadorPacientes(aplicacao.alocador_prontuario, tamanho_lote=tamanho_lote)
+        return list(importador.importar(io.StringIO(conteudo), 'ndjson'))
+
+
+def erros_por_linha(eventos):
+    return {erro['linha']: erro['erro'] for evento in eventos for erro in evento['erros']}
+
+
+VALIDO = {'nome': 'Ana Lima', 'data_nascimento': '1990-01-31', 'sexo': 'F'}
+
+
+def test_linhas_invalidas_viram_erros_e_as_demais_sao_importadas(app):
+    eventos = importar(app, ndjson(
+        VALIDO,
+        {'data_nascimento': '1990-01-31'},
+        dict(VALIDO, data_nascimento='31-01-1990'),
+        dict(VALIDO, sexo='X'),
+        dict(VALIDO, telefone='9' * 21),
+        dict(VALIDO, cep='123'),
+        dict(VALIDO, cep='01001-000', estado='São Paulo'),
+        dict(VALIDO, cpf='111.111.111-11'),
+        dict(VALIDO, nome='Bia Lima', sexo='feminino', cep='01001000', estado='sp', cidade='São Paulo'),
+    ) + '{nao e json\n' + ndjson(dict(VALIDO, cpf='١٢٣٤٥٦٧٨٩٠١')))
+    erros = erros_por_linha(eventos)
+
+    assert eventos[0]['importados'] == 2
+    assert sorted(erros) == [2, 3, 4, 5, 6, 7, 8, 10, 11]
+    assert 'CPF' in erros[11]  # Dígitos não ASCII: erro da linha, não do lote
+    assert 'Nome' in erros[2]
+    assert 'Sexo' in erros[4]
+    assert "'telefone' excede 20" in erros[5]
+    assert 'CEP' in erros[6]
+    assert 'UF' in erros[7]
+    assert erros[10] == 'Linha mal formada'
+
+
+def test_cpf_duplicado_no_lote_e_no_banco(app, criar_paciente):
+    criar_paciente(cpf='529.982.247-25')
+    eventos = importar(app, ndjson(
+        dict(VALIDO, cpf='52998224725'),
+        dict(VALIDO, cpf='390.533.447-05'),
+        dict(VALIDO, cpf='39053344705'),
+    ))
+    assert eventos[0]['importados'] == 1
+    assert eventos[0]['duplicados'] == 2
+    assert sorted(erros_por_linha(eventos)) == [1, 3]
+
+
+def test_lote_recusado_pelo_banco_nao_interrompe_os_seguintes(app, monkeypatch):
+    gravar = ImportadorPacientes._gravar
+    chamadas = []
+
+    def gravar_falhando_no_primeiro(self, unicos):
+        chamadas.append(len(unicos))
+        if len(chamadas) == 1:
+            raise DataError('INSERT INTO pacientes ...', {}, Exception('value too long'))
+        return gravar(self, unicos)
+
+    monkeypatch.setattr(ImportadorPacientes, '_gravar', gravar_falhando_no_primeiro)
+    eventos = importar(app, ndjson(*(dict(VALIDO, nome=f'Paciente {i}') for i in range(4))), tamanho_lote=2)
+
+    assert [e['importados'] for e in eventos] == [0, 2]
+    assert eventos[0]['falha'] == 'Lote não gravado: DataError'
+    assert sorted(erros_por_linha(eventos)) == [1, 2]
+    resumo = resumir(iter(eventos))
+    assert resumo['lotes_com_falha'] == 1
+    assert resumo['importados'] == 2
+
+
+def linhas_da_resposta(resposta):
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+def test_rota_importa_e_audita(cliente):
+    resposta = cliente.post('/api/pacientes/importar?formato=ndjson', data=ndjson(VALIDO, {'nome': ''}))
+    linhas = linhas_da_resposta(resposta)
+    assert resposta.status_code == 200
+    assert linhas[-1]['resumo'] == {
+        'lidos': 2, 'importados': 1, 'duplicados': 0, 'total_erros': 1, 'lotes_com_falha': 0
+    }
+
+
+def test_erro_inesperado_fecha_o_fluxo_com_resumo_e_auditoria(app, cliente, monkeypatch):
+    importar_original = ImportadorPacientes.importar
+
+    def importar_e_quebrar(self, arquivo, formato):
+        yield next(importar_original(self, arquivo, formato))
+        raise RuntimeError('disco cheio')
+
+    monkeypatch.setattr(ImportadorPacientes, 'importar', importar_e_quebrar)
+    invalidados = []
+    monkeypatch.setattr(aplicacao.cache_respostas, 'invalidar', lambda *grupos: invalidados.append(grupos))
+
+    resposta = cliente.post('/api/pacientes/importar?formato=ndjson&lote=1', data=ndjson(VALIDO, VALIDO))
+    linhas = linhas_da_resposta(resposta)
+
+    assert linhas[0]['importados'] == 1
+    assert 'disco cheio' in linhas[-2]['error']
+    assert linhas[-1]['resumo']['importados'] == 1
+    assert invalidados == [('pacientes',)]
+    with app.app_context():
+        auditoria = aplicacao.LogAuditoria.query.filter_by(acao='PACIENTES_IMPORTADOS').one()
+        assert 'interrompida' in auditoria.detalhes
@@ -0,0 +1,72 @@
+"""
+Instrumentação por requisição: Server-Timing, GET /metrics e tipos de métrica
+"""
+import re
+
+import pytest
+
+from services import metricas as modulo_metricas
+from services.metricas import Contador, Histograma
+
+
+def valor(texto, linha):
+    encontrado = re.search(rf'^{re.escape(linha)} (\S+)$', texto, re.M)
+    return float(encontrado.group(1)) if encontrado else 0.0
+
+
+def test_server_timing_com_sql_json_e_total(cliente, criar_paciente):
+    paciente_id = criar_paciente()
+    cabecalho = cliente.get(f'/api/paciente/{paciente_id}').headers['Server-Timing']
+    nomes = [parte.split(';')[0] for parte in cabecalho.split(', ')]
+    assert nomes[-1] == 'app'
+    assert 'json' in nomes
+    assert re.search(r'sql;dur=[\d.]+;desc="\d+ consultas"', cabecalho)
+
+
+def test_metrics_conta_respostas_e_consultas_por_endpoint(cliente):
+    serie = 'hospital_respostas_total{endpoint="consultar_fila",metodo="GET",status="200"}'
+    antes = valor(cliente.get('/metrics').get_data(as_text=True), serie)
+    for _ in range(3):
+        cliente.get('/api/fila')
+
+    resposta = cliente.get('/metrics')
+    assert resposta.mimetype == 'text/plain'
+    texto = resposta.get_data(as_text=True)
+    assert valor(texto, serie) == antes + 3
+    assert 'hospital_requisicao_segundos_bucket{endpoint="consultar_fila",metodo="GET",le="+Inf"}' in texto
+    assert 'hospital_sql_consultas_total{endpoint="consultar_fila"}' in texto
+    assert re.search(r'^hospital_processo_info\{pid="\d+"\} 1$', texto, re.M)
+
+
+def test_metrics_exige_admin_ou_token(app, cliente, monkeypatch):
+    assert app.test_client().get('/metrics').status_code == 403
+
+    monkeypatch.setitem(app.config, 'METRICAS_TOKEN', 'segredo')
+    assert cliente.get('/metrics').status_code == 401  # Com token configurado, nem o admin entra sem ele
+    coletor = app.test_client()
+    assert coletor.get('/metrics', headers={'Authorization': 'Bearer errado'}).status_code == 401
+    assert coletor.get('/metrics', headers={'Authorization': 'Bearer segredo'}).status_code == 200
+
+
+def test_medir_fora_de_requisicao_nao_registra():
+    with modulo_metricas.medir('viacep') as medicao:
+        pass
+    assert medicao is None
+
+
+def test_histograma_acumula_as_faixas():
+    histograma = Histograma('teste_segundos', 'Teste', ('rota',), faixas=(0.1, 1.0))
+    for duracao in (0.05, 0.5, 0.7, 3.0):
+        histograma.observar(duracao, ('a',))
+    texto = '\n'.join(histograma.exportar())
+    assert valor(texto, 'teste_segundos_bucket{rota="a",le="0.1"}') == 1
+    assert valor(texto, 'teste_segundos_bucket{rota="a",le="1.0"}') == 3
+    assert valor(texto, 'teste_segundos_bucket{rota="a",le="+Inf"}') == 4
+    assert valor(texto, 'teste_segundos_count{rota="a"}') == 4
+    assert valor(texto, 'teste_segundos_sum{rota="a"}') == pytest.approx(4.25)
+
+
+def test_contador_escapa_os_rotulos():
+    contador = Contador('teste_total', 'Teste', ('caminho',))
+    contador.incrementar(('a"b\\c',), 2)
+    assert contador.exportar()[-1] == 'teste_total{caminho="a\\"b\\\\c"} 2'
@@ -0,0 +1,40 @@
+"""
+Migrações versionadas e verificação dos planos das consultas quentes
+"""
+import pytest
+
+from database import migracoes
+from database.models import db, VersaoEsquema
+
+
+def test_banco_novo_registra_todas_as_versoes_e_nao_reaplica(app):
+    with app.app_context():
+        assert migracoes.versoes_aplicadas() == {m.versao for m in migracoes.MIGRACOES}
+        assert migracoes.pendentes() == []
+        assert migracoes.migrar() == []
+
+
+def test_indice_ausente_em_banco_antigo_e_criado_pela_migracao(app):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_movimentacoes_fila_ativas'))
+        db.session.execute(db.delete(VersaoEsquema).where(VersaoEsquema.versao == 3))
+        db.session.commit()
+        assert [r.varreduras for r in migracoes.verificar_indices() if r.consulta == 'fila_de_atendimento'] == [['movimentacoes']]
+
+        assert [m.versao for m in migracoes.migrar(ate=2)] == []
+        assert [m.versao for m in migracoes.migrar()] == [3]
+        assert db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ix_movimentacoes_fila_ativas'"
+        )).first() is not None
+
+
+def test_consultas_quentes_usam_indices(app):
+    with app.app_context():
+        resultados = migracoes.verificar_indices()
+        assert [r.consulta for r in resultados] == list(migracoes.consultas_quentes())
+    assert [(r.consulta, r.varreduras) for r in resultados if r.varreduras] == []
+
+
+def test_versao_repetida_e_recusada():
+    with pytest.raises(ValueError):
+        migracoes.migracao(1, 'Duplicada')(lambda: None)
@@ -0,0 +1,125 @@
+"""
+Catálogo de módulos (services/modulos.py): visão por perfil, status de saúde e rotas
+"""
+import os
+import re
+
+import pytest
+from flask import Flask
+
+import app as aplicacao
+from database.models import db
+from services.modulos import RegistroModulos, ATIVO, MANUTENCAO, FORA_DO_AR, TODOS, classe_prioridade
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def criar_registro(verificacoes=None, manutencao=''):
+    flask_app = Flask('teste_modulos', root_path=RAIZ, template_folder='templates')
+    flask_app.config.update(MODULOS_SAUDE_INTERVALO_SEGUNDOS=0, MODULOS_MANUTENCAO=manutencao)
+    return RegistroModulos(flask_app, aplicacao.MODULOS, verificacoes)
+
+
+@pytest.fixture
+def recepcionista(app):
+    """Cliente autenticado como um usuário do perfil recepcionista"""
+    with app.app_context():
+        usuario = aplicacao.Usuario(username='recepcao', password=aplicacao.servico_senhas.gerar_hash('Senha@123'),
+                                    nome='Recepção', email='recepcao@sistema.com', tipo='recepcionista')
+        db.session.add(usuario)
+        db.session.commit()
+        usuario_id = usuario.id
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['_user_id'] = str(usuario_id)
+        sessao['_fresh'] = True
+    return cliente
+
+
+@pytest.fixture
+def saude(app, monkeypatch):
+    """Troca as verificações do registro da aplicação; o status volta ao normal no fim"""
+    registro = aplicacao.registro_modulos
+
+    def verificar(**verificacoes):
+        monkeypatch.setattr(registro, 'verificacoes', verificacoes)
+        with app.app_context():
+            registro.verificar()
+    yield verificar
+    monkeypatch.undo()
+    with app.app_context():
+        registro.verificar()
+
+
+def test_catalogo_resolvido_na_inicializacao():
+    registro = criar_registro(manutencao='it')
+    assert classe_prioridade('reception') == 'priority-high'
+    assert classe_prioridade('lab') == 'priority-medium'
+    assert classe_prioridade('billing') == 'priority-low'
+
+    recepcao = registro.obter('reception')
+    assert recepcao.priority_class == 'priority-high'
+    assert recepcao.permissoes == frozenset(['admin', 'recepcionista'])
+    assert recepcao.pagina and not registro.obter('lab').pagina
+    assert registro.obter('it').status_class == MANUTENCAO
+    assert registro.obter('inexistente') is None
+
+    assert [m.id for m in registro.visiveis('recepcionista')] == ['reception']
+    assert len(registro.visiveis('admin')) == len(aplicacao.MODULOS)
+    assert registro.visiveis('visitante') == ()
+    with pytest.raises(TypeError):
+        registro._estado.por_id['reception'] = None  # Estado é somente leitura
+
+
+def test_verificar_troca_o_estado_so_quando_o_status_muda():
+    falhas = {}
+    registro = criar_registro({TODOS: lambda: falhas.get(TODOS), 'reception': lambda: falhas.get('reception')})
+    registro.verificar()
+    assert registro.versao == 0
+
+    falhas['reception'] = MANUTENCAO
+    anterior = registro._estado
+    registro.verificar()
+    assert registro.versao == 1
+    assert registro.obter('reception').status_class == MANUTENCAO
+    assert registro.obter('doctor').status_class == ATIVO
+    assert anterior.por_id['reception'].status_class == ATIVO  # Estado antigo intacto para quem ainda o lê
+    registro.verificar()
+    assert registro.versao == 1
+
+
+def test_verificacao_com_excecao_deixa_fora_do_ar():
+    def banco():
+        raise RuntimeError('sem conexão')
+    registro = criar_registro({TODOS: banco}, manutencao='it')
+    registro.verificar()
+    assert {m.status_class for m in registro.visiveis('admin')} == {FORA_DO_AR}
+
+
+def test_pagina_de_modulos_por_perfil(cliente, recepcionista):
+    admin = cliente.get('/modulos').get_data(as_text=True)
+    assert 'data-module="reception"' in admin and 'data-module="billing"' in admin
+
+    recepcao = recepcionista.get('/modulos').get_data(as_text=True)
+    assert 'data-module="reception"' in recepcao
+    assert 'data-module="billing"' not in recepcao
+
+
+def test_acesso_a_um_modulo(cliente, recepcionista):
+    assert cliente.get('/modulo/reception').status_code == 200
+    for cliente_teste, modulo_id in ((cliente, 'inexistente'), (cliente, 'lab'), (recepcionista, 'doctor')):
+        resposta = cliente_teste.get(f'/modulo/{modulo_id}')
+        assert resposta.status_code == 302
+        assert resposta.headers['Location'].endswith('/modulos')
+
+
+def status_do_cartao(html, modulo_id):
+    return re.search(rf'module-card \S+ (\S+)"\s+data-module="{modulo_id}"', html).group(1)
+
+
+def test_status_de_saude_aparece_nos_cartoes(cliente, saude):
+    assert status_do_cartao(cliente.get('/modulos').get_data(as_text=True), 'reception') == ATIVO
+    saude(**{'reception': lambda: MANUTENCAO})
+    html = cliente.get('/modulos').get_data(as_text=True)  # Versão nova: o fragmento dos cartões é refeito
+    assert status_do_cartao(html, 'reception') == MANUTENCAO
+    assert status_do_cartao(html, 'doctor') == ATIVO
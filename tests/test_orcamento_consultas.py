@@ -0,0 +1,96 @@
+"""
+Orçamentos de consultas (@orcamento_consultas) das rotas de pacientes e
+movimentações, com CONSULTAS_ORCAMENTO_ESTRITO ligado (TestingConfig)
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+import app as aplicacao
+from database.models import db, Paciente
+from database.perfil_consultas import orcamento_consultas, OrcamentoConsultasExcedido
+
+
+@pytest.fixture
+def paciente_com_movimentacao(criar_paciente, criar_movimentacao):
+    paciente_id = criar_paciente(cpf='52998224725')
+    return paciente_id, criar_movimentacao(paciente_id)
+
+
+def sem_excesso(resposta, rota, status=200):
+    assert resposta.status_code == status, resposta.get_data(as_text=True)
+    assert aplicacao.perfil_consultas.excessos[rota] == 0
+
+
+def test_rotas_de_leitura_dentro_do_orcamento(cliente, paciente_com_movimentacao):
+    paciente_id, _ = paciente_com_movimentacao
+    sem_excesso(cliente.get('/api/pacientes?search=maria'), 'buscar_pacientes')
+    sem_excesso(cliente.get(f'/api/paciente/{paciente_id}'), 'obter_paciente')
+    sem_excesso(cliente.get(f'/api/paciente/{paciente_id}/detalhes'), 'detalhes_paciente')
+    sem_excesso(cliente.get(f'/api/movimentacoes/paciente/{paciente_id}'), 'listar_movimentacoes_paciente')
+    sem_excesso(cliente.get(f'/api/imprimir-etiqueta/{paciente_id}'), 'imprimir_etiqueta')
+    sem_excesso(cliente.get('/api/fila'), 'consultar_fila')
+    sem_excesso(cliente.get(f'/api/debug/movimentacoes/paciente/{paciente_id}'), 'debug_movimentacoes_paciente')
+
+
+def test_criar_movimentacao_dentro_do_orcamento(cliente, paciente_com_movimentacao):
+    paciente_id, _ = paciente_com_movimentacao
+    resposta = cliente.post('/api/movimentacoes', json={
+        'paciente_id': paciente_id, 'tipo': 'consulta', 'status': 'aguardando_acolhimento'
+    })
+    sem_excesso(resposta, 'criar_movimentacao', 201)
+    assert resposta.get_json()['paciente_id'] == paciente_id
+
+
+def test_atualizar_movimentacao_dentro_do_orcamento(cliente, paciente_com_movimentacao):
+    _, movimentacao_id = paciente_com_movimentacao
+    resposta = cliente.put(f'/api/movimentacoes/{movimentacao_id}', json={'status': 'em_atendimento'})
+    sem_excesso(resposta, 'atualizar_movimentacao')
+    assert resposta.get_json()['status'] == 'em_atendimento'
+
+
+def test_atualizar_paciente_dentro_do_orcamento(cliente, paciente_com_movimentacao):
+    paciente_id, _ = paciente_com_movimentacao
+    resposta = cliente.put(f'/api/paciente/{paciente_id}', json={'nome': 'Maria Souza', 'sexo': 'F'})
+    sem_excesso(resposta, 'atualizar_paciente')
+    assert resposta.get_json()['nome'] == 'Maria Souza'
+
+
+def test_excluir_movimentacao_dentro_do_orcamento(cliente, paciente_com_movimentacao):
+    _, movimentacao_id = paciente_com_movimentacao
+    sem_excesso(cliente.delete(f'/api/movimentacoes/{movimentacao_id}'), 'excluir_movimentacao')
+
+
+def _gravar_paciente(prontuario):
+    db.session.add(Paciente(prontuario=prontuario, nome='Teste', data_nascimento=date(1990, 1, 1), sexo='M', raca='branca'))
+
+
+def test_excesso_antes_do_commit_desfaz_a_escrita(app):
+    @orcamento_consultas(1)
+    def gravar():
+        db.session.execute(text('SELECT 1'))
+        _gravar_paciente('X1')
+        db.session.commit()
+
+    with app.test_request_context():
+        app.preprocess_request()
+        with pytest.raises(OrcamentoConsultasExcedido):
+            gravar()
+        db.session.rollback()
+        assert db.session.execute(db.select(Paciente).filter_by(prontuario='X1')).first() is None
+
+
+def test_excesso_depois_do_commit_so_e_contado(app):
+    @orcamento_consultas(1)
+    def gravar():
+        _gravar_paciente('X2')
+        db.session.commit()
+        db.session.execute(text('SELECT 1'))
+        return 'ok'
+
+    with app.test_request_context():
+        app.preprocess_request()
+        assert gravar() == 'ok'
+        assert db.session.execute(db.select(Paciente).filter_by(prontuario='X2')).first() is not None
+    assert aplicacao.perfil_consultas.excessos['gravar'] == 1
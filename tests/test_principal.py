@@ -0,0 +1,92 @@
+"""
+Principal de sessão em cache: usuário carregado sem consulta por requisição
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import app as aplicacao
+from database.models import db
+from services import principal as modulo_principal
+
+
+@pytest.fixture
+def consultas_usuario(app):
+    """SELECTs na tabela de usuários executados durante o teste"""
+    comandos = []
+
+    def registrar(conn, cursor, comando, parametros, contexto, executemany):
+        if comando.lstrip().upper().startswith('SELECT') and 'FROM usuario' in comando:
+            comandos.append(comando)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', registrar)
+    yield comandos
+    event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def test_usuario_carregado_uma_vez_entre_requisicoes(cliente, consultas_usuario):
+    for _ in range(3):
+        assert cliente.get('/api/fila').status_code == 200
+    assert len(consultas_usuario) == 1
+    assert 'usuario.password' not in consultas_usuario[0]  # Só as colunas do retrato
+
+
+def test_alteracao_do_usuario_invalida_o_retrato(app, admin_id):
+    cache = aplicacao.cache_principal
+    with app.app_context():
+        assert cache.obter(admin_id).nome == 'Administrador'
+        usuario = db.session.get(aplicacao.Usuario, admin_id)
+        usuario.nome = 'Admin Renomeado'
+        usuario.ultima_alteracao_senha = datetime(2024, 1, 1)
+        db.session.commit()
+
+        principal = cache.obter(admin_id)
+        assert principal.nome == 'Admin Renomeado'
+        assert principal.senha_expira_em == datetime(2024, 1, 1) + timedelta(days=app.config['SENHA_VALIDADE_DIAS'])
+        assert principal.carregar() is usuario
+        assert cache.obter(admin_id + 100) is None
+
+
+def test_retrato_lido_antes_do_commit_e_descartado(app, admin_id):
+    cache = aplicacao.cache_principal
+    with app.app_context():
+        antigo = cache.obter(admin_id)
+        usuario = db.session.get(aplicacao.Usuario, admin_id)
+        usuario.nome = 'Admin Renomeado'
+        db.session.flush()
+        # Outra requisição leu a linha ainda sem o commit e guardou o retrato antigo
+        cache._itens[admin_id] = (antigo, float('inf'))
+        db.session.commit()
+        assert cache.obter(admin_id).nome == 'Admin Renomeado'
+
+        usuario.nome = 'Desfeito'
+        db.session.flush()
+        assert cache.obter(admin_id).nome == 'Desfeito'  # A própria sessão vê o flush
+        db.session.rollback()
+        assert cache.obter(admin_id).nome == 'Admin Renomeado'
+
+
+def test_retrato_expira_pelo_ttl(app, admin_id, consultas_usuario, monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(modulo_principal.time, 'monotonic', lambda: agora[0])
+    cache = aplicacao.cache_principal
+    with app.app_context():
+        primeiro = cache.obter(admin_id)
+        agora[0] += cache.ttl - 1
+        assert cache.obter(admin_id) is primeiro
+        agora[0] += 2
+        assert cache.obter(admin_id) == primeiro
+    assert len(consultas_usuario) == 2
+
+
+def test_senha_expirada_no_retrato_bloqueia_as_rotas(cliente, app, admin_id):
+    with app.app_context():
+        usuario = db.session.get(aplicacao.Usuario, admin_id)
+        usuario.ultima_alteracao_senha = datetime.utcnow() - timedelta(days=app.config['SENHA_VALIDADE_DIAS'] + 1)
+        db.session.commit()
+    resposta = cliente.get('/api/fila').get_json()
+    assert resposta['status'] == 'warning'
+    assert 'expirou' in resposta['message']
@@ -0,0 +1,145 @@
+"""
+Reservas de prontuário (AlocadorProntuario): uso único, prazo e usuário; troca
+do tamanho de bloco da sequência do PostgreSQL
+"""
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+from itsdangerous import TimestampSigner
+
+import app as aplicacao
+from database import prontuario
+from database.models import db
+
+
+def reservar(cliente):
+    resposta = cliente.get('/api/proximo-prontuario')
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def cadastrar(cliente, reserva=None, nome='João Pereira'):
+    return cliente.post('/api/pacientes', json={
+        'nome': nome, 'data_nascimento': '1975-03-02', 'sexo': 'M', 'reserva_prontuario': reserva
+    })
+
+
+def test_cadastro_usa_o_numero_reservado(cliente):
+    reserva = reservar(cliente)
+    resposta = cadastrar(cliente, reserva['reserva'])
+    assert resposta.status_code == 201
+    assert resposta.get_json()['prontuario'] == reserva['numero']
+
+
+def test_reserva_reutilizada_recebe_numero_novo(cliente):
+    reserva = reservar(cliente)
+    primeiro = cadastrar(cliente, reserva['reserva'])
+    segundo = cadastrar(cliente, reserva['reserva'], nome='Ana Pereira')
+    assert primeiro.status_code == 201
+    assert segundo.status_code == 201
+    assert primeiro.get_json()['prontuario'] == reserva['numero']
+    assert segundo.get_json()['prontuario'] != reserva['numero']
+
+
+def test_reserva_usada_em_cadastro_simultaneo_recebe_numero_novo(cliente, monkeypatch):
+    # Os dois cadastros passaram pela verificação antes de qualquer commit
+    reserva = reservar(cliente)
+    assert cadastrar(cliente, reserva['reserva']).status_code == 201
+    monkeypatch.setattr(aplicacao.alocador_prontuario, 'confirmar_reserva', lambda token, usuario_id: reserva['numero'])
+    resposta = cadastrar(cliente, reserva['reserva'], nome='Ana Pereira')
+    assert resposta.status_code == 201
+    assert resposta.get_json()['prontuario'] != reserva['numero']
+
+
+def test_reserva_expirada_ou_de_outro_usuario_e_recusada(app, admin_id, monkeypatch):
+    alocador = aplicacao.alocador_prontuario
+    with app.test_request_context():
+        _, token, _ = alocador.reservar(admin_id)
+        assert alocador.confirmar_reserva(token, admin_id + 1) is None
+
+        prazo = app.config['PRONTUARIO_RESERVA_SEGUNDOS']
+        monkeypatch.setattr(TimestampSigner, 'get_timestamp', lambda self: int(time.time()) - prazo - 1)
+        _, expirado, _ = alocador.reservar(admin_id)
+        monkeypatch.undo()
+        assert alocador.confirmar_reserva(expirado, admin_id) is None
+        assert alocador.confirmar_reserva(token + 'x', admin_id) is None
+        assert alocador.confirmar_reserva(token, admin_id) is not None
+
+
+class SequenciaPostgres:
+    """Simula prontuario_seq (last_value, is_called, increment_by) para os comandos do alocador"""
+
+    def __init__(self):
+        self.existe = False
+        self.ultimo, self.chamada, self.incremento = 1, False, 1
+
+    @property
+    def dialect(self):
+        return SimpleNamespace(name='postgresql')
+
+    def begin(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def execute(self, comando, parametros=None):
+        sql = str(comando)
+        if sql.startswith('CREATE SEQUENCE') and not self.existe:
+            inicio, incremento = map(int, re.search(r'START WITH (\d+) INCREMENT BY (\d+)', sql).groups())
+            self.existe, self.ultimo, self.chamada, self.incremento = True, inicio, False, incremento
+        elif sql.startswith('ALTER SEQUENCE'):
+            self.incremento = int(re.search(r'INCREMENT BY (\d+)', sql).group(1))
+        elif 'pg_sequences' in sql:
+            return SimpleNamespace(scalar=lambda: self.incremento)
+        elif 'last_value' in sql:
+            return SimpleNamespace(one=lambda: (self.ultimo, self.chamada))
+        elif 'setval' in sql:
+            self.ultimo, self.chamada = parametros['proximo'], False
+        elif 'nextval' in sql:
+            if self.chamada:
+                self.ultimo += self.incremento
+            self.chamada = True
+            return SimpleNamespace(scalar=lambda: self.ultimo)
+
+
+@pytest.fixture
+def sequencia_postgres(monkeypatch):
+    sequencia = SequenciaPostgres()
+    monkeypatch.setattr(prontuario, 'db', SimpleNamespace(
+        engine=sequencia, text=db.text, session=db.session, func=db.func
+    ))
+    return sequencia
+
+
+def test_bloco_menor_nao_reentrega_numeros_do_bloco_anterior(app, sequencia_postgres, monkeypatch):
+    alocador = aplicacao.alocador_prontuario
+    with app.app_context():
+        monkeypatch.setitem(app.config, 'PRONTUARIO_BLOCO', 50)
+        alocador.instalar()
+        assert alocador._buscar_bloco() == (1, 50)
+        assert alocador._buscar_bloco() == (51, 100)  # Ainda em uso por um worker antigo
+
+        monkeypatch.setitem(app.config, 'PRONTUARIO_BLOCO', 20)
+        alocador.instalar()  # Novo deploy
+        assert alocador._buscar_bloco() == (101, 120)
+
+        monkeypatch.setitem(app.config, 'PRONTUARIO_BLOCO', 40)
+        alocador.instalar()
+        alocador.instalar()  # Mesmo tamanho: nada muda
+        assert alocador._buscar_bloco() == (121, 160)
+
+
+def test_troca_de_bloco_antes_do_primeiro_uso(app, sequencia_postgres, monkeypatch):
+    alocador = aplicacao.alocador_prontuario
+    with app.app_context():
+        monkeypatch.setitem(app.config, 'PRONTUARIO_BLOCO', 50)
+        alocador.instalar()
+        monkeypatch.setitem(app.config, 'PRONTUARIO_BLOCO', 10)
+        alocador.instalar()
+        assert alocador._buscar_bloco() == (1, 10)
@@ -0,0 +1,93 @@
+"""
+Logs estruturados (RegistroEstruturado): id da requisição, log de acesso,
+formatação JSON, amostragem de DEBUG e fila não bloqueante
+"""
+import json
+import logging
+import re
+import sys
+import time
+
+from flask import g
+import pytest
+
+from services.registro import ArquivoRotativo, FiltroContexto, FormatadorJson, ManipuladorFila, interpretar_niveis
+
+
+def test_log_de_acesso_nao_consome_resposta_em_fluxo(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, 'EVENTOS_SSE_DURACAO_SEGUNDOS', 3)
+    monkeypatch.setitem(app.config, 'EVENTOS_SSE_KEEPALIVE_SEGUNDOS', 1)
+    inicio = time.monotonic()
+    resposta = cliente.get('/api/movimentacoes/eventos', buffered=False)
+    try:
+        assert time.monotonic() - inicio < 1
+        assert resposta.is_streamed
+        assert next(resposta.response) == b'retry: 3000\n\n'
+        assert 'X-Request-ID' in resposta.headers
+    finally:
+        resposta.close()
+
+
+def test_testes_registram_so_no_console(app):
+    destinos = app.extensions['registro_estruturado'].manipulador.destinos
+    assert app.config['LOG_ARQUIVO'] == ''
+    assert not any(isinstance(destino, ArquivoRotativo) for destino in destinos)
+
+
+def test_request_id_recebido_e_repassado_ou_gerado(cliente):
+    assert cliente.get('/api/fila', headers={'X-Request-ID': 'lb-123.abc'}).headers['X-Request-ID'] == 'lb-123.abc'
+    gerado = cliente.get('/api/fila', headers={'X-Request-ID': 'inválido com espaço'}).headers['X-Request-ID']
+    assert re.fullmatch(r'[0-9a-f]{32}', gerado)
+
+
+def test_linha_de_acesso_com_status_duracao_e_tamanho(cliente, caplog):
+    with caplog.at_level(logging.INFO, logger='acesso'):
+        resposta = cliente.get('/api/fila')
+    registro = next(r for r in caplog.records if r.name == 'acesso')
+    assert registro.getMessage() == 'GET /api/fila 200'
+    assert registro.status == 200
+    assert registro.tamanho == len(resposta.get_data())
+    assert registro.duracao_ms >= 0
+
+
+def test_formatador_json_inclui_extras_e_excecao():
+    try:
+        raise RuntimeError('falhou')
+    except RuntimeError:
+        registro = logging.LogRecord('teste', logging.ERROR, __file__, 10, 'Erro %s', ('x',), sys.exc_info())
+    registro.paciente_id = 7
+    dados = json.loads(FormatadorJson().format(registro))
+    assert dados['mensagem'] == 'Erro x'
+    assert dados['nivel'] == 'ERROR'
+    assert dados['paciente_id'] == 7
+    assert 'RuntimeError: falhou' in dados['excecao']
+
+
+def test_debug_amostrado_por_requisicao(app):
+    filtro = FiltroContexto(taxa_debug=0)
+    registro = lambda nivel: logging.LogRecord('teste', nivel, __file__, 1, 'm', (), None)
+    with app.test_request_context('/x'):
+        g.log_contexto = {'request_id': 'abc', 'metodo': 'GET', 'caminho': '/x', 'usuario_id': None, 'amostrado': False}
+        assert not filtro.filter(registro(logging.DEBUG))
+        info = registro(logging.INFO)
+        assert filtro.filter(info)
+        assert info.request_id == 'abc'
+
+        g.log_contexto['amostrado'] = True
+        assert filtro.filter(registro(logging.DEBUG))
+    assert not filtro.filter(registro(logging.DEBUG))  # Fora de requisição: taxa 0
+
+
+def test_fila_cheia_descarta_sem_bloquear():
+    manipulador = ManipuladorFila([], tamanho_fila=1)
+    for _ in range(3):
+        manipulador.enqueue(logging.LogRecord('teste', logging.INFO, __file__, 1, 'm', (), None))
+    assert manipulador.descartados == 2
+
+
+def test_interpretar_niveis():
+    assert interpretar_niveis('sqlalchemy.engine=warning, services.fila=DEBUG') == {
+        'sqlalchemy.engine': 'WARNING', 'services.fila': 'DEBUG'
+    }
+    with pytest.raises(ValueError):
+        interpretar_niveis('app=BARULHENTO')
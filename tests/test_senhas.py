@@ -0,0 +1,114 @@
+"""
+Hash e verificação de senhas fora da thread da requisição (services/senhas.py)
+"""
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+import pytest
+from flask import Flask
+
+import app as aplicacao
+from database.models import db
+from services.senhas import ServicoSenhas, ServicoSenhasOcupado, custo_do_hash
+
+
+def criar_servico(**config):
+    flask_app = Flask(__name__)
+    flask_app.config.update(BCRYPT_LOG_ROUNDS=4, SENHAS_PROCESSOS=0, SENHAS_PRIORIDADE=0,
+                            SENHAS_ESPERA_SEGUNDOS=0, SENHAS_CONCORRENCIA=2)
+    flask_app.config.update(config)
+    return ServicoSenhas(flask_app)
+
+
+def hash_com_custo(senha, custo):
+    return bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds=custo)).decode('utf-8')
+
+
+def test_custo_do_hash():
+    assert custo_do_hash(hash_com_custo('x', 5)) == 5
+    assert custo_do_hash('sem formato') is None
+    assert custo_do_hash(None) is None
+
+
+def test_verificar_sem_e_com_rehash():
+    servico = criar_servico()
+    atual = servico.gerar_hash('Senha@123')
+    assert custo_do_hash(atual) == 4
+    assert servico.verificar(atual, 'Senha@123') == (True, None)
+    assert servico.verificar(atual, 'errada') == (False, None)
+
+    valida, novo_hash = servico.verificar(hash_com_custo('Senha@123', 5), 'Senha@123')
+    assert valida and custo_do_hash(novo_hash) == 4
+    assert bcrypt.checkpw(b'Senha@123', novo_hash.encode('utf-8'))
+    # Senha errada com custo antigo: nada a regravar
+    assert servico.verificar(hash_com_custo('Senha@123', 5), 'errada') == (False, None)
+
+
+def test_hash_invalido_ou_ausente_nao_confere():
+    servico = criar_servico()
+    assert servico.verificar('não é bcrypt', 'Senha@123') == (False, None)
+    assert servico.verificar(None, 'Senha@123') == (False, None)
+    assert servico.verificar(servico.gerar_hash('Senha@123'), None) == (False, None)
+
+
+def test_sem_vaga_recusa_em_vez_de_enfileirar():
+    servico = criar_servico(SENHAS_CONCORRENCIA=1)
+    servico._vagas.acquire()  # Outra verificação em andamento
+    with pytest.raises(ServicoSenhasOcupado):
+        servico.gerar_hash('Senha@123')
+    servico._vagas.release()
+    assert servico.gerar_hash('Senha@123')  # Vaga liberada: volta a atender
+
+
+def test_pool_interrompido_resolve_na_thread_e_recria(monkeypatch):
+    servico = criar_servico()
+
+    class ExecutorQuebrado:
+        desligado = False
+
+        def submit(self, *args):
+            raise BrokenProcessPool()
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            self.desligado = True
+
+    quebrado = ExecutorQuebrado()
+    servico._executor = quebrado
+    monkeypatch.setattr(servico, '_obter_executor', lambda: servico._executor)
+    assert custo_do_hash(servico.gerar_hash('Senha@123')) == 4
+    assert quebrado.desligado and servico._executor is None
+
+
+def test_pool_de_processos():
+    servico = criar_servico(SENHAS_PROCESSOS=1)
+    try:
+        hash_senha = servico.gerar_hash('Senha@123')
+        assert servico.verificar(hash_senha, 'Senha@123') == (True, None)
+        assert servico._obter_executor() is servico._executor  # Reaproveitado no mesmo processo
+    finally:
+        servico.encerrar()
+    assert servico._executor is None
+
+
+def test_login_regrava_hash_de_custo_antigo(app):
+    with app.app_context():
+        admin = aplicacao.Usuario.query.filter_by(username='admin').one()
+        admin.password = hash_com_custo('admin123', 5)
+        db.session.commit()
+
+    resposta = app.test_client().post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert resposta.get_json()['status'] == 'success'
+    with app.app_context():
+        gravado = aplicacao.Usuario.query.filter_by(username='admin').one().password
+    assert custo_do_hash(gravado) == app.config['BCRYPT_LOG_ROUNDS']
+    assert bcrypt.checkpw(b'admin123', gravado.encode('utf-8'))
+
+
+def test_login_sem_vaga_responde_503(app, monkeypatch):
+    monkeypatch.setattr(aplicacao.servico_senhas, '_vagas', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(aplicacao.servico_senhas, 'espera', 0)
+    aplicacao.servico_senhas._vagas.acquire()
+    resposta = app.test_client().post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert resposta.status_code == 503
+    assert resposta.headers['Retry-After'] == '2'
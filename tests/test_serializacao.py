@@ -0,0 +1,115 @@
+"""
+Serialização por projeção de colunas (services/serializacao.py)
+"""
+from datetime import datetime
+import json
+
+import pytest
+from sqlalchemy import event
+
+from database.models import db, Paciente, Movimentacao
+from services import serializacao
+from services.serializacao import PACIENTE, MOVIMENTACAO
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def codificador(request, monkeypatch):
+    """Os testes rodam com o orjson (se instalado) e com o json da biblioteca padrão"""
+    if request.param == 'json':
+        monkeypatch.setattr(serializacao, 'orjson', None)
+    elif serializacao.orjson is None:
+        pytest.skip('orjson não instalado')
+    return request.param
+
+
+def projetar(esquema, modelo, id_):
+    campos = esquema.padrao
+    linha = db.session.execute(db.select(*esquema.colunas(campos)).where(modelo.id == id_)).one()
+    return esquema.de_linhas([linha], campos)[0]
+
+
+def test_projecao_igual_ao_to_dict(app, criar_paciente, criar_movimentacao, codificador):
+    paciente_id = criar_paciente('José Conceição', cpf='52998224725', email='jose@exemplo.com')
+    movimentacao_id = criar_movimentacao(paciente_id, prioridade='idoso_80', data_saida=datetime(2024, 5, 1, 10, 30, 15, 123456))
+    with app.app_context():
+        for esquema, modelo, id_ in ((PACIENTE, Paciente, paciente_id), (MOVIMENTACAO, Movimentacao, movimentacao_id)):
+            esperado = db.session.get(modelo, id_).to_dict()
+            assert json.loads(serializacao.codificar(projetar(esquema, modelo, id_))) == esperado
+            assert esquema.de_objeto(db.session.get(modelo, id_)) == projetar(esquema, modelo, id_)
+
+
+def test_codificar_datas_e_acentos(codificador):
+    corpo = serializacao.codificar({'nome': 'Conceição', 'quando': datetime(2024, 1, 2, 3, 4, 5), 'dia': datetime(2024, 1, 2).date()})
+    assert json.loads(corpo) == {'nome': 'Conceição', 'quando': '2024-01-02T03:04:05', 'dia': '2024-01-02'}
+    assert 'Conceição'.encode('utf-8') in corpo
+
+
+def test_conversor_e_deslocamento():
+    esquema = serializacao.Esquema([('id', Paciente.id), ('nome', Paciente.nome, str.upper)])
+    linhas = [('extra', 1, 'ana', 'ignorada')]
+    assert esquema.de_linhas(linhas, esquema.padrao, deslocamento=1) == [{'id': 1, 'nome': 'ANA'}]
+
+
+def test_comparar_mede_os_dois_caminhos(app, criar_paciente):
+    criar_paciente()
+    with app.app_context():
+        resultado = serializacao.comparar(Paciente, PACIENTE, repeticoes=1)
+    assert resultado['linhas'] == 1
+    assert set(resultado) >= {'orm_to_dict_jsonify', 'projecao_codificar', 'codificador'}
+
+
+# ================================
+# CAMPOS E PROJEÇÕES NAS ROTAS
+# ================================
+
+@pytest.fixture
+def comandos(app):
+    """SQL executado durante o teste"""
+    executados = []
+
+    def registrar(conn, cursor, comando, parametros, contexto, executemany):
+        executados.append(comando)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', registrar)
+    yield executados
+    event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def test_busca_com_projecao_resumo_seleciona_so_as_colunas_da_lista(cliente, criar_paciente, comandos):
+    criar_paciente(email='maria@exemplo.com')
+    resposta = cliente.get('/api/pacientes?search=maria&projecao=resumo')
+    assert list(resposta.get_json()[0]) == [campo.nome for campo in PACIENTE.projecoes['resumo']]
+    consulta = next(c for c in comandos if 'pacientes.prontuario AS prontuario' in c)
+    assert 'email' not in consulta and 'nome_mae' not in consulta
+
+
+def test_fields_tem_precedencia_e_mantem_a_ordem_pedida(cliente, criar_paciente):
+    criar_paciente()
+    resposta = cliente.get('/api/pacientes?fields=nome,id,nome&projecao=resumo')
+    assert list(resposta.get_json()[0]) == ['nome', 'id']
+
+
+@pytest.mark.parametrize('url', [
+    '/api/pacientes?fields=id,senha',
+    '/api/pacientes?projecao=minima',
+    '/api/paciente/{id}?fields=id,senha',
+])
+def test_campos_ou_projecao_inexistentes_retornam_400(cliente, criar_paciente, url):
+    paciente_id = criar_paciente()
+    resposta = cliente.get(url.format(id=paciente_id))
+    assert resposta.status_code == 400
+    assert 'inválid' in resposta.get_json()['error']
+
+
+def test_paciente_sem_campos_de_endereco_nao_faz_join(cliente, criar_paciente, comandos):
+    paciente_id = criar_paciente()
+    resposta = cliente.get(f'/api/paciente/{paciente_id}?fields=id,nome,data_nascimento')
+    assert resposta.get_json() == {'id': paciente_id, 'nome': 'Maria da Silva', 'data_nascimento': '1980-05-17'}
+    consulta = next(c for c in comandos if 'pacientes.nome AS nome' in c)
+    assert 'enderecos' not in consulta
+
+    completo = cliente.get(f'/api/paciente/{paciente_id}').get_json()
+    assert 'cep' not in completo  # Sem endereço principal: campos de endereço omitidos
+    assert completo['data_cadastro']
@@ -0,0 +1,94 @@
+"""
+Unidade de trabalho (database/transacao.py): um commit por requisição no login
+"""
+import pytest
+from sqlalchemy import event
+
+import app as aplicacao
+from database.models import db, Paciente
+from database.transacao import confirmar, unidade_de_trabalho, manter_carregados
+
+
+@pytest.fixture
+def comandos(app):
+    """COMMITs e UPDATEs enviados ao banco durante o teste"""
+    registro = {'commit': 0, 'update': 0}
+
+    def ao_commit(conexao):
+        registro['commit'] += 1
+
+    def ao_executar(conexao, cursor, sql, parametros, contexto, varios):
+        if sql.lstrip().upper().startswith('UPDATE'):
+            registro['update'] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'commit', ao_commit)
+    event.listen(engine, 'before_cursor_execute', ao_executar)
+    yield registro
+    event.remove(engine, 'commit', ao_commit)
+    event.remove(engine, 'before_cursor_execute', ao_executar)
+
+
+def test_login_bem_sucedido_em_um_commit(app, comandos):
+    resposta = app.test_client().post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert resposta.get_json()['status'] == 'success'
+    assert comandos['commit'] == 1
+    assert comandos['update'] == 1  # Tentativas, último acesso e IP num UPDATE só
+    with app.app_context():
+        admin = aplicacao.Usuario.query.filter_by(username='admin').one()
+        assert admin.ultimo_login is not None
+        assert admin.ultimo_ip == '127.0.0.1'
+
+
+def test_confirmar_fora_da_unidade_faz_commit(app, criar_paciente):
+    paciente_id = criar_paciente()
+    with app.test_request_context():
+        db.session.get(Paciente, paciente_id).nome = 'Fora da unidade'
+        confirmar()
+        db.session.rollback()
+        assert db.session.get(Paciente, paciente_id).nome == 'Fora da unidade'
+
+
+def test_unidade_adia_commit_e_desfaz_em_caso_de_erro(app, criar_paciente, comandos):
+    paciente_id = criar_paciente()
+
+    @unidade_de_trabalho
+    def renomear(nome, falhar=False):
+        db.session.get(Paciente, paciente_id).nome = nome
+        confirmar()
+        confirmar()
+        renomear_interno()  # Unidade aninhada não abre outra transação
+        if falhar:
+            raise RuntimeError('falhou')
+        return nome
+
+    @unidade_de_trabalho
+    def renomear_interno():
+        confirmar()
+
+    with app.test_request_context():
+        antes = comandos['commit']
+        assert renomear('Confirmado') == 'Confirmado'
+        assert comandos['commit'] == antes + 1
+    with app.test_request_context():
+        with pytest.raises(RuntimeError):
+            renomear('Desfeito', falhar=True)
+    with app.app_context():
+        assert db.session.get(Paciente, paciente_id).nome == 'Confirmado'
+
+
+def test_manter_carregados_nao_expira_no_commit(app, criar_paciente):
+    paciente_id = criar_paciente()
+
+    @manter_carregados
+    def gravar():
+        paciente = db.session.get(Paciente, paciente_id)
+        paciente.nome = 'Carregado'
+        db.session.commit()
+        return paciente
+
+    with app.test_request_context():
+        paciente = gravar()
+        assert 'nome' in paciente.__dict__  # Atributos continuam em memória após o commit
+        assert db.session().expire_on_commit  # Configuração da sessão restaurada